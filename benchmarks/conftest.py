@@ -0,0 +1,91 @@
+# -*- coding: UTF-8 -*-
+"""Benchmark fixtures"""
+import pickle
+from datetime import datetime
+from os.path import exists, join
+
+import pytest
+
+from hdx.data.dataset import Dataset
+from hdx.hdx_configuration import Configuration
+from hdx.utilities.downloader import Download
+from hdx.utilities.useragent import UserAgent
+
+from benchmarks.synthetic import make_inputs
+from chathamhouse.chathamhousecompute import model_stage_names
+from chathamhouse.chathamhousecountries import load_countriesdata
+from chathamhouse.chathamhousestages import get_stages, parse_unhcr_populations
+
+synthetic_version = 3
+
+
+def pytest_addoption(parser):
+    parser.addoption('--scales', default='1,10,100,1000',
+                     help='Comma separated multiples of today\'s input sizes to benchmark')
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = [int(scale) for scale in metafunc.config.getoption('scales').split(',')]
+        metafunc.parametrize('scale', scales, indirect=True, ids=['%dx' % scale for scale in scales])
+
+
+@pytest.fixture(scope='session')
+def configuration(tmp_path_factory):
+    Configuration._create(hdx_read_only=True, user_agent='test')
+    UserAgent.set_global('test')
+    load_countriesdata(str(tmp_path_factory.mktemp('countries') / 'countries.pkl'))
+
+
+@pytest.fixture(scope='session')
+def downloader():
+    downloader = Download(user_agent='test')
+    downloader.session = None  # Hack for Tabulator local file issue
+    return downloader
+
+
+@pytest.fixture(scope='session')
+def scale(request):
+    return request.param
+
+
+@pytest.fixture(scope='session')
+def synthetic(request, configuration, downloader, scale):
+    # The workbook and the populations parsed from it take a while to build at the larger scales so they are kept in
+    # the pytest cache between sessions
+    folder = request.config.cache.makedir('chathamhouse_benchmarks')
+    tab15_path = join(str(folder), 'tab15_%d_v%d.xlsx' % (scale, synthetic_version))
+    path = join(str(folder), 'inputs_%d_v%d.pkl' % (scale, synthetic_version))
+    if exists(path) and exists(tab15_path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    inputs, sizes = make_inputs(scale, tab15_path)
+    inputs.update(parse_unhcr_populations(inputs['constants'], inputs['camp_overrides'], tab15_path))
+    synthetic = {'inputs': inputs, 'sizes': sizes, 'tab15_path': tab15_path}
+    with open(path, 'wb') as f:
+        pickle.dump(synthetic, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return synthetic
+
+
+@pytest.fixture(scope='session')
+def datasets(synthetic):
+    dataset = Dataset({'title': 'UNHCR Global Trends: Forced Displacement Synthetic Data',
+                       'dataset_date': '06/20/2017'})
+    dataset.add_update_resource({'url': synthetic['tab15_path']})
+    return [dataset]
+
+
+@pytest.fixture(scope='session')
+def snapshots(synthetic):
+    # The model stages update their inputs in place, so each benchmark round starts from a pickled copy of the context
+    # as it was before the stage ran
+    context = dict(synthetic['inputs'])
+    context['today'] = datetime(2017, 6, 20)
+    snapshots = dict()
+    for stage in get_stages():
+        if stage.name not in model_stage_names:
+            continue
+        snapshots[stage.name] = pickle.dumps(context, protocol=pickle.HIGHEST_PROTOCOL)
+        context.update(stage.function(**{name: context[name] for name in stage.inputs}))
+    snapshots['write'] = pickle.dumps(context, protocol=pickle.HIGHEST_PROTOCOL)
+    return snapshots
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Synthetic inputs
+----------------
+
+Builds inputs for the benchmarks at a multiple of today's size: the parsed lookup tables the input stages produce and
+a UNHCR workbook with a Tab15 sheet from the Tab15 generator. Every size grows with the scale except the number of
+countries, which stops growing once every country is used as the model only knows real ones.
+
+"""
+import random
+
+from hdx.location.country import Country
+
+from benchmarks.tab15 import make_rows, write_workbook
+
+# Roughly the size of today's inputs. Tab15 is capped by the rows an xlsx sheet can hold so 1000x is as far as it goes.
+base_sizes = {'countries': 100, 'tab15_rows': 1000, 'named_camps': 250, 'small_camp_regions': 8}
+tiers = ['Baseline', 'Target 1', 'Target 2', 'Target 3']
+lighting_types = range(1, 7)
+cooking_types = range(1, 9)
+
+
+def get_sizes(scale):
+    sizes = {name: size * scale for name, size in base_sizes.items()}
+    sizes['countries'] = min(sizes['countries'], len(Country.countriesdata()['countries']))
+    return sizes
+
+
+def get_countries(number, rnd):
+    countries = sorted(Country.countriesdata()['countries'])
+    return sorted(rnd.sample(countries, number))
+
+
+def get_country_values(countries, rnd, low, high, coverage=0.7):
+    # Some countries are left out so that the model falls back on regional averages as it does with the real data
+    return {iso3: rnd.uniform(low, high) for iso3 in countries if rnd.random() < coverage}
+
+
+def get_costs(rnd, types, low, high):
+    costs = dict()
+    for kind in ('Fuel', 'Capital', 'CO2'):
+        for baseline_target in ('Baseline', 'Target'):
+            for comtype in types:
+                costs['%s %s Type %d' % (kind, baseline_target, comtype)] = rnd.uniform(low, high)
+    return costs
+
+
+def get_descriptions(rnd, types, names):
+    return {'%s %d' % (baseline_target, comtype): rnd.choice(names) for baseline_target in ('Baseline', 'Target')
+            for comtype in types}
+
+
+def get_camp_types(rnd):
+    camptypes = dict()
+    for tier in tiers:
+        camptypes['Lighting OffGrid %s' % tier] = rnd.choice(lighting_types)
+        camptypes['Cooking Solid %s' % tier] = rnd.choice(cooking_types)
+    return camptypes
+
+
+def make_inputs(scale, tab15_path, seed=1):
+    rnd = random.Random(seed)
+    sizes = get_sizes(scale)
+    countries = get_countries(sizes['countries'], rnd)
+    names = {iso3: Country.get_country_name_from_iso3(iso3) for iso3 in countries}
+    named_camps = dict()
+    for i in range(sizes['named_camps']):
+        iso3 = countries[i % len(countries)]
+        named_camps['%s camp %d' % (names[iso3], i)] = iso3
+    write_workbook(tab15_path, make_rows(countries, sizes['tab15_rows'], named_camps, rnd=rnd))
+
+    constants = {'Household Size': 5.0, 'Population Adjustment Factor': 0.7216833622, 'Electricity Cost': 25.0,
+                 'Cooking LPG NonCamp Price': 1.8, 'Kerosene CO2 Emissions': 2.96,
+                 'Lighting Offgrid Scaling Factor': 1.0, 'Cooking Solid Scaling Factor': 1.0,
+                 'Cooking LPG Fallback': 4.5, 'Lighting Grid Tier': 2, 'Non Camp Types': 'individual,undefined',
+                 'Camp Types': 'self-settled,planned,collective,reception'}
+    camp_overrides = {'Accommodation Type': dict(), 'Country': dict(), 'Population': dict()}
+    noncamp_types = dict()
+    for pop_type in ('Urban', 'Slum', 'Rural'):
+        for tier in tiers:
+            noncamp_types['%s %s Type' % (pop_type, tier)] = (rnd.choice(lighting_types), rnd.choice(cooking_types))
+    noncamp_elec_access = {'Urban': get_country_values(countries, rnd, 0.3, 1.0),
+                           'Rural': get_country_values(countries, rnd, 0.0, 0.8)}
+    noncamp_elec_access['Slum'] = get_country_values(countries, rnd, 0.1, 0.9)
+    noncamp_nonsolid_access = {'Urban': get_country_values(countries, rnd, 0.0, 1.0),
+                               'Rural': get_country_values(countries, rnd, 0.0, 1.0)}
+    noncamp_nonsolid_access['Slum'] = noncamp_nonsolid_access['Urban']
+    fallback_countries = [iso3 for iso3 in countries if rnd.random() < 0.3]
+    small_camp_regions = ['Region %d' % i for i in range(sizes['small_camp_regions'])]
+    inputs = {
+        'constants': constants, 'camp_overrides': camp_overrides,
+        'urbanratios': get_country_values(countries, rnd, 0.1, 0.9),
+        'noncamp_elec_access': noncamp_elec_access,
+        'slumratios': get_country_values(countries, rnd, 0.0, 0.9),
+        'elecappliances': get_country_values(countries, rnd, 10.0, 300.0),
+        'cookinglpg': get_country_values(countries, rnd, 1.0, 10.0),
+        'elecgridtiers': {0: 3.0, 1: 35.0, 2: 194.0, 3: 820.0, 4: 1720.0},
+        'elecgriddirectenergy': {'%s Type %d' % (baseline_target, comtype): rnd.uniform(0.0, 40.0)
+                                 for baseline_target in ('Baseline', 'Target') for comtype in lighting_types},
+        'elecgridco2': get_country_values(countries, rnd, 0.01, 1.0),
+        'noncamplightingoffgridtypes': {key: value[0] for key, value in noncamp_types.items()},
+        'noncampcookingsolidtypes': {key: value[1] for key, value in noncamp_types.items()},
+        'lightingoffgridcost': get_costs(rnd, lighting_types, 0.1, 300.0),
+        'cookingsolidcost': get_costs(rnd, cooking_types, 1.0, 250.0),
+        'noncamp_nonsolid_access': noncamp_nonsolid_access,
+        'lighting_type_descriptions': get_descriptions(rnd, lighting_types,
+                                                       ['Grid', 'Solar/diesel', 'Kerosene-dependent', 'Torch-dependent',
+                                                        'Solar/mini-grid']),
+        'cooking_type_descriptions': get_descriptions(rnd, cooking_types, ['Firewood-dependent', 'Firewood mix',
+                                                                           'LPG fuelled', 'Alternative biomass']),
+        'camptypes': {name: get_camp_types(rnd) for name in named_camps},
+        'camptypes_fallbacks_offgrid': {iso3: {tier: rnd.choice(lighting_types) for tier in tiers}
+                                        for iso3 in fallback_countries},
+        'camptypes_fallbacks_solid': {iso3: {tier: rnd.choice(cooking_types) for tier in tiers}
+                                      for iso3 in fallback_countries},
+        'small_camptypes': {region: get_camp_types(rnd) for region in small_camp_regions},
+        'smallcamps': {region: float(rnd.randint(100, 5000)) for region in small_camp_regions},
+        'small_camps_elecgridco2': {region: rnd.choice([0.3, 0.5, '-']) for region in small_camp_regions}
+    }
+    return inputs, sizes
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tab15 generator
+---------------
+
+Builds UNHCR workbooks with a Tab15 sheet laid out as get_camp_non_camp_populations expects: junk rows before the
+headers, the accommodation, location and population columns, a row per camp or location with country names that
+need fuzzy matching, dispersed in the country rows and a NOTES footer. It can also time ingesting the workbook:
+
+    PYTHONPATH=src python benchmarks/tab15.py ~/tab15.xlsx --rows 100000 --noise 0.3 --measure
+
+"""
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+
+from hdx.location.country import Country
+
+from chathamhouse.chathamhousedata import get_unhcr_populations
+
+logger = logging.getLogger(__name__)
+
+junk_rows = [['Table 15. Refugees, asylum-seekers and others of concern by type of accommodation'],
+             ['Source: synthetic'], [''], ['Data as at end-year']]
+headers = ['Country / territory of asylum/residence', 'Location name', 'Main Origin', 'Accommodation type',
+           'Total', '% Female', '% under 18']
+camp_accommodation_types = ['Planned/managed camp', 'Self-settled camp', 'Collective centre', 'Reception/transit camp']
+noncamp_accommodation_types = ['Individual accommodation (private)', 'Undefined', 'Other']
+dispersed_suffix = ' : Dispersed in the country / territory'
+
+
+def add_footnote(name, rnd):
+    return '%s %d/' % (name, rnd.randint(1, 30))
+
+
+def abbreviate(name, rnd):
+    return name.replace('Republic', 'Rep.').replace('Democratic', 'Dem.').replace('United', 'Utd.')
+
+
+# Ways the country names in Tab15 differ from the preferred names, all of which fuzzy matching resolves
+noise_functions = [lambda name, rnd: name.upper(), lambda name, rnd: name.lower(),
+                   lambda name, rnd: '  %s ' % name, lambda name, rnd: 'The %s' % name, add_footnote, abbreviate]
+
+
+def add_noise(name, rnd):
+    return rnd.choice(noise_functions)(name, rnd)
+
+
+def make_rows(countries, no_rows, named_camps=None, noise=0.0, unmatched=0.0, camp_share=0.5, rnd=None):
+    # Named camps come first so that each has a row with a camp accommodation type. Each country gets a dispersed
+    # row and the rest are a mix of camps only in the UNHCR data and non-camp accommodation.
+    if rnd is None:
+        rnd = random.Random(1)
+    if named_camps is None:
+        named_camps = dict()
+    names = {iso3: Country.get_country_name_from_iso3(iso3) for iso3 in countries}
+    rows = list()
+    for name in sorted(named_camps):
+        iso3 = named_camps[name]
+        rows.append([names[iso3], name, 'Various', rnd.choice(camp_accommodation_types), rnd.randint(1000, 200000)])
+    for iso3 in countries:
+        rows.append([names[iso3], '%s%s' % (names[iso3], dispersed_suffix), 'Various', 'Undefined',
+                     rnd.randint(100, 90000)])
+    for i in range(len(rows), no_rows):
+        iso3 = countries[i % len(countries)]
+        if rnd.random() < camp_share:
+            accommodation_type = rnd.choice(camp_accommodation_types)
+        else:
+            accommodation_type = rnd.choice(noncamp_accommodation_types)
+        rows.append([names[iso3], '%s location %d' % (names[iso3], i), 'Various', accommodation_type,
+                     rnd.randint(100, 90000)])
+    rows.sort(key=lambda row: row[0])
+    # The first row must match a country exactly as it is how the parser finds where the data starts
+    for row in rows[1:]:
+        if rnd.random() < unmatched:
+            row[0] = 'Various/unknown %d' % rnd.randint(1, 99)
+        elif rnd.random() < noise:
+            row[0] = add_noise(row[0], rnd)
+    for row in rows:
+        row.extend([round(rnd.uniform(30, 70), 1), round(rnd.uniform(20, 60), 1)])
+    return rows
+
+
+def write_workbook(path, rows, no_junk_rows=2):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Tab15')
+    for i in range(no_junk_rows):
+        sheet.append(junk_rows[i % len(junk_rows)])
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    sheet.append(['NOTES: synthetic data for load testing'])
+    sheet.append(['1/ Footnotes follow the notes'])
+    workbook.save(path)
+
+
+def generate_tab15(path, no_rows, no_countries=None, named_camps=None, noise=0.0, unmatched=0.0, no_junk_rows=2,
+                   seed=1):
+    rnd = random.Random(seed)
+    countries = sorted(Country.countriesdata()['countries'])
+    if no_countries is not None:
+        countries = sorted(rnd.sample(countries, min(no_countries, len(countries))))
+    rows = make_rows(countries, no_rows, named_camps, noise, unmatched, rnd=rnd)
+    write_workbook(path, rows, no_junk_rows)
+    return rows
+
+
+def measure_ingest(path, downloader, noncamp_types='individual,undefined',
+                   camp_types='self-settled,planned,collective,reception'):
+    camp_overrides = {'Accommodation Type': dict(), 'Country': dict(), 'Population': dict()}
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    populations = get_unhcr_populations(noncamp_types, camp_types, camp_overrides, path, downloader)
+    seconds = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    if not tracing:
+        tracemalloc.stop()
+    return populations, {'seconds': seconds, 'peak_memory': peak_memory}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic UNHCR Tab15 workbook')
+    parser.add_argument('path', help='Path of workbook to write')
+    parser.add_argument('--rows', type=int, default=1000, help='Number of camp and location rows')
+    parser.add_argument('--countries', type=int, default=None, help='Number of countries. Defaults to all.')
+    parser.add_argument('--noise', type=float, default=0.2,
+                        help='Share of rows whose country name needs fuzzy matching')
+    parser.add_argument('--unmatched', type=float, default=0.0,
+                        help='Share of rows whose country name does not match any country')
+    parser.add_argument('--junk-rows', type=int, default=2, help='Number of rows before the headers')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--measure', action='store_true', help='Time ingesting the workbook once written')
+    args = parser.parse_args()
+
+    from hdx.utilities.downloader import Download
+    from chathamhouse.chathamhousecountries import load_countriesdata
+
+    load_countriesdata()
+    start = time.perf_counter()
+    rows = generate_tab15(args.path, args.rows, args.countries, noise=args.noise, unmatched=args.unmatched,
+                          no_junk_rows=args.junk_rows, seed=args.seed)
+    print('Written %d rows to %s in %.2fs' % (len(rows), args.path, time.perf_counter() - start))
+    if args.measure:
+        downloader = Download(user_agent='tab15')
+        session = downloader.session
+        downloader.session = None  # Hack for Tabulator local file issue
+        try:
+            _, measures = measure_ingest(args.path, downloader)
+        finally:
+            downloader.session = session
+            downloader.close()
+        print('Ingested %d rows in %.2fs (%.0f rows/s), peak traced memory %.1fMB' %
+              (len(rows), measures['seconds'], len(rows) / measures['seconds'], measures['peak_memory'] / 1048576))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
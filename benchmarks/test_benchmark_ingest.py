@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of ingesting generated UNHCR Tab15 workbooks with increasing numbers of rows and noisy country names.
+
+'''
+from os.path import join
+
+import pytest
+
+from benchmarks.tab15 import generate_tab15, measure_ingest
+
+
+class TestBenchmarkIngest:
+    def test_generate_tab15(self, configuration, downloader, tmpdir):
+        path = join(str(tmpdir), 'tab15.xlsx')
+        rows = generate_tab15(path, 500, 20, named_camps=dict(), noise=0.5, unmatched=0.02, no_junk_rows=4)
+        noisy = sum(1 for row in rows if row[0] != row[0].strip() or row[0].isupper() or row[0].endswith('/'))
+        assert noisy > 0
+        populations, measures = measure_ingest(path, downloader)
+        country_totals = populations[0].get_totals()
+        assert len(country_totals) == 20
+        total = sum(country_totals.values())
+        unmatched = sum(row[4] for row in rows if row[0].startswith('Various/unknown'))
+        assert total == sum(row[4] for row in rows) - unmatched
+        assert measures['peak_memory'] > 0
+
+    @pytest.mark.parametrize('rows', [1000, 10000])
+    @pytest.mark.parametrize('noise', [0.0, 0.1, 0.5])
+    def test_ingest(self, benchmark, configuration, downloader, tmpdir, rows, noise):
+        path = join(str(tmpdir), 'tab15.xlsx')
+        generate_tab15(path, rows, noise=noise)
+
+        def ingest():
+            populations, measures = measure_ingest(path, downloader)
+            benchmark.extra_info['rows_per_second'] = rows / measures['seconds']
+            benchmark.extra_info['peak_memory'] = measures['peak_memory']
+            return populations
+
+        benchmark.pedantic(ingest, rounds=1)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of the Chatham House parsing, model and output at 1x, 10x, 100x and 1000x today's input sizes.
+
+'''
+import pickle
+
+from chathamhouse.chathamhousedata import get_camp_non_camp_populations, get_resource_names
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhouseoutput import write_resource_files
+from chathamhouse.chathamhousestages import get_stages
+
+
+def get_rounds(scale):
+    return max(100 // scale, 1)
+
+
+def benchmark_stage(benchmark, snapshots, scale, name):
+    stage = [stage for stage in get_stages() if stage.name == name][0]
+
+    def setup():
+        context = pickle.loads(snapshots[name])
+        return (), {input_name: context[input_name] for input_name in stage.inputs}
+
+    benchmark.extra_info['stage'] = name
+    return benchmark.pedantic(stage.function, setup=setup, rounds=get_rounds(scale))
+
+
+class TestBenchmarkModel:
+    def test_get_camp_non_camp_populations(self, benchmark, synthetic, datasets, downloader, scale):
+        constants = synthetic['inputs']['constants']
+        camp_overrides = synthetic['inputs']['camp_overrides']
+        benchmark.extra_info.update(synthetic['sizes'])
+        unhcr_populations, _ = \
+            benchmark.pedantic(get_camp_non_camp_populations,
+                               args=(constants['Non Camp Types'], constants['Camp Types'], camp_overrides, datasets,
+                                     downloader), rounds=max(get_rounds(scale) // 10, 1))
+        assert len(unhcr_populations.get_totals()) == synthetic['sizes']['countries']
+
+    def test_calculate_regional_average(self, benchmark, synthetic, scale):
+        inputs = synthetic['inputs']
+        datadicts = [inputs[name] for name in ('urbanratios', 'slumratios', 'elecappliances', 'cookinglpg',
+                                               'elecgridco2')]
+        countries = sorted(inputs['unhcr_populations'].get_totals('noncamp'))
+
+        def setup():
+            ChathamHouseModel.regions_source = None  # the regions are looked up afresh each run
+            return (), dict()
+
+        def calculate_regional_averages():
+            for datadict in datadicts:
+                for iso3 in countries:
+                    if iso3 not in datadict:
+                        ChathamHouseModel.calculate_regional_average('Benchmark', datadict, iso3)
+
+        benchmark.pedantic(calculate_regional_averages, setup=setup, rounds=get_rounds(scale))
+
+    def test_noncamp(self, benchmark, snapshots, scale):
+        outputs = benchmark_stage(benchmark, snapshots, scale, 'noncamp')
+        assert len(outputs['results'][0]) > 1
+
+    def test_camps(self, benchmark, snapshots, scale):
+        outputs = benchmark_stage(benchmark, snapshots, scale, 'camps')
+        assert len(outputs['results'][3]) > 1
+
+    def test_extracamps(self, benchmark, snapshots, scale):
+        benchmark_stage(benchmark, snapshots, scale, 'extracamps')
+
+    def test_smallcamps(self, benchmark, snapshots, scale):
+        outputs = benchmark_stage(benchmark, snapshots, scale, 'smallcamps')
+        assert len(outputs['results'][4]) > 1
+
+    def test_write(self, benchmark, snapshots, scale, tmpdir):
+        context = pickle.loads(snapshots['write'])
+        resources = [{'name': name} for name in get_resource_names(context['pop_types'])]
+        benchmark.pedantic(write_resource_files,
+                           args=(context['results'], context['headers'], resources, str(tmpdir)),
+                           kwargs={'upload': lambda resource, path: None}, rounds=get_rounds(scale))
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Timing gate
+-----------
+
+Times the parser and model hot paths on the test fixtures replicated to a fixed larger size and fails if any of them
+has slowed down by more than a threshold compared with the baseline in benchmarks/timing_baseline.json. Timings are
+divided by the time of a fixed pure Python calibration loop so that baselines carry over between machines. The UNHCR
+workbook is made by the Tab15 generator as there is no fixture for it. Everything is read from local files. When Numba
+is installed, calculate_offgrid_solid is also timed with the Numba kernels so that the two backends can be compared.
+
+    PYTHONPATH=src:. python benchmarks/timing_gate.py --threshold 0.25
+    PYTHONPATH=src:. python benchmarks/timing_gate.py --update
+
+"""
+import argparse
+import csv
+import gc
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+import zipfile
+from os.path import dirname, join
+from tempfile import TemporaryDirectory
+
+from hdx.data.dataset import Dataset
+from hdx.hdx_configuration import Configuration
+from hdx.location.country import Country
+from hdx.utilities.downloader import Download
+
+from benchmarks.synthetic import get_costs, get_descriptions, tiers
+from benchmarks.tab15 import generate_tab15
+from chathamhouse.chathamhousecountries import load_countriesdata
+from chathamhouse.chathamhousedata import get_camp_non_camp_populations, get_camptypes, get_camptypes_fallbacks, \
+    get_iso3, get_slumratios
+from chathamhouse.chathamhousekernels import compile_kernels, python_kernels
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+
+fixtures_folder = join('tests', 'fixtures')
+baseline_path = join(dirname(__file__), 'timing_baseline.json')
+sizes = {'tab15_rows': 5000, 'slumratio_copies': 400, 'fallback_rows': 100000, 'regional_average_repeats': 200,
+         'offgrid_solid_calls': 100000, 'keyfigures_calls': 400000}
+types = range(1, 9)
+
+
+def calibrate():
+    total = 0.0
+    values = dict()
+    for i in range(300000):
+        total += i * 0.5
+        values[i & 1023] = total
+    return total
+
+
+def time_once(function, args=()):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def measure(function, setup=None, repeats=5):
+    # Each run is timed straight after the calibration loop so that both see the same clock speed and load. The
+    # median of the runs is used as it is the least affected by whatever else the machine is doing.
+    seconds = list()
+    normalized = list()
+    for _ in range(repeats):
+        calibration = min(time_once(calibrate) for _ in range(3))
+        args = setup() if setup else ()
+        run = time_once(function, args)
+        seconds.append(run)
+        normalized.append(run / calibration)
+    return {'seconds': statistics.median(seconds), 'normalized': statistics.median(normalized)}
+
+
+def replicate_slumratios(folder):
+    path = join(fixtures_folder, 'MDG_Export_20170913_174700805.zip')
+    with zipfile.ZipFile(path) as zipped:
+        filename = zipped.namelist()[0]
+        lines = zipped.read(filename).decode('utf-8-sig').splitlines(keepends=True)
+    end = next(i for i, line in enumerate(lines) if i > 0 and not line.strip())
+    contents = lines[0] + ''.join(lines[1:end]) * sizes['slumratio_copies'] + ''.join(lines[end:])
+    replicated = join(folder, 'slumratios.zip')
+    with zipfile.ZipFile(replicated, 'w', zipfile.ZIP_DEFLATED) as zipped:
+        zipped.writestr(filename, contents)
+    return replicated
+
+
+def replicate_fallbacks(folder):
+    with open(join(fixtures_folder, 'Chatham House Constants and Lookups - CampTypeFallbacks.csv')) as f:
+        rows = list(csv.reader(f))
+    names = [Country.get_country_name_from_iso3(iso3) for iso3 in sorted(Country.countriesdata()['countries'])]
+    replicated = join(folder, 'fallbacks.csv')
+    with open(replicated, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(rows[0])
+        for i in range(sizes['fallback_rows']):
+            writer.writerow([names[i % len(names)]] + rows[1][1:])
+    return replicated
+
+
+def get_paths(folder, downloader):
+    rnd = random.Random(1)
+    tab15_path = join(folder, 'tab15.xlsx')
+    generate_tab15(tab15_path, sizes['tab15_rows'], noise=0.02)
+    dataset = Dataset({'title': 'UNHCR Global Trends: Forced Displacement Timing Data', 'dataset_date': '06/20/2017'})
+    dataset.add_update_resource({'url': tab15_path})
+    camp_overrides = {'Accommodation Type': dict(), 'Country': dict(), 'Population': dict()}
+    slumratios_path = replicate_slumratios(folder)
+    fallbacks_path = replicate_fallbacks(folder)
+    slumratios = get_slumratios(slumratios_path, downloader)
+    countries = sorted(Country.countriesdata()['countries'])
+    camptypes = get_camptypes(join(fixtures_folder, 'Chatham House Constants and Lookups - CampTypes.csv'),
+                              downloader)
+    camptypes = list(camptypes.values())
+    lightingoffgridcost = get_costs(rnd, types, 0.1, 300.0)
+    cookingsolidcost = get_costs(rnd, types, 1.0, 250.0)
+    elecgriddirectenergy = {'%s Type %d' % (baseline_target, comtype): rnd.uniform(0.0, 40.0)
+                            for baseline_target in ('Baseline', 'Target') for comtype in types}
+    lighting_type_descriptions = get_descriptions(rnd, types, ['Grid', 'Solar/diesel', 'Torch-dependent'])
+    cooking_type_descriptions = get_descriptions(rnd, types, ['Firewood-dependent', 'LPG fuelled'])
+    constants = {'Household Size': 5, 'Lighting Offgrid Scaling Factor': 1, 'Cooking Solid Scaling Factor': 1}
+
+    def parse_slumratios():
+        get_slumratios(slumratios_path, downloader)
+
+    def fallbacks():
+        get_camptypes_fallbacks(fallbacks_path, downloader, keyfn=get_iso3)
+
+    def populations():
+        get_camp_non_camp_populations('individual,undefined', 'self-settled,planned,collective,reception',
+                                      camp_overrides, [dataset], downloader)
+
+    def regional_averages():
+        # The regions are looked up again each time round as they would be in a new run
+        for _ in range(sizes['regional_average_repeats']):
+            ChathamHouseModel.regions_source = None
+            for iso3 in countries:
+                if iso3 not in slumratios:
+                    ChathamHouseModel.calculate_regional_average('Slum ratio', slumratios, iso3)
+
+    model = ChathamHouseModel(constants)
+
+    def offgrid_solid(calls=sizes['offgrid_solid_calls']):
+        for i in range(calls):
+            tier = tiers[i % len(tiers)]
+            camp_camptypes = camptypes[i % len(camptypes)]
+            model.calculate_offgrid_solid(tier, 1000.0 + i, lighting_type_descriptions,
+                                          camp_camptypes['Lighting OffGrid %s' % tier], lightingoffgridcost,
+                                          elecgriddirectenergy, 0.5, 800.0 + i, cooking_type_descriptions,
+                                          camp_camptypes['Cooking Solid %s' % tier], cookingsolidcost)
+
+    def use_numba_kernels():
+        # The kernels are compiled for their argument types on the first call, which is not timed
+        ChathamHouseModel.kernels = compile_kernels()
+        offgrid_solid(len(tiers) * len(camptypes))
+        return ()
+
+    def offgrid_solid_numba():
+        try:
+            offgrid_solid()
+        finally:
+            ChathamHouseModel.kernels = python_kernels
+
+    def new_results():
+        return ChathamHouseModel(constants), [list(), list(), list()]
+
+    def keyfigures(keyfigures_model, results):
+        for i in range(sizes['keyfigures_calls']):
+            keyfigures_model.reset_pop_counters()
+            keyfigures_model.add_keyfigures('AFG', 'Afghanistan', 'Camp %d' % i, tiers[i % len(tiers)], 1.5, 2.5,
+                                            'Firewood-dependent', 1000, 'Solar/diesel', 1000, results)
+
+    paths = {
+        'get_camp_non_camp_populations': (populations, None, 5),
+        'get_slumratios': (parse_slumratios, None, 5),
+        'get_camptypes_fallbacks': (fallbacks, None, 5),
+        'calculate_regional_average': (regional_averages, None, 5),
+        'calculate_offgrid_solid': (offgrid_solid, None, 5),
+        'add_keyfigures': (keyfigures, new_results, 5)
+    }
+    try:
+        compile_kernels()
+        paths['calculate_offgrid_solid_numba'] = (offgrid_solid_numba, use_numba_kernels, 5)
+    except ImportError:
+        pass
+    return paths
+
+
+def run_paths(names=None):
+    timings = dict()
+    downloader = Download(user_agent='timing')
+    session = downloader.session
+    downloader.session = None  # Hack for Tabulator local file issue
+    try:
+        with TemporaryDirectory() as folder:
+            for name, (function, setup, repeats) in get_paths(folder, downloader).items():
+                if names is None or name in names:
+                    timings[name] = measure(function, setup, repeats)
+    finally:
+        downloader.session = session
+        downloader.close()
+    return timings
+
+
+def compare(baseline, timings, threshold):
+    regressions = list()
+    print('%-32s %12s %12s %8s' % ('Path', 'Baseline', 'Current', 'Change'))
+    for name in sorted(timings):
+        current = timings[name]['normalized']
+        expected = baseline['paths'].get(name)
+        if expected is None:
+            print('%-32s %12s %12.2f %8s' % (name, '-', current, 'new'))
+            continue
+        change = current / expected['normalized'] - 1.0
+        status = ''
+        if change > threshold:
+            regressions.append(name)
+            status = ' REGRESSED'
+        print('%-32s %12.2f %12.2f %+7.0f%%%s' % (name, expected['normalized'], current, change * 100, status))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if the parser and model hot paths have slowed down')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Largest allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--baseline', default=baseline_path, help='Baseline timings file')
+    parser.add_argument('--update', action='store_true', help='Write the current timings as the new baseline')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    Configuration._create(hdx_read_only=True, user_agent='timing')
+    load_countriesdata()
+    timings = run_paths()
+    if args.update:
+        baseline = {'python': platform.python_version(), 'sizes': sizes, 'paths': timings}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Written baseline to %s' % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['sizes'] != sizes:
+        print('The sizes have changed since the baseline was written, rerun with --update')
+        return 1
+    regressions = compare(baseline, timings, args.threshold)
+    if regressions:
+        # A path only fails if it is still slow when timed again, so that a burst of load on the machine does not fail
+        # the gate
+        print('Timing %s again' % ', '.join(regressions))
+        regressions = compare(baseline, run_paths(regressions), args.threshold)
+    if regressions:
+        print('%s slowed down by more than %.0f%%' % (', '.join(regressions), args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
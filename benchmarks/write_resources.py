@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Write resources benchmark
+-------------------------
+
+Compares writing (and optionally compressing) the resource files one after another with the pool of writers.
+
+    python benchmarks/write_resources.py --rows 20000 --compression gzip
+
+"""
+import argparse
+import time
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from chathamhouse.chathamhouseoutput import write_compress_resource, write_resource_files
+
+
+def generate_tables(no_tables, no_rows):
+    resources = list()
+    headers = list()
+    results = list()
+    for i in range(no_tables):
+        resources.append({'name': 'table%d_consumption.csv' % i})
+        headers.append(['ISO3 Country Code', 'Country Name', 'Population', 'Tier', 'Expenditure ($m/yr)', 'Info'])
+        rows = [['#country+code', '#country+name', '#population+num', '#indicator+tier', '#indicator+value', '#meta+info']]
+        for j in range(no_rows):
+            rows.append(['AFG', 'Afghanistan', j * 5, 'Baseline', j / 7.0, 'elco2(034)=0.42,ur(142)=0.35'])
+        results.append(rows)
+    return resources, headers, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark writing the resource files')
+    parser.add_argument('--tables', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--compression', help='gzip or zstd')
+    args = parser.parse_args()
+
+    resources, headers, results = generate_tables(args.tables, args.rows)
+
+    def upload(resource, path):
+        pass
+
+    with TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        for i, resource in enumerate(resources):
+            write_compress_resource(results[i], join(folder, resource['name']), headers[i], args.compression, None)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_resource_files(results, headers, resources, folder, upload, max_writers=args.writers,
+                             compression=args.compression)
+        pooled = time.perf_counter() - start
+
+    print('tables=%d rows=%d writers=%d compression=%s' % (args.tables, args.rows, args.writers, args.compression))
+    print('serial: %.3fs' % serial)
+    print('pooled: %.3fs (%.2fx)' % (pooled, serial / pooled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Async Download
+----------------------------
+
+Fetches inputs concurrently with asyncio over a pooled keep-alive HTTP session (aiohttp) and serves them to the
+existing parsing functions through the same methods as hdx Download, returning the same structures. During a pipeline
+run, a DownloadLoop keeps one event loop in a thread of its own with one session that all the loaders share.
+
+"""
+import asyncio
+import io
+import json
+import logging
+import threading
+from concurrent.futures import wait
+from contextlib import contextmanager
+from os.path import exists
+
+from hdx.utilities.downloader import Download, DownloadError
+from hdx.utilities.useragent import UserAgent
+from tabulator.config import DEFAULT_BYTES_SAMPLE_SIZE
+from tabulator.loaders.stream import StreamLoader
+
+from chathamhouse.chathamhouseinstrument import record_download
+
+logger = logging.getLogger(__name__)
+
+current = None
+
+
+class MemoryLoader(StreamLoader):
+    options = ['contents']
+
+    def __init__(self, bytes_sample_size=DEFAULT_BYTES_SAMPLE_SIZE, contents=None):
+        super(MemoryLoader, self).__init__(bytes_sample_size=bytes_sample_size)
+        self.contents = contents
+
+    def load(self, source, mode='t', encoding=None):
+        return super(MemoryLoader, self).load(io.BytesIO(self.contents[source]), mode=mode, encoding=encoding)
+
+
+class FetchedResponse:
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+        self.status_code = 200
+
+    @property
+    def raw(self):
+        return io.BytesIO(self.content)
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FetchedDownload(Download):
+    # Reads from contents already fetched rather than the network. Tabulator still detects the format and
+    # compression from the url so parsing behaves exactly as with Download.
+    def __init__(self, contents):
+        self.contents = contents
+        self.response = None
+
+    def close(self):
+        self.close_response()
+
+    def get_content(self, url):
+        content = self.contents.get(url)
+        if content is None:
+            raise DownloadError('%s has not been fetched!' % url)
+        return content
+
+    def setup(self, url, stream=True, post=False, parameters=None, timeout=None):
+        self.response = FetchedResponse(url, self.get_content(url))
+        return self.response
+
+    def download(self, url, post=False, parameters=None, timeout=None):
+        return self.setup(url, stream=False, post=post, parameters=parameters, timeout=timeout)
+
+    def get_tabular_stream(self, url, **kwargs):
+        self.get_content(url)
+        kwargs['custom_loaders'] = {'http': MemoryLoader, 'https': MemoryLoader, 'file': MemoryLoader}
+        kwargs['contents'] = self.contents
+        return super(FetchedDownload, self).get_tabular_stream(url, **kwargs)
+
+
+class MeteredDownload(Download):
+    # Counts the bytes read through each response and tabular stream once the downloader is closed
+    def __init__(self, **kwargs):
+        super(MeteredDownload, self).__init__(**kwargs)
+        self.metered = list()
+
+    def setup(self, url, stream=True, post=False, parameters=None, timeout=None):
+        response = super(MeteredDownload, self).setup(url, stream=stream, post=post, parameters=parameters,
+                                                      timeout=timeout)
+        self.metered.append((url, response))
+        return response
+
+    def get_tabular_stream(self, url, **kwargs):
+        stream = super(MeteredDownload, self).get_tabular_stream(url, **kwargs)
+        self.metered.append((url, stream))
+        return stream
+
+    @staticmethod
+    def get_size(response):
+        raw = getattr(response, 'raw', None)
+        if raw is not None:
+            return raw.tell()
+        return response.size
+
+    def close(self):
+        for url, response in self.metered:
+            try:
+                size = self.get_size(response)
+            except (AttributeError, ValueError) as e:
+                logger.debug('Could not get the size downloaded from %s: %s' % (url, e))
+                continue
+            record_download(url, size)
+        self.metered = list()
+        super(MeteredDownload, self).close()
+
+
+class AsyncDownload:
+    def __init__(self, limit=8, timeout=60):
+        self.limit = limit
+        self.timeout = timeout
+        self.session = None
+        self.contents = dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def get_session(self):
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                raise ImportError('Async downloads need the aiohttp package!')
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': UserAgent.get()},
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def fetch(self, url):
+        content = self.contents.get(url)
+        if content is not None:
+            return content
+        if exists(url):
+            content = await asyncio.to_thread(read_file, url)
+        else:
+            try:
+                async with self.get_session().get(url) as response:
+                    response.raise_for_status()
+                    content = await response.read()
+            except ImportError:
+                raise
+            except Exception as e:
+                raise DownloadError('Download of %s failed!' % url) from e
+        self.contents[url] = content
+        record_download(url, len(content))
+        return content
+
+    async def fetch_all(self, urls):
+        contents = await asyncio.gather(*[self.fetch(url) for url in urls])
+        return dict(zip(urls, contents))
+
+    def get_downloader(self):
+        return FetchedDownload(self.contents)
+
+    async def download(self, url):
+        await self.fetch(url)
+        return self.get_downloader().download(url)
+
+    async def get_tabular_stream(self, url, **kwargs):
+        await self.fetch(url)
+        return self.get_downloader().get_tabular_stream(url, **kwargs)
+
+    async def get_tabular_rows(self, url, dict_rows=False, **kwargs):
+        await self.fetch(url)
+        return self.get_downloader().get_tabular_rows(url, dict_rows=dict_rows, **kwargs)
+
+    async def download_tabular_key_value(self, url, **kwargs):
+        await self.fetch(url)
+        return self.get_downloader().download_tabular_key_value(url, **kwargs)
+
+    async def download_tabular_rows_as_dicts(self, url, headers=1, keycolumn=1, **kwargs):
+        await self.fetch(url)
+        return self.get_downloader().download_tabular_rows_as_dicts(url, headers=headers, keycolumn=keycolumn,
+                                                                    **kwargs)
+
+    async def download_tabular_cols_as_dicts(self, url, headers=1, keycolumn=1, **kwargs):
+        await self.fetch(url)
+        return self.get_downloader().download_tabular_cols_as_dicts(url, headers=headers, keycolumn=keycolumn,
+                                                                    **kwargs)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def fetch_urls(urls, limit=8, timeout=60):
+    async with AsyncDownload(limit=limit, timeout=timeout) as downloader:
+        return await downloader.fetch_all(urls)
+
+
+class DownloadLoop:
+    def __init__(self, limit=8, timeout=60):
+        self.downloader = AsyncDownload(limit=limit, timeout=timeout)
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.pending = set()
+
+    def start(self):
+        global current
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='chathamhouse-downloads', daemon=True)
+        self.thread.start()
+        current = self
+
+    def stop(self):
+        global current
+        with self.lock:
+            if current is self:
+                current = None
+            loop = self.loop
+            self.loop = None
+            pending = list(self.pending)
+        if loop is None:
+            return
+        # Fetches already under way finish before the session is closed
+        wait(pending)
+        asyncio.run_coroutine_threadsafe(self.downloader.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join()
+        loop.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def fetch(self, urls):
+        # None once the loop has stopped, as a source can still be refreshed in the background after the run
+        with self.lock:
+            if self.loop is None:
+                return None
+            future = asyncio.run_coroutine_threadsafe(self.downloader.fetch_all(urls), self.loop)
+            self.pending.add(future)
+        try:
+            return future.result()
+        finally:
+            with self.lock:
+                self.pending.discard(future)
+
+
+def get_download_loop(configuration):
+    if not configuration.get('async_downloads'):
+        return None
+    return DownloadLoop(limit=configuration.get('async_download_limit', 8))
+
+
+@contextmanager
+def open_downloader(configuration, urls):
+    # With async_downloads set, all the urls a loader needs are fetched at once before parsing, through the download
+    # loop of the run if there is one
+    if configuration.get('async_downloads'):
+        download_loop = current
+        contents = None if download_loop is None else download_loop.fetch(urls)
+        if contents is None:
+            contents = asyncio.run(fetch_urls(urls, limit=configuration.get('async_download_limit', 8)))
+        downloader = FetchedDownload(contents)
+    else:
+        downloader = MeteredDownload()
+    try:
+        yield downloader
+    finally:
+        downloader.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Backfill
+----------------------
+
+Runs the model for every UNHCR displacement dataset rather than just the latest, giving a time series of the MEI key
+figures. The lookup tables are downloaded once, the UNHCR workbooks are parsed in a process pool and the results of
+each year are written to their own partition.
+
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+from hdx.data.dataset import Dataset
+from hdx.location.country import Country
+from hdx.utilities.useragent import UserAgent
+
+from chathamhouse.chathamhousecompute import model_stage_names, run_model
+from chathamhouse.chathamhousediagnostics import Diagnostics
+from chathamhouse.chathamhousedata import get_unhcr_datasets
+from chathamhouse.chathamhouseoutput import write_resource
+from chathamhouse.chathamhousestages import download_inputs, get_stages, open_download_loop, parse_unhcr_populations
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker(countriesdata, user_agent):
+    # Workers are given the country data and user agent of the parent rather than loading them again
+    Country._countriesdata = countriesdata
+    UserAgent.user_agent = user_agent
+
+
+def get_datasets_by_year(datasets, years=None):
+    datasets_by_year = dict()
+    for dataset in get_unhcr_datasets(datasets):
+        year = dataset.get_dataset_date_as_datetime().year
+        if years and year not in years:
+            continue
+        datasets_by_year[year] = dataset  # datasets are sorted by date so the latest in each year is kept
+    return datasets_by_year
+
+
+def parse_years(constants, camp_overrides, datasets_by_year, max_workers=None):
+    populations = dict()
+    initargs = (Country.countriesdata(), UserAgent.user_agent)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=initargs) as executor:
+        futures = dict()
+        for year in sorted(datasets_by_year):
+            url = datasets_by_year[year].get_resources()[0]['url']
+            logger.info('Parsing UNHCR data for %d from %s' % (year, url))
+            futures[year] = executor.submit(parse_unhcr_populations, constants, camp_overrides, url)
+        for year in sorted(futures):
+            populations[year] = futures[year].result()
+    return populations
+
+
+def run_backfill(configuration, folder, years=None, max_workers=None):
+    datasets = Dataset.search_in_hdx('displacement', fq='organization:unhcr')
+    datasets_by_year = get_datasets_by_year(datasets, years)
+    if not datasets_by_year:
+        raise ValueError('No UNHCR datasets found to backfill!')
+    with open_download_loop(configuration):
+        inputs = download_inputs(configuration)
+    populations = parse_years(inputs['constants'], inputs['camp_overrides'], datasets_by_year, max_workers)
+    stages = [stage for stage in get_stages() if stage.name in model_stage_names]
+    timeseries = list()
+    headers = None
+    for year in sorted(populations):
+        date = datasets_by_year[year].get_dataset_date_as_datetime()
+        logger.info('Running model for %d' % year)
+        year_inputs = dict(inputs)
+        year_inputs.update(populations[year])
+        with Diagnostics() as diagnostics:
+            headers, keyfigures = run_model(year_inputs, date, join(folder, 'year=%d' % year), stages)
+        diagnostics.log_summary()
+        for row in keyfigures:
+            timeseries.append([year] + list(row))
+    path = join(folder, 'keyfigures_timeseries.csv')
+    write_resource(timeseries, path, ['year'] + headers)
+    logger.info('Written %s' % path)
+    return sorted(populations)
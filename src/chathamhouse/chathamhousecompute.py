@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Compute
+---------------------
+
+Runs the model against inputs saved with run.py --save-inputs and writes the resulting CSVs, without downloading or
+publishing anything. Only the model, the stages and the country data are imported so it starts quickly:
+
+    PYTHONPATH=src python -m chathamhouse.chathamhousecompute inputs.pkl output_folder
+
+The country data comes from the saved countries snapshot, which is only built if there is none. Give --countries and
+--live to reuse the snapshot run.py keeps of the OCHA feed.
+
+"""
+import argparse
+import logging
+import pickle
+from datetime import datetime
+from os import makedirs, replace
+from os.path import dirname
+
+from chathamhouse.chathamhousecountries import load_countriesdata
+from chathamhouse.chathamhousediagnostics import Diagnostics
+from chathamhouse.chathamhousedata import get_resource_names
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhouseoutput import write_resource_files
+from chathamhouse.chathamhousestages import Pipeline, get_stages, input_stage_names, loader_names
+
+logger = logging.getLogger(__name__)
+
+model_stage_names = ('tables', 'noncamp', 'camps', 'extracamptypes', 'extracamps', 'smallcamps', 'keyfigures')
+
+
+def get_input_names(stages):
+    names = list()
+    for stage in stages:
+        if stage.name in input_stage_names:
+            names.extend(stage.outputs)
+    return names
+
+
+def save_inputs(context, path, stages=None):
+    if stages is None:
+        stages = get_stages()
+    inputs = {name: context[name] for name in get_input_names(stages) if name in context}
+    inputs['today'] = context['today']
+    folder = dirname(path)
+    if folder:
+        makedirs(folder, exist_ok=True)
+    tmppath = '%s.tmp' % path
+    with open(tmppath, 'wb') as f:
+        pickle.dump(inputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmppath, path)
+    logger.info('Saved inputs to %s' % path)
+
+
+def load_inputs(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def get_model_stages(inputs):
+    names = model_stage_names
+    # Inputs downloaded through the source guard also say whether each source was stale
+    if all('source_%s' % name in inputs for name in loader_names):
+        names = names + ('sources',)
+    return [stage for stage in get_stages() if stage.name in names]
+
+
+def run_model(inputs, today, folder, stages=None):
+    if stages is None:
+        stages = get_model_stages(inputs)
+    context = dict(inputs)
+    context['today'] = today
+    Pipeline(stages).run(context)
+    resources = [{'name': name} for name in get_resource_names(context['pop_types'])]
+    makedirs(folder, exist_ok=True)
+    write_resource_files(context['results'], context['headers'], resources, folder, upload=lambda resource, path: None)
+    return context['headers'][-1], context['results'][-1]
+
+
+def main(inputs_path, folder, today=None, kernels='python', countries_path=None, use_live=False):
+    load_countriesdata(countries_path, use_live=use_live)
+    ChathamHouseModel.set_kernels(kernels)
+    inputs = load_inputs(inputs_path)
+    if today is None:
+        today = inputs.get('today', datetime.utcnow())
+    with Diagnostics() as diagnostics:
+        run_model(inputs, today, folder)
+    diagnostics.log_summary()
+    logger.info('Written results to %s' % folder)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run Chatham House model against saved inputs')
+    parser.add_argument('inputs', help='Inputs saved with run.py --save-inputs')
+    parser.add_argument('folder', help='Folder in which to write the results')
+    parser.add_argument('--kernels', default='python', choices=['auto', 'numba', 'python'],
+                        help='Model kernels. auto uses Numba if it is installed.')
+    parser.add_argument('--countries', dest='countries_path', default=None,
+                        help='Path of countries snapshot. Defaults to one in the temporary folder.')
+    parser.add_argument('--live', dest='use_live', action='store_true',
+                        help='Use a snapshot of the live OCHA countries feed')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    main(args.inputs, args.folder, kernels=args.kernels, countries_path=args.countries_path,
+         use_live=args.use_live)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Countries
+-----------------------
+
+Compiles the country and region metadata used by the model into a small pickled table of iso3, iso2, m49, names,
+regexes and region codes and names. Loading it rebuilds the Country indexes in a few milliseconds rather than parsing
+the HXL countries data on every start.
+
+Build a snapshot with: python -m chathamhouse.chathamhousecountries PATH [--live]
+
+"""
+import argparse
+import logging
+import pickle
+from datetime import datetime, timedelta
+from os import makedirs, replace
+from os.path import dirname, exists, join
+from tempfile import gettempdir
+
+from hdx.location.country import Country
+
+logger = logging.getLogger(__name__)
+
+snapshot_version = 1
+snapshot_columns = ('#country+code+v_iso3', '#country+code+v_iso2', '#country+code+num+v_m49',
+                    '#country+name+preferred', '#country+regex', '#region+code+main', '#region+main+name+preferred',
+                    '#region+code+sub', '#region+name+preferred+sub', '#region+code+intermediate',
+                    '#region+intermediate+name+preferred')
+
+
+def get_default_path():
+    return join(gettempdir(), 'chathamhouse_countries.pkl')
+
+
+def sort_tag(tag):
+    hashtag, *attributes = tag.split('+')
+    return '+'.join([hashtag] + sorted(attributes))
+
+
+class SnapshotRow:
+    # Answers the lookups Country makes of an HXL row from a row of the snapshot table
+    def __init__(self, values):
+        self.dictionary = dict(zip(snapshot_columns, values))
+
+    def get(self, tag):
+        return self.dictionary.get(sort_tag(tag))
+
+
+def build_countries_snapshot(path, use_live=False):
+    Country._countriesdata = None
+    countries = Country.countriesdata(use_live=use_live)['countries']
+    rows = [tuple(countries[iso3].get(tag, '') for tag in snapshot_columns) for iso3 in sorted(countries)]
+    snapshot = {'version': snapshot_version, 'built': datetime.utcnow(), 'live': use_live, 'rows': rows}
+    folder = dirname(path)
+    if folder:
+        makedirs(folder, exist_ok=True)
+    tmppath = '%s.tmp' % path
+    with open(tmppath, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmppath, path)
+    logger.info('Written countries snapshot of %d countries to %s' % (len(rows), path))
+    return snapshot
+
+
+def load_countries_snapshot(path, use_live=False, max_age=None):
+    if not exists(path):
+        return False
+    with open(path, 'rb') as f:
+        snapshot = pickle.load(f)
+    if snapshot['version'] != snapshot_version or snapshot['live'] != use_live:
+        return False
+    if max_age is not None and datetime.utcnow() - snapshot['built'] > max_age:
+        return False
+    Country.set_countriesdata([SnapshotRow(row) for row in snapshot['rows']])
+    return True
+
+
+def load_countriesdata(path=None, use_live=False, max_days=None):
+    # A snapshot is built the first time and whenever the one found is out of date
+    if path is None:
+        path = get_default_path()
+    max_age = None if max_days is None else timedelta(days=max_days)
+    if not load_countries_snapshot(path, use_live, max_age):
+        build_countries_snapshot(path, use_live)
+    return Country.countriesdata()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build countries snapshot')
+    parser.add_argument('path', nargs='?', default=get_default_path(), help='Path of snapshot')
+    parser.add_argument('--live', action='store_true', help='Use the live OCHA countries feed')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    build_countries_snapshot(args.path, use_live=args.live)
@@ -7,19 +7,30 @@ Chatham House Data
 Collects input data for Chatham House.
 
 """
+import csv
+import hashlib
+import io
+import json
 import logging
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, replace
+from os.path import exists, getmtime, join
 
-from hdx.data.dataset import Dataset
-from hdx.data.resource import Resource
-from hdx.data.showcase import Showcase
+import ijson
 from hdx.utilities.dictandlist import integer_value_convert
 from hdx.location.country import Country
-from slugify import slugify
+
+from chathamhouse.chathamhousediagnostics import record
+from chathamhouse.chathamhouseinstrument import count, instrument
+from chathamhouse.chathamhousepopulations import PopulationTable
 
 
 logger = logging.getLogger(__name__)
 
 
+@count
 def append_value(countrydict, iso3, tier_or_type, name, value):
     tiers_or_types = countrydict.get(iso3)
     if tiers_or_types is None:
@@ -35,6 +46,7 @@ def append_value(countrydict, iso3, tier_or_type, name, value):
     camps[name] = existing_pop + value
 
 
+@count
 def check_name_dispersed(name):
     lowername = name.lower()
     if 'dispersed' in lowername and ('country' in name.lower() or 'territory' in name.lower()):
@@ -42,16 +54,22 @@ def check_name_dispersed(name):
     return False
 
 
+@count
 def get_iso3(name):
     iso3, match = Country.get_iso3_country_code_fuzzy(name, exception=ValueError)
     if not match:
-        logger.info('Country %s matched to ISO3: %s!' % (name, iso3))
+        record('fuzzy_match', iso3, name, iso3)
     return iso3
 
 
-def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, datasets, downloader):
-    noncamp_types = noncamp_types.split(',')
-    camp_types = camp_types.split(',')
+@instrument
+def get_unhcr_datasets(datasets):
+    unhcr_datasets = [dataset for dataset in datasets if 'displacement' in dataset['title'].lower()]
+    return sorted(unhcr_datasets, key=lambda x: x.get_dataset_date_as_datetime())
+
+
+@instrument
+def get_latest_unhcr_dataset(datasets):
     dataset_unhcr = None
     latest_date = None
     for dataset in datasets:
@@ -62,21 +80,33 @@ def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, dat
                 latest_date = date
     if dataset_unhcr is None:
         raise ValueError('No UNHCR dataset found!')
+    return dataset_unhcr
+
+
+@instrument
+def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, datasets, downloader):
+    dataset_unhcr = get_latest_unhcr_dataset(datasets)
     url = dataset_unhcr.get_resources()[0]['url']
+    return get_unhcr_populations(noncamp_types, camp_types, camp_overrides, url, downloader)
+
+
+@instrument
+def get_unhcr_populations(noncamp_types, camp_types, camp_overrides, url, downloader):
+    noncamp_types = noncamp_types.split(',')
+    camp_types = camp_types.split(',')
     country_ind = 0  # assume first column contains country
     iso3 = None
     row = None
     prev_row = None
-    all_camps_per_country = dict()
-    unhcr_non_camp = dict()
+    populations = PopulationTable()
     unhcr_camp = dict()
-    unhcr_camp_excluded = dict()
     rowiter = downloader.get_tabular_rows(url, sheet='Tab15')
     for row in rowiter:
         country = row[country_ind]
-        iso3 = Country.get_iso3_country_code(country)
-        if iso3 is not None:
-            break
+        if country:  # blank rows in xlsx have None in place of ''
+            iso3 = Country.get_iso3_country_code(country)
+            if iso3 is not None:
+                break
         prev_row = row
     accommodation_ind = None
     location_ind = None
@@ -103,7 +133,7 @@ def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, dat
         if accom_type is None:
             accom_type = row[accommodation_ind]
         else:
-            logger.info('Overriding accommodation type to %s for %s' % (accom_type, name))
+            record('accommodation_override', name, accom_type, name)
         return accom_type.lower()
 
     accommodation_type = get_accommodation_type(campname)
@@ -112,21 +142,21 @@ def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, dat
         if check_name_dispersed(name):
             accom_type = noncamp_types[0]
         found_camp_type = None
+        kind = 'excluded'
         for camp_type in camp_types:
             if camp_type in accom_type:
                 found_camp_type = camp_type
+                kind = 'camp'
                 unhcr_camp[name] = pop, iso, found_camp_type
                 break
         for noncamp_type in noncamp_types:
             if noncamp_type in accom_type:
                 found_camp_type = noncamp_type
-                append_value(unhcr_non_camp, iso, found_camp_type, name, pop)
+                kind = 'noncamp'
                 break
         if found_camp_type is None:
-            append_value(unhcr_camp_excluded, iso, accom_type, name, pop)
-            append_value(all_camps_per_country, iso, accom_type, name, pop)
-        else:
-            append_value(all_camps_per_country, iso, found_camp_type, name, pop)
+            found_camp_type = accom_type
+        populations.add(iso, found_camp_type, name, pop, kind)
 
     match_camp_types(campname, accommodation_type, population, iso3)
     for row in rowiter:
@@ -137,11 +167,11 @@ def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, dat
             break
         iso3, match = Country.get_iso3_country_code_fuzzy(country)
         if iso3 is None:
-            logger.warning('Country %s could not be matched to ISO3 code!' % country)
+            record('unmatched_country', country, country)
             continue
         else:
             if match is False:
-                logger.info('Matched %s to ISO3: %s!' % (country, iso3))
+                record('unhcr_fuzzy_match', iso3, country, iso3)
         campname = row[location_ind]
         accommodation_type = get_accommodation_type(campname)
         population = int(row[population_ind])
@@ -153,12 +183,13 @@ def get_camp_non_camp_populations(noncamp_types, camp_types, camp_overrides, dat
         iso3 = camp_overrides['Country'][campname]
         accommodation_type = camp_overrides['Accommodation Type'][campname].lower()
         population = camp_overrides['Population'][campname]
-        logger.info('Adding camp from override: %s (%s, %s): %d' % (campname, iso3, accommodation_type, population))
+        record('camp_override', iso3, campname, iso3, accommodation_type, population)
         match_camp_types(campname, accommodation_type, population, iso3)
 
-    return all_camps_per_country, unhcr_non_camp, unhcr_camp, unhcr_camp_excluded
+    return populations, unhcr_camp
 
 
+@instrument
 def get_camptypes(url, downloader):
     camptypes = downloader.download_tabular_rows_as_dicts(url)
     for key in camptypes:
@@ -166,6 +197,7 @@ def get_camptypes(url, downloader):
     return camptypes
 
 
+@instrument
 def get_camptypes_fallbacks(url, downloader, keyfn=lambda x: x):
     camptypes = downloader.download_tabular_rows_as_dicts(url)
     camptypes_offgrid = dict()
@@ -186,44 +218,125 @@ def get_camptypes_fallbacks(url, downloader, keyfn=lambda x: x):
     return camptypes_offgrid, camptypes_solid
 
 
+def get_worldbank_records(response):
+    # Records are parsed one at a time from the response stream rather than loading the whole body
+    raw = response.raw
+    if hasattr(raw, 'decode_content'):
+        raw.decode_content = True
+    return ijson.items(raw, 'item.item')
+
+
+@instrument
 def get_worldbank_series(json_url, downloader):
-    response = downloader.download(json_url)
-    json = response.json()
+    response = downloader.setup(json_url)
+    iso2iso3 = Country.countriesdata()['iso2iso3']
     data = dict()
-    for countrydata in json[1]:
-        iso3 = Country.get_iso3_from_iso2(countrydata['country']['id'])
-        if iso3 is not None:
-            value = countrydata.get('value')
-            if value:
-                data[iso3] = float(value) / 100.0
+    try:
+        for countrydata in get_worldbank_records(response):
+            iso3 = iso2iso3.get(countrydata['country']['id'].upper())
+            if iso3 is not None:
+                value = countrydata.get('value')
+                if value:
+                    data[iso3] = float(value) / 100.0
+    finally:
+        response.close()
     return data
 
 
-def get_slumratios(url, downloader):
-    stream = downloader.get_tabular_stream(url, headers=1, format='csv', compression='zip')
-    years = set()
-    for header in stream.headers:
-        try:
-            int(header)
-            years.add(header)
-        except ValueError:
-            pass
-    years = sorted(years, reverse=True)
+def get_worldbank_cache_path(cache_folder, json_url):
+    return join(cache_folder, '%s.json' % hashlib.sha256(json_url.encode('utf-8')).hexdigest())
+
+
+@instrument
+def get_worldbank_indicators(json_urls, open_downloader, cache_folder=None, ttl=None):
+    # The indicators come from different World Bank sources so cannot be requested together with the multi-indicator
+    # syntax. Instead they are fetched at the same time and, as they change at most yearly, kept for ttl seconds.
+    series = dict()
+    missing = list()
+    for json_url in json_urls:
+        if cache_folder and ttl:
+            path = get_worldbank_cache_path(cache_folder, json_url)
+            if exists(path) and time.time() - getmtime(path) < ttl:
+                with open(path) as f:
+                    series[json_url] = json.load(f)
+                logger.info('Using cached World Bank series for %s' % json_url)
+                continue
+        missing.append(json_url)
+
+    def download_series(json_url):
+        with open_downloader([json_url]) as downloader:
+            return get_worldbank_series(json_url, downloader)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix='worldbank') as executor:
+            for json_url, data in zip(missing, executor.map(download_series, missing)):
+                series[json_url] = data
+                if cache_folder and ttl:
+                    makedirs(cache_folder, exist_ok=True)
+                    path = get_worldbank_cache_path(cache_folder, json_url)
+                    tmppath = '%s.tmp' % path
+                    with open(tmppath, 'w') as f:
+                        json.dump(data, f)
+                    replace(tmppath, path)
+    return series
+
+
+@instrument
+def open_slumratios_zip(url, downloader):
+    if exists(url):
+        return zipfile.ZipFile(url)
+    return zipfile.ZipFile(io.BytesIO(downloader.download(url).content))
+
+
+@instrument
+def get_slumratios_and_years(url, downloader):
+    # The CSV is read straight out of the zip with the csv module. Year columns are checked from newest to oldest so
+    # each country gets its latest value and the year it is from.
+    m49iso3 = Country.countriesdata()['m49iso3']
     slumratios = dict()
-    for row in stream.iter(keyed=True):
-        if not row:
-            break
-        iso3 = Country.get_iso3_from_m49(int(row['CountryCode']))
-        if iso3 is None:
-            continue
-        for year in years:
-            value = row.get(year)
-            if value and value != ' ':
-                slumratios[iso3] = float(value) / 100.0
+    slumratio_years = dict()
+    with open_slumratios_zip(url, downloader) as zipped:
+        filename = next(name for name in zipped.namelist() if name.lower().endswith('.csv'))
+        with zipped.open(filename) as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig'))
+            headers = next(reader)
+            code_ind = headers.index('CountryCode')
+            years = sorted(((int(header), i) for i, header in enumerate(headers) if header.isdigit()), reverse=True)
+            for row in reader:
+                if not row:
+                    break
+                iso3 = m49iso3.get(int(row[code_ind]))
+                if iso3 is None:
+                    continue
+                for year, i in years:
+                    value = row[i].strip()
+                    if value:
+                        slumratios[iso3] = float(value) / 100.0
+                        slumratio_years[iso3] = year
+                        break
+    return slumratios, slumratio_years
+
+
+@instrument
+def get_slumratios(url, downloader):
+    slumratios, _ = get_slumratios_and_years(url, downloader)
     return slumratios
 
 
+def get_resource_names(pop_types):
+    names = ['%s_consumption.csv' % pop_type.lower().replace(' ', '_') for pop_type in pop_types]
+    names.extend(['population.csv', 'keyfigures_disagg.csv', 'keyfigures.csv'])
+    return names
+
+
+@instrument
 def generate_dataset_resources_and_showcase(pop_types, today):
+    # The HDX publishing modules are slow to import so are only loaded when publishing
+    from hdx.data.dataset import Dataset
+    from hdx.data.resource import Resource
+    from hdx.data.showcase import Showcase
+    from slugify import slugify
+
     title = 'Energy consumption of refugees and displaced people'
     slugified_name = slugify(title.lower())
 
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Diagnostics
+-------------------------
+
+Collects the events the parsers and the model come across for each row, like country names matched fuzzily,
+overrides, regional average fallbacks, ignored camps and missing tiers. Only the event, a key and the raw values are
+kept on the hot path and nothing is formatted. At the end of a run a single table is logged giving the count and
+number of distinct keys of each event with a few examples and, when asked, every event is written out in full. While
+no Diagnostics has been started the events are logged as they happen, formatted only if the level is enabled.
+
+"""
+import logging
+import threading
+from collections import Counter
+from os import makedirs, replace
+from os.path import dirname
+
+logger = logging.getLogger(__name__)
+
+current = None
+
+# Each event's level and message, the values recorded with it being the message arguments
+events = {
+    'fuzzy_match': (logging.INFO, 'Country %s matched to ISO3: %s!'),
+    'unhcr_fuzzy_match': (logging.INFO, 'Matched %s to ISO3: %s!'),
+    'unmatched_country': (logging.WARNING, 'Country %s could not be matched to ISO3 code!'),
+    'accommodation_override': (logging.INFO, 'Overriding accommodation type to %s for %s'),
+    'camp_override': (logging.INFO, 'Adding camp from override: %s (%s, %s): %d'),
+    'regional_average': (logging.WARNING, '%s: %s - Using %s (%s) average'),
+    'global_average': (logging.WARNING, '%s: %s - Using global average'),
+    'partial_name_match': (logging.INFO, 'Matched first part of name of %s to UNHCR name: %s'),
+    'dispersed_camp': (logging.INFO, 'Camp %s from the spreadsheet has been treated as non-camp!'),
+    'excluded_camp': (logging.INFO, 'Camp %s is in UNHCR data but has camp type %s!'),
+    'missing_lighting_tier': (logging.WARNING, 'No Lighting OffGrid %s for %s in %s'),
+    'missing_cooking_tier': (logging.WARNING, 'No Cooking Solid %s for %s in %s'),
+    'small_extra_camp': (logging.INFO, 'Ignoring extra camp %s from UNHCR data with population %s (<20000) and '
+                                       'accommodation type %s in country %s.'),
+    'missing_fallback': (logging.WARNING, 'Missing fallback for country %s, where UNHCR data has extra camp %s with '
+                                          'population %s and accommodation type %s'),
+    'missing_small_camp_group': (logging.INFO, 'Missing camp group %s in small camp types!'),
+}
+
+
+class Diagnostics:
+    def __init__(self, keep_events=False, examples=3):
+        self.keep_events = keep_events
+        self.examples = examples
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.samples = dict()
+        self.events = list()
+
+    def start(self):
+        global current
+        current = self
+
+    def stop(self):
+        global current
+        if current is self:
+            current = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add(self, event, key, args):
+        with self.lock:
+            self.counts[(event, key)] += 1
+            samples = self.samples.setdefault(event, list())
+            if len(samples) < self.examples:
+                samples.append(args)
+            if self.keep_events:
+                self.events.append((event, key, args))
+
+    def get_counts(self):
+        counts = dict()
+        for (event, key), count in self.counts.items():
+            counts.setdefault(event, dict())[str(key)] = count
+        return counts
+
+    def get_summary(self):
+        summary = list()
+        for event, keys in self.get_counts().items():
+            level, message = events[event]
+            summary.append({'event': event, 'level': logging.getLevelName(level), 'count': sum(keys.values()),
+                            'keys': len(keys), 'examples': [message % args for args in self.samples[event]]})
+        return sorted(summary, key=lambda x: (-x['count'], x['event']))
+
+    def log_summary(self):
+        summary = self.get_summary()
+        if not summary:
+            return
+        logger.info('%-24s %-8s %8s %8s  %s' % ('Event', 'Level', 'Count', 'Keys', 'Example'))
+        for entry in summary:
+            level = events[entry['event']][0]
+            logger.log(level, '%-24s %-8s %8d %8d  %s' % (entry['event'], entry['level'], entry['count'], entry['keys'],
+                                                          entry['examples'][0]))
+
+    def write_events(self, path):
+        folder = dirname(path)
+        if folder:
+            makedirs(folder, exist_ok=True)
+        tmppath = '%s.tmp' % path
+        with open(tmppath, 'w') as f:
+            for event, key, args in self.events:
+                level, message = events[event]
+                f.write('%s\t%s\t%s\t%s\n' % (logging.getLevelName(level), event, key, message % args))
+        replace(tmppath, path)
+        logger.info('Written %d diagnostic events to %s' % (len(self.events), path))
+
+
+def record(event, key, *args):
+    diagnostics = current
+    if diagnostics is None:
+        level, message = events[event]
+        logger.log(level, message, *args)
+    else:
+        diagnostics.add(event, key, args)
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Instrument
+------------------------
+
+Records where the time and memory of a run go. Each stage gets its wall time, CPU time, peak traced memory (when
+asked for, as tracing memory slows the run down) and the number of rows in its outputs, the loaders of
+chathamhousedata and the main methods of ChathamHouseModel get call counts and cumulative wall time, the per-row
+helpers of chathamhousedata get call counts only and the downloads get the bytes read from each url. Calls are counted
+per thread without locking and merged for the report. The whole is written as a JSON report at the end of the run and
+summarised in the log. Nothing is recorded unless an Instrumentation has been started and the methods of the model
+called for every row are only wrapped while one is running.
+
+"""
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from os import makedirs, replace
+from os.path import dirname, join
+from tempfile import gettempdir
+
+logger = logging.getLogger(__name__)
+
+current = None
+per_row_methods = list()
+
+
+class Instrumentation:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.lock = threading.Lock()
+        self.started = None
+        self.start_time = None
+        self.start_cpu = None
+        self.end_time = None
+        self.end_cpu = None
+        self.started_tracing = False
+        self.running = 0
+        self.stages = list()
+        self.local = threading.local()
+        self.thread_calls = list()
+        self.downloads = dict()
+
+    def start(self):
+        global current
+        self.started = datetime.utcnow()
+        self.start_time = time.perf_counter()
+        self.start_cpu = time.process_time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        wrap_per_row_methods(True)
+        current = self
+
+    def stop(self):
+        global current
+        self.end_time = time.perf_counter()
+        self.end_cpu = time.process_time()
+        if current is self:
+            current = None
+            wrap_per_row_methods(False)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def run_stage(self, name, function, *args):
+        # Loaders run in source guard threads and tracemalloc only keeps one peak, so the CPU time and peak memory are
+        # those of the whole process while the stage ran and are shared by stages running at the same time
+        with self.lock:
+            if self.running == 0 and tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            self.running += 1
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            outputs = function(*args)
+        finally:
+            cpu = time.process_time() - start_cpu
+            end = time.perf_counter()
+            peak_memory = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+            with self.lock:
+                self.running -= 1
+        stage = {'stage': name, 'start': start - self.start_time, 'wall': end - start, 'cpu': cpu,
+                 'peak_memory': peak_memory, 'rows': get_row_counts(outputs)}
+        with self.lock:
+            self.stages.append(stage)
+        return outputs
+
+    def get_thread_calls(self):
+        calls = getattr(self.local, 'calls', None)
+        if calls is None:
+            calls = (Counter(), Counter())
+            self.local.calls = calls
+            with self.lock:
+                self.thread_calls.append(calls)
+        return calls
+
+    def add_call(self, name, wall):
+        counts, walls = self.get_thread_calls()
+        counts[name] += 1
+        walls[name] += wall
+
+    def count_call(self, name):
+        self.get_thread_calls()[0][name] += 1
+
+    def get_functions(self):
+        with self.lock:
+            thread_calls = list(self.thread_calls)
+        counts = Counter()
+        walls = Counter()
+        for thread_counts, thread_walls in thread_calls:
+            counts.update(thread_counts)
+            walls.update(thread_walls)
+        functions = dict()
+        for name, calls in counts.items():
+            functions[name] = {'calls': calls}
+            if name in walls:
+                functions[name]['wall'] = walls[name]
+        return functions
+
+    def add_download(self, url, size):
+        with self.lock:
+            self.downloads[url] = self.downloads.get(url, 0) + size
+
+    def get_report(self, context=None):
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        end_cpu = self.end_cpu if self.end_cpu is not None else time.process_time()
+        report = {'started': self.started.isoformat(), 'wall': end_time - self.start_time,
+                  'cpu': end_cpu - self.start_cpu, 'bytes_downloaded': sum(self.downloads.values()),
+                  'stages': sorted(self.stages, key=lambda x: x['start']), 'functions': self.get_functions(),
+                  'downloads': self.downloads}
+        if context:
+            for name in ('source_status', 'slumratio_years', 'diagnostics', 'compression_sizes'):
+                if name in context:
+                    report[name] = context[name]
+        return report
+
+    def write_report(self, path, context=None):
+        folder = dirname(path)
+        if folder:
+            makedirs(folder, exist_ok=True)
+        tmppath = '%s.tmp' % path
+        with open(tmppath, 'w') as f:
+            json.dump(self.get_report(context), f, indent=2, sort_keys=True)
+        replace(tmppath, path)
+        logger.info('Written run report to %s' % path)
+
+    def log_summary(self, top=5):
+        report = self.get_report()
+        logger.info('Run took %.2fs (%.2fs CPU) and downloaded %d bytes' % (report['wall'], report['cpu'],
+                                                                          report['bytes_downloaded']))
+        for stage in sorted(report['stages'], key=lambda x: x['wall'], reverse=True)[:top]:
+            peak_memory = stage['peak_memory']
+            peak_memory = '' if peak_memory is None else ', peak %.1fMB' % (peak_memory / 1048576)
+            logger.info('Stage %-16s %8.2fs (%.2fs CPU%s)' % (stage['stage'], stage['wall'], stage['cpu'],
+                                                               peak_memory))
+        functions = {name: function for name, function in report['functions'].items() if 'wall' in function}
+        for name in sorted(functions, key=lambda x: functions[x]['wall'], reverse=True)[:top]:
+            logger.info('Function %-40s %8.2fs in %d calls' % (name, functions[name]['wall'],
+                                                               functions[name]['calls']))
+
+
+def get_row_counts(outputs):
+    # The results are a list of tables each starting with its hxl row
+    rows = dict()
+    if not isinstance(outputs, dict):
+        return rows
+    for name, value in outputs.items():
+        if name == 'results':
+            rows[name] = [max(len(table) - 1, 0) for table in value]
+        elif isinstance(value, (dict, list, tuple)):
+            rows[name] = len(value)
+    return rows
+
+
+def get_report_path(configuration, started):
+    folder = configuration.get('run_report_folder') or join(gettempdir(), 'chathamhouse_reports')
+    return join(folder, 'run_%s.json' % started.strftime('%Y%m%dT%H%M%S'))
+
+
+def record_download(url, size):
+    instrumentation = current
+    if instrumentation is not None and size is not None:
+        instrumentation.add_download(url, size)
+
+
+def instrument(function):
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        instrumentation = current
+        if instrumentation is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            instrumentation.add_call(name, time.perf_counter() - start)
+    return wrapper
+
+
+def count(function):
+    # For helpers called for every row, which timing would slow down more than it tells
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        instrumentation = current
+        if instrumentation is not None:
+            instrumentation.count_call(name)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def instrument_method(value):
+    if isinstance(value, staticmethod):
+        return staticmethod(instrument(value.__func__))
+    if isinstance(value, classmethod):
+        return classmethod(instrument(value.__func__))
+    return instrument(value)
+
+
+def wrap_per_row_methods(wrap):
+    for cls, name, value in per_row_methods:
+        setattr(cls, name, instrument_method(value) if wrap else value)
+
+
+def instrument_methods(timed=(), per_row=()):
+    # Only the methods named in timed are instrumented. The rest are small enough that a wrapper, even one that only
+    # counts, would slow the model down noticeably. Those named in per_row are called too often to keep a wrapper in
+    # every run, so they are only instrumented while an Instrumentation is running.
+    def decorate(cls):
+        for name in timed:
+            setattr(cls, name, instrument_method(vars(cls)[name]))
+        for name in per_row:
+            per_row_methods.append((cls, name, vars(cls)[name]))
+        if current is not None:
+            wrap_per_row_methods(True)
+        return cls
+    return decorate
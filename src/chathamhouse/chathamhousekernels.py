@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Kernels
+---------------------
+
+The arithmetic of the model's access, lighting and cooking calculations as functions of plain numbers. The model looks
+up the types, costs and constants and passes them in. By default the kernels run as they are. With model_kernels set
+to numba, or to auto when Numba (an optional dependency) is installed, they are compiled with Numba. Both do the same
+operations in the same order, so they give the same results. As they are called once per row, compiling them saves
+less than the cost of each call into Numba.
+
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Kernels = namedtuple('Kernels', 'backend hh_access ongrid_lighting offgrid_lighting non_solid_cooking solid_cooking')
+
+
+def hh_access(number_hh, ratio):
+    hh_access = number_hh * ratio
+    hh_noaccess = number_hh - hh_access
+    return hh_access, hh_noaccess
+
+
+def ongrid_lighting(hh_grid_access, kWh_per_hh_per_yr, electricity_cost, elecco2, expenditure_divisor, co2_divisor):
+    expenditure_dlrs_per_hh_per_yr = electricity_cost * kWh_per_hh_per_yr / 100.0
+    expenditure = hh_grid_access * expenditure_dlrs_per_hh_per_yr / expenditure_divisor
+    co2_emissions_per_hh_per_yr = elecco2 * kWh_per_hh_per_yr
+    co2_emissions = hh_grid_access * co2_emissions_per_hh_per_yr / co2_divisor
+    return expenditure, co2_emissions
+
+
+def offgrid_lighting(hh_offgrid, scaling_factor, fuel, capital, co2, elecgriddirectenergy, elecco2,
+                     expenditure_divisor, capital_divisor, co2_divisor):
+    scaled_number_hh = hh_offgrid * scaling_factor
+    expenditure = scaled_number_hh / expenditure_divisor * 12.0 * fuel
+    capital_costs = scaled_number_hh / capital_divisor * capital
+    co2_emissions = scaled_number_hh / co2_divisor * co2
+    grid_co2_emissions = scaled_number_hh / co2_divisor * elecco2 * elecgriddirectenergy
+    return expenditure, capital_costs, co2_emissions + grid_co2_emissions
+
+
+def non_solid_cooking(hh_nonsolid_access, kg_per_hh_per_yr, lpg_price, kerosene_co2, expenditure_divisor,
+                      co2_divisor):
+    expenditure_dlrs_per_hh_per_yr = lpg_price * kg_per_hh_per_yr
+    expenditure = hh_nonsolid_access * expenditure_dlrs_per_hh_per_yr / expenditure_divisor
+    co2_emissions_per_hh_per_yr = kerosene_co2 * kg_per_hh_per_yr
+    co2_emissions = hh_nonsolid_access * co2_emissions_per_hh_per_yr / co2_divisor
+    return expenditure, co2_emissions
+
+
+def solid_cooking(hh_no_nonsolid_access, scaling_factor, fuel, capital, co2, expenditure_divisor, capital_divisor,
+                  co2_divisor):
+    scaled_number_hh = hh_no_nonsolid_access * scaling_factor
+    expenditure = scaled_number_hh / expenditure_divisor * 12.0 * fuel
+    capital_costs = scaled_number_hh / capital_divisor * capital
+    # cooking co2 is monthly
+    co2_emissions = scaled_number_hh / co2_divisor * co2 * 12.0
+    return expenditure, capital_costs, co2_emissions
+
+
+python_kernels = Kernels('python', hh_access, ongrid_lighting, offgrid_lighting, non_solid_cooking, solid_cooking)
+numba_kernels = None
+
+
+def compile_kernels():
+    global numba_kernels
+    if numba_kernels is None:
+        import numba  # optional dependency only needed for the numba kernels
+
+        # Each kernel is compiled the first time it is called with a new combination of argument types
+        numba_kernels = Kernels('numba', *(numba.njit(kernel) for kernel in python_kernels[1:]))
+    return numba_kernels
+
+
+def get_kernels(backend='python'):
+    if backend in (None, 'python'):
+        return python_kernels
+    if backend == 'numba':
+        return compile_kernels()
+    if backend == 'auto':
+        try:
+            return compile_kernels()
+        except ImportError:
+            logger.info('Numba is not installed so the model kernels run as plain Python')
+            return python_kernels
+    raise ValueError('Unknown model kernels %s!' % backend)
@@ -13,15 +13,27 @@ import logging
 from hdx.location.country import Country
 from hxl import Column
 
+from chathamhouse.chathamhousediagnostics import record
+from chathamhouse.chathamhouseinstrument import instrument_methods
+from chathamhouse.chathamhousekernels import get_kernels, python_kernels
+from chathamhouse.chathamhouseprovenance import get_record
+from chathamhouse.chathamhouserows import KeyFigureRow, blank
+
 logger = logging.getLogger(__name__)
 
 
+@instrument_methods(timed=('get_regions', 'calculate_regional_average', 'calculate_population', 'set_kernels'),
+                    per_row=('calculate_offgrid_solid', 'add_keyfigures'))
 class ChathamHouseModel:
     tiers = ['Baseline', 'Target 1', 'Target 2', 'Target 3']
     region_levels = {1: 'main', 2: 'sub', 3: 'intermediate'}
+    region_tags = None
+    regions = dict()
+    regions_source = None
     expenditure_divisor = 1000000.0
     capital_divisor = 1000000.0
     co2_divisor = 1000.0
+    kernels = python_kernels
 
     def __init__(self, constants):
         self.constants = constants
@@ -36,6 +48,11 @@ class ChathamHouseModel:
         self.camp_offgrid = 0
         self.reset_pop_counters()
 
+    @classmethod
+    def set_kernels(cls, backend='python'):
+        cls.kernels = get_kernels(backend)
+        logger.info('Using %s model kernels' % cls.kernels.backend)
+
     def calculate_number_hh(self, pop):
         hh_size = self.constants['Household Size']
         return pop / hh_size
@@ -76,38 +93,42 @@ class ChathamHouseModel:
                 highest_type = valtype
         return highest_type
 
-    @staticmethod
-    def sum_population(totals_dict, iso3, remove_dict=None):
-        population = 0
-        accom_types = totals_dict[iso3]
-        for accom_type in sorted(accom_types):
-            camps = accom_types[accom_type]
-            for name in sorted(camps):
-                population += camps[name]
-                if remove_dict:
-                    del remove_dict[iso3][accom_type][name]
-        return population
+    @classmethod
+    def get_regions(cls, iso3):
+        # The region codes and names of each country are looked up once, most specific first
+        countriesdata = Country.countriesdata()
+        if cls.regions_source is not countriesdata:
+            cls.regions = dict()
+            cls.regions_source = countriesdata
+        regions = cls.regions.get(iso3)
+        if regions is None:
+            if cls.region_tags is None:
+                cls.region_tags = list()
+                for level in sorted(cls.region_levels, reverse=True):
+                    region_level = cls.region_levels[level]
+                    code_tag = Column.parse('#region+code+%s' % region_level).get_display_tag(sort_attributes=True)
+                    name_tag = Column.parse('#region+%s+name+preferred' % region_level).get_display_tag(
+                        sort_attributes=True)
+                    cls.region_tags.append((region_level, code_tag, name_tag))
+            countryinfo = Country.get_country_info_from_iso3(iso3)
+            regions = list()
+            for region_level, code_tag, name_tag in cls.region_tags:
+                regioncode = countryinfo[code_tag]
+                if regioncode:
+                    regioncode = int(regioncode)
+                    regions.append((region_level, regioncode, countryinfo[name_tag],
+                                    Country.get_countries_in_region(regioncode)))
+            cls.regions[iso3] = regions
+        return regions
 
     @classmethod
     def calculate_regional_average(cls, val_type, datadict, iso3):
-        countryinfo = Country.get_country_info_from_iso3(iso3)
-        level = 3
-        while level != 0:
-            region_level = cls.region_levels[level]
-            region_prefix = region_level
-            column = Column.parse('#region+code+%s' % region_prefix)
-            regioncode = countryinfo[column.get_display_tag(sort_attributes=True)]
-            if regioncode:
-                regioncode = int(regioncode)
-                column = Column.parse('#region+%s+name+preferred' % region_prefix)
-                regionname = countryinfo[column.get_display_tag(sort_attributes=True)]
-                countries_in_region = Country.get_countries_in_region(regioncode)
-                avg = cls.calculate_average(datadict, countries_in_region)
-                if avg:
-                    logger.warning('%s: %s - Using %s (%s) average' % (iso3, val_type, regionname, region_level))
-                    return avg, regioncode
-            level -= 1
-        logger.warning('%s: %s - Using global average' % (iso3, val_type))
+        for region_level, regioncode, regionname, countries_in_region in cls.get_regions(iso3):
+            avg = cls.calculate_average(datadict, countries_in_region)
+            if avg:
+                record('regional_average', val_type, iso3, val_type, regionname, region_level)
+                return avg, regioncode
+        record('global_average', val_type, iso3, val_type)
         return cls.calculate_average(datadict), '001'
 
     def calculate_population_from_hh(self, hh):
@@ -118,14 +139,14 @@ class ChathamHouseModel:
         urbanratio = urbanratios.get(iso3)
         if not urbanratio:
             urbanratio, region = self.calculate_regional_average('Urban ratio', urbanratios, iso3)
-            info.append('ur(%s)=%.3g' % (region, urbanratio))
+            info.append(get_record('ur', region, urbanratio))
         combined_urbanratio = (1 - urbanratio) * self.constants['Population Adjustment Factor'] + urbanratio
         urban_displaced_population = displaced_population * combined_urbanratio
         rural_displaced_population = displaced_population - urban_displaced_population
         slumratio = slumratios.get(iso3)
         if not slumratio:
             slumratio, region = self.calculate_regional_average('Slum ratio', slumratios, iso3)
-            info.append('ur(%s)=%.3g' % (region, slumratio))
+            info.append(get_record('sr', region, slumratio))
         slum_displaced_population = urban_displaced_population * slumratio
         urban_minus_slum_displaced_population = urban_displaced_population - slum_displaced_population
         number_hh = dict()
@@ -136,9 +157,7 @@ class ChathamHouseModel:
 
     @staticmethod
     def calculate_hh_access(number_hh, ratio):
-        hh_access = number_hh * ratio
-        hh_noaccess = number_hh - hh_access
-        return hh_access, hh_noaccess
+        return ChathamHouseModel.kernels.hh_access(number_hh, ratio)
 
     @staticmethod
     def get_baseline_target(tier):
@@ -151,26 +170,6 @@ class ChathamHouseModel:
     def get_description(descriptions, baseline_target, comtype):
         return descriptions['%s %s' % (baseline_target, comtype)]
 
-    @staticmethod
-    def get_expenditure(scaled_number_hh, values, baseline_target, comtype):
-        return scaled_number_hh / ChathamHouseModel.expenditure_divisor * 12.0 * \
-               values['Fuel %s Type %s' % (baseline_target, comtype)]
-
-    @staticmethod
-    def get_capital(scaled_number_hh, values, baseline_target, comtype):
-        return scaled_number_hh / ChathamHouseModel.capital_divisor * \
-               values['Capital %s Type %s' % (baseline_target, comtype)]
-
-    @staticmethod
-    def get_co2(scaled_number_hh, values, baseline_target, comtype):
-        return scaled_number_hh / ChathamHouseModel.co2_divisor * \
-               values['CO2 %s Type %s' % (baseline_target, comtype)]
-
-    @staticmethod
-    def get_grid_co2(scaled_number_hh, elecgriddirectenergy, elecco2, baseline_target, comtype):
-        return scaled_number_hh / ChathamHouseModel.co2_divisor * elecco2 * \
-               elecgriddirectenergy['%s Type %s' % (baseline_target, comtype)]
-
     def get_kWh_per_hh_per_yr(self, elecgridtiers, elecappliances):
         kWh_per_hh_per_yr = elecappliances
         if kWh_per_hh_per_yr == 0.0:
@@ -180,28 +179,17 @@ class ChathamHouseModel:
 
     def calculate_ongrid_lighting(self, hh_grid_access, elecgridtiers, elecappliances, elecco2):
         kWh_per_hh_per_yr = self.get_kWh_per_hh_per_yr(elecgridtiers, elecappliances)
-
-        expenditure_dlrs_per_hh_per_yr = self.constants['Electricity Cost'] * kWh_per_hh_per_yr / 100.0
-        expenditure = hh_grid_access * expenditure_dlrs_per_hh_per_yr / ChathamHouseModel.expenditure_divisor
-
-        co2_emissions_per_hh_per_yr = elecco2 * kWh_per_hh_per_yr
-        co2_emissions = hh_grid_access * co2_emissions_per_hh_per_yr / ChathamHouseModel.co2_divisor
-
-        return expenditure, co2_emissions
+        return self.kernels.ongrid_lighting(hh_grid_access, kWh_per_hh_per_yr, self.constants['Electricity Cost'],
+                                            elecco2, self.expenditure_divisor, self.co2_divisor)
 
     def calculate_offgrid_lighting(self, baseline_target, hh_offgrid, lightingoffgridtype,
                                    lightingoffgridcost, elecgriddirectenergy, elecco2):
-        scaled_number_hh = hh_offgrid * self.constants['Lighting Offgrid Scaling Factor']
-
-        expenditure = self.get_expenditure(scaled_number_hh, lightingoffgridcost, baseline_target,
-                                           lightingoffgridtype)
-        capital_costs = self.get_capital(scaled_number_hh, lightingoffgridcost, baseline_target,
-                                         lightingoffgridtype)
-        co2_emissions = self.get_co2(scaled_number_hh, lightingoffgridcost, baseline_target,
-                                     lightingoffgridtype)
-        grid_co2_emissions = self.get_grid_co2(scaled_number_hh, elecgriddirectenergy, elecco2, baseline_target,
-                                               lightingoffgridtype)
-        return expenditure, capital_costs, co2_emissions + grid_co2_emissions
+        key = '%s Type %s' % (baseline_target, lightingoffgridtype)
+        return self.kernels.offgrid_lighting(hh_offgrid, self.constants['Lighting Offgrid Scaling Factor'],
+                                             lightingoffgridcost['Fuel %s' % key],
+                                             lightingoffgridcost['Capital %s' % key],
+                                             lightingoffgridcost['CO2 %s' % key], elecgriddirectenergy[key], elecco2,
+                                             self.expenditure_divisor, self.capital_divisor, self.co2_divisor)
 
     @staticmethod
     def get_noncamp_type(types, pop_type, tier):
@@ -215,38 +203,32 @@ class ChathamHouseModel:
 
     def calculate_non_solid_cooking(self, hh_nonsolid_access, cookinglpg):
         kg_per_hh_per_yr = self.get_kg_per_hh_per_yr(cookinglpg)
-
-        expenditure_dlrs_per_hh_per_yr = self.constants['Cooking LPG NonCamp Price'] * kg_per_hh_per_yr
-        expenditure = hh_nonsolid_access * expenditure_dlrs_per_hh_per_yr / ChathamHouseModel.expenditure_divisor
-
-        co2_emissions_per_hh_per_yr = self.constants['Kerosene CO2 Emissions'] * kg_per_hh_per_yr
-        co2_emissions = hh_nonsolid_access * co2_emissions_per_hh_per_yr / ChathamHouseModel.co2_divisor
-        return expenditure, co2_emissions
+        return self.kernels.non_solid_cooking(hh_nonsolid_access, kg_per_hh_per_yr,
+                                              self.constants['Cooking LPG NonCamp Price'],
+                                              self.constants['Kerosene CO2 Emissions'], self.expenditure_divisor,
+                                              self.co2_divisor)
 
     def calculate_solid_cooking(self, baseline_target, hh_no_nonsolid_access, cookingsolidtype, cookingsolidcost):
-        scaled_number_hh = hh_no_nonsolid_access * self.constants['Cooking Solid Scaling Factor']
-
-        expenditure = self.get_expenditure(scaled_number_hh, cookingsolidcost, baseline_target, cookingsolidtype)
-        capital_costs = self.get_capital(scaled_number_hh, cookingsolidcost, baseline_target, cookingsolidtype)
-        # cooking co2 is monthly
-        co2_emissions = self.get_co2(scaled_number_hh, cookingsolidcost, baseline_target, cookingsolidtype) * 12.0
-
-        return expenditure, capital_costs, co2_emissions
+        key = '%s Type %s' % (baseline_target, cookingsolidtype)
+        return self.kernels.solid_cooking(hh_no_nonsolid_access, self.constants['Cooking Solid Scaling Factor'],
+                                          cookingsolidcost['Fuel %s' % key], cookingsolidcost['Capital %s' % key],
+                                          cookingsolidcost['CO2 %s' % key], self.expenditure_divisor,
+                                          self.capital_divisor, self.co2_divisor)
 
     def calculate_offgrid_solid(self, tier, hh_offgrid, lighting_type_descriptions, lightingoffgridtype,
                                 lightingoffgridcost, elecgriddirectenergy, country_elecgridco2,
                                 hh_no_nonsolid_access, cooking_type_descriptions, cookingsolidtype, cookingsolidcost):
         baseline_target = self.get_baseline_target(tier)
-        lightingtypedesc = ''
-        oe, oc, oco2 = '', '', ''
+        lightingtypedesc = blank
+        oe, oc, oco2 = blank, blank, blank
         if lightingoffgridtype:
             lightingtypedesc = self.get_description(lighting_type_descriptions, baseline_target,
                                                     lightingoffgridtype)
             oe, oc, oco2 = self.calculate_offgrid_lighting(baseline_target, hh_offgrid, lightingoffgridtype,
                                                            lightingoffgridcost, elecgriddirectenergy,
                                                            country_elecgridco2)
-        cookingtypedesc = ''
-        se, sc, sco2 = '', '', ''
+        cookingtypedesc = blank
+        se, sc, sco2 = blank, blank, blank
         if cookingsolidtype:
             cookingtypedesc = self.get_description(cooking_type_descriptions, baseline_target,
                                                    cookingsolidtype)
@@ -288,9 +270,9 @@ class ChathamHouseModel:
             self.total_nonbiomass += self.pop_nonbiomass
             self.total_grid += self.pop_grid
             self.total_offgrid += self.pop_offgrid
-            row = [iso3, country, camp, tier,
-                   cooking_expenditure, cookingtypedesc, self.pop_nonbiomass, self.pop_biomass,
-                   lighting_expenditure, lightingtypedesc, self.pop_grid, self.pop_offgrid]
+            row = KeyFigureRow(iso3, country, camp, tier,
+                               cooking_expenditure, cookingtypedesc, self.pop_nonbiomass, self.pop_biomass,
+                               lighting_expenditure, lightingtypedesc, self.pop_grid, self.pop_offgrid)
             results[len(results) - 2].append(row)
 
     def get_percentage_biomass(self):
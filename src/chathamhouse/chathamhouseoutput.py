@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Output
+--------------------
+
+Writes and compresses resource files for Chatham House and sets them as the files to upload of their resources. HDX
+uploads them when the dataset is created or updated. Compressed files go to resources of their own, named and formatted
+after the compression, next to the csv resources which keep the plain files.
+
+"""
+import csv
+import gzip
+import json
+import logging
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os.path import join, getsize
+
+from chathamhouse.chathamhouserows import get_columns
+
+logger = logging.getLogger(__name__)
+
+compression_extensions = {'gzip': 'gz', 'zstd': 'zst'}
+
+
+def upload_resource(resource, path):
+    resource.set_file_to_upload(path)
+
+
+def write_resource(rows, path, headers):
+    # Rows can be lists or row records. The csv writer turns blank cells and provenance into their text.
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    return path
+
+
+def write_columnar_resource(rows, path, headers):
+    # One array per column rather than one per row, with the hxl tag of each column and blank cells as null
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'columns': get_columns(rows, headers)}, f, separators=(',', ':'))
+    return path
+
+
+def write_columnar_resources(results, headers, resources, folder):
+    paths = list()
+    for rows, table_headers, resource in zip(results, headers, resources):
+        name = resource['name']
+        if name.endswith('.csv'):
+            name = name[:-len('.csv')]
+        paths.append(write_columnar_resource(rows, join(folder, '%s.columns.json' % name), table_headers))
+        logger.info('Written %s' % paths[-1])
+    return paths
+
+
+def get_compression_level(levels, name):
+    if not levels:
+        return None
+    level = levels.get(name)
+    if level is None:
+        level = levels.get('default')
+    return level
+
+
+def compress_resource(path, compression, level=None):
+    extension = compression_extensions.get(compression)
+    if extension is None:
+        raise ValueError('Unknown compression %s!' % compression)
+    compressed_path = '%s.%s' % (path, extension)
+    start = time.perf_counter()
+    with open(path, 'rb') as fin:
+        if compression == 'gzip':
+            if level is None:
+                level = 9
+            with gzip.open(compressed_path, 'wb', compresslevel=level) as fout:
+                shutil.copyfileobj(fin, fout)
+        else:
+            import zstandard  # optional dependency only needed for zstd
+            if level is None:
+                level = 3
+            with open(compressed_path, 'wb') as fout:
+                zstandard.ZstdCompressor(level=level).copy_stream(fin, fout)
+    seconds = time.perf_counter() - start
+    return compressed_path, {'raw': getsize(path), 'compressed': getsize(compressed_path), 'seconds': seconds}
+
+
+def get_compressed_resource(resource, compression):
+    extension = compression_extensions.get(compression)
+    if extension is None:
+        raise ValueError('Unknown compression %s!' % compression)
+    resource_data = {'name': '%s.%s' % (resource['name'], extension), 'format': extension}
+    description = resource.get('description')
+    if description:
+        resource_data['description'] = '%s (%s compressed)' % (description, compression)
+    return type(resource)(resource_data)
+
+
+def write_compress_resource(rows, path, headers, compression, level):
+    write_resource(rows, path, headers)
+    if not compression:
+        return path, None, None
+    compressed_path, size = compress_resource(path, compression, level)
+    return path, compressed_path, size
+
+
+def log_compression(sizes):
+    total_raw = 0
+    total_compressed = 0
+    total_seconds = 0.0
+    for name in sorted(sizes):
+        size = sizes[name]
+        if size is None:
+            continue
+        logger.info('Compressed %s: %d -> %d bytes (%.1f%%) in %.3fs' %
+                    (name, size['raw'], size['compressed'], 100.0 * size['compressed'] / size['raw'], size['seconds']))
+        total_raw += size['raw']
+        total_compressed += size['compressed']
+        total_seconds += size['seconds']
+    if total_raw:
+        logger.info('Compressed all resources: %d -> %d bytes (%.1f%%) in %.3fs' %
+                    (total_raw, total_compressed, 100.0 * total_compressed / total_raw, total_seconds))
+
+
+def write_resource_files(results, headers, resources, folder, upload=upload_resource, max_writers=4, compression=None,
+                         compression_levels=None):
+    # Writers (which also compress if requested) run on a pool and each finished file is set as the file to upload
+    # of its resource. The plain files are returned in the order of the resources along with the resources made for
+    # the compressed files.
+    if compression:
+        compressed_resources = [get_compressed_resource(resource, compression) for resource in resources]
+    else:
+        compressed_resources = list()
+    paths = [None] * len(resources)
+    sizes = dict()
+    with ThreadPoolExecutor(max_workers=max_writers) as writers:
+        writes = dict()
+        for i, resource in enumerate(resources):
+            name = resource['name']
+            level = get_compression_level(compression_levels, name)
+            future = writers.submit(write_compress_resource, results[i], join(folder, name), headers[i], compression,
+                                    level)
+            writes[future] = i
+        for future in as_completed(writes):
+            i = writes[future]
+            paths[i], compressed_path, sizes[resources[i]['name']] = future.result()
+            logger.info('Written %s' % paths[i])
+            upload(resources[i], paths[i])
+            if compressed_path:
+                upload(compressed_resources[i], compressed_path)
+    if compression:
+        log_compression(sizes)
+    return paths, compressed_resources, sizes
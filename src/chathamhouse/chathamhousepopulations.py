@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Populations
+-------------------------
+
+The camps and other locations of the UNHCR data in one flat table. Each row has integer codes for its country and
+accommodation type, its name, its population and whether it is a camp, non-camp or excluded location, with rows for
+the same location added together. As the model works through the non-camp populations and the named camps, their
+rows are marked as consumed in a bitmask rather than deleted, so whatever is left over are the extra camps. Totals by
+country are worked out in a single pass over the table and the type of each name and kind is indexed as rows are
+added.
+
+"""
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+kinds = ('camp', 'noncamp', 'excluded')
+
+
+class PopulationTable:
+    def __init__(self):
+        self.iso3s = list()
+        self.iso3_codes = dict()
+        self.types = list()
+        self.type_codes = dict()
+        self.iso3_column = array('H')
+        self.type_column = array('H')
+        self.kind_column = array('B')
+        self.names = list()
+        self.populations = list()
+        self.consumed = bytearray()
+        self.index = dict()
+        self.type_index = dict()
+
+    @staticmethod
+    def get_code(values, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            codes[value] = code
+        return code
+
+    def add(self, iso3, accommodation_type, name, population, kind):
+        iso3_code = self.get_code(self.iso3s, self.iso3_codes, iso3)
+        type_code = self.get_code(self.types, self.type_codes, accommodation_type)
+        key = iso3_code, type_code, name
+        row = self.index.get(key)
+        if row is not None:
+            self.populations[row] += population
+            return row
+        row = len(self.names)
+        self.index[key] = row
+        self.iso3_column.append(iso3_code)
+        self.type_column.append(type_code)
+        kind_code = kinds.index(kind)
+        self.kind_column.append(kind_code)
+        self.names.append(name)
+        self.populations.append(population)
+        if row % 8 == 0:
+            self.consumed.append(0)
+        # The first row with a name and kind gives its type
+        self.type_index.setdefault((name, kind_code), type_code)
+        return row
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, iso3, accommodation_type, name):
+        iso3_code = self.iso3_codes.get(iso3)
+        type_code = self.type_codes.get(accommodation_type)
+        return self.index.get((iso3_code, type_code, name))
+
+    def is_consumed(self, row):
+        return self.consumed[row >> 3] & (1 << (row & 7)) != 0
+
+    def consume(self, iso3, accommodation_type, name):
+        row = self.find(iso3, accommodation_type, name)
+        if row is None:
+            raise KeyError((iso3, accommodation_type, name))
+        self.consumed[row >> 3] |= 1 << (row & 7)
+
+    def get_type(self, name, kind):
+        type_code = self.type_index.get((name, kinds.index(kind)))
+        if type_code is None:
+            return None
+        return self.types[type_code]
+
+    def get_totals(self, kind=None, consume=False):
+        # The population of each country, of all rows or only those of one kind, which can be consumed as they are
+        # added up
+        kind_code = None if kind is None else kinds.index(kind)
+        totals = [0] * len(self.iso3s)
+        seen = bytearray(len(self.iso3s))
+        for row, iso3_code in enumerate(self.iso3_column):
+            if kind_code is not None and self.kind_column[row] != kind_code:
+                continue
+            totals[iso3_code] += self.populations[row]
+            seen[iso3_code] = 1
+            if consume:
+                self.consumed[row >> 3] |= 1 << (row & 7)
+        return {self.iso3s[code]: totals[code] for code in sorted(range(len(self.iso3s)), key=self.iso3s.__getitem__)
+                if seen[code]}
+
+    def get_remaining(self):
+        # The rows not consumed yet by country sorted by accommodation type and name
+        remaining = {iso3: list() for iso3 in self.iso3s}
+        for row, iso3_code in enumerate(self.iso3_column):
+            if self.is_consumed(row):
+                continue
+            remaining[self.iso3s[iso3_code]].append((self.types[self.type_column[row]], self.names[row],
+                                                     self.populations[row]))
+        for camps in remaining.values():
+            camps.sort()
+        return remaining
+
+    def get_nested(self, kind=None):
+        # The rows as dictionaries of country to accommodation type to name to population
+        kind_code = None if kind is None else kinds.index(kind)
+        nested = dict()
+        for row, iso3_code in enumerate(self.iso3_column):
+            if kind_code is not None and self.kind_column[row] != kind_code:
+                continue
+            camps = nested.setdefault(self.iso3s[iso3_code], dict()).setdefault(self.types[self.type_column[row]],
+                                                                                dict())
+            camps[self.names[row]] = self.populations[row]
+        return nested
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Profile
+---------------------
+
+Profiles a run for run.py --profile. Each stage is run under cProfile and its statistics written to <stage>.pstats,
+which can be read with pstats or snakeviz, and the cumulative time of the hot model methods in each stage is logged.
+A sampling thread also takes the stacks of every thread at a fixed interval and writes them to stacks.collapsed, one
+line per distinct stack starting with the stage or thread name, which flamegraph.pl, speedscope or inferno can draw.
+
+"""
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from os import makedirs
+from os.path import basename, join
+from tempfile import gettempdir
+
+logger = logging.getLogger(__name__)
+
+hot_functions = ('calculate_offgrid_solid', 'calculate_regional_average', 'add_keyfigures', 'get_totals')
+
+
+class Profiler:
+    def __init__(self, folder, interval=0.005):
+        self.folder = folder
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stage_threads = dict()
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        makedirs(self.folder, exist_ok=True)
+        self.stopping.clear()
+        self.sampler = threading.Thread(target=self.sample, name='profiler', daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        path = self.write_stacks()
+        logger.info('Written %d stack samples to %s' % (self.samples, path))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def run_stage(self, name, function, *args):
+        ident = threading.get_ident()
+        with self.lock:
+            self.stage_threads[ident] = name
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Only one cProfile can be active at a time from Python 3.12, so a stage running alongside another is
+            # only sampled
+            logger.warning('Stage %s is already being profiled with another stage so only has stack samples' % name)
+            profile = None
+        try:
+            return function(*args)
+        finally:
+            if profile is not None:
+                profile.disable()
+            with self.lock:
+                del self.stage_threads[ident]
+            if profile is not None:
+                self.write_stats(name, profile)
+
+    def write_stats(self, name, profile):
+        path = join(self.folder, '%s.pstats' % name)
+        profile.dump_stats(path)
+        stats = pstats.Stats(profile).stats
+        for function in hot_functions:
+            calls = 0
+            cumulative = 0.0
+            for (_, _, funcname), (_, nc, _, ct, _) in stats.items():
+                if funcname == function:
+                    calls += nc
+                    cumulative += ct
+            if calls:
+                logger.info('Stage %-16s %-28s %8.2fs in %d calls' % (name, function, cumulative, calls))
+
+    def sample(self):
+        ident = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                stage_threads = dict(self.stage_threads)
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_ident, frame in frames.items():
+                if thread_ident == ident:
+                    continue
+                root = stage_threads.get(thread_ident) or thread_names.get(thread_ident, str(thread_ident))
+                self.stacks[(root,) + get_stack(frame)] += 1
+            self.samples += 1
+
+    def write_stacks(self):
+        path = join(self.folder, 'stacks.collapsed')
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('%s %d\n' % (';'.join(stack), count))
+        return path
+
+
+def get_frame_name(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return '%s (%s)' % (name, basename(code.co_filename))
+
+
+def get_stack(frame):
+    stack = list()
+    while frame is not None:
+        stack.append(get_frame_name(frame.f_code).replace(';', ':'))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def get_profile_folder(configuration, started=None):
+    if started is None:
+        started = datetime.utcnow()
+    folder = configuration.get('profile_folder') or join(gettempdir(), 'chathamhouse_profiles')
+    return join(folder, 'run_%s' % started.strftime('%Y%m%dT%H%M%S'))
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Provenance
+------------------------
+
+Says where the values in a row of results came from, like the regional average used for a missing urban ratio, a
+camp matched on the first part of its name or a fallback camp type. Each record is a kind, a region code and a value
+and the records of a row are kept together in a Provenance. Both are immutable and interned, so the rows of every
+tier and country with the same provenance share one object, and they are only turned into the text of the Info column
+when the results are written, for example ur(145)=0.573,elco2(034)=0.42. The interned objects are forgotten at the end
+of each pipeline run so that a long-running service does not keep those of every run.
+
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Kinds whose text is not kind(region)=value
+templates = {'Matched': 'Matched %(value)s', 'Stale': 'Stale %(region)s(%(value)s)'}
+
+
+class ProvenanceRecord(namedtuple('ProvenanceRecord', 'kind region value')):
+    __slots__ = ()
+
+    def __str__(self):
+        template = templates.get(self.kind)
+        if template is not None:
+            return template % self._asdict()
+        if self.value is None:
+            return self.kind
+        return '%s(%s)=%.3g' % self
+
+
+class Provenance:
+    __slots__ = ('records',)
+
+    def __init__(self, records=()):
+        self.records = tuple(records)
+
+    def add(self, record):
+        return get_provenance(self.records + (record,))
+
+    def find(self, kind):
+        return [record for record in self.records if record.kind == kind]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __eq__(self, other):
+        return isinstance(other, Provenance) and self.records == other.records
+
+    def __hash__(self):
+        return hash(self.records)
+
+    def __str__(self):
+        return ','.join(str(record) for record in self.records)
+
+    def __repr__(self):
+        return 'Provenance(%r)' % (self.records,)
+
+    def __getstate__(self):
+        return self.records
+
+    def __setstate__(self, state):
+        self.records = state
+
+
+interned_records = dict()
+interned_provenances = dict()
+
+
+def get_record(kind, region=None, value=None):
+    record = ProvenanceRecord(kind, region, value)
+    return interned_records.setdefault(record, record)
+
+
+def get_provenance(records=()):
+    records = tuple(records)
+    provenance = interned_provenances.get(records)
+    if provenance is None:
+        provenance = interned_provenances.setdefault(records, Provenance(records))
+    return provenance
+
+
+def clear_interned():
+    # Records and provenances already made stay valid, they are just no longer shared with later ones
+    interned_records.clear()
+    interned_provenances.clear()
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Rows
+------------------
+
+Records for the rows of the result tables. Each table has its own class with a slot per column, which takes less
+memory than a list per row and names the columns, and a row still behaves as a sequence so it can be indexed, sliced,
+compared with a list and written as it is. Cells with no value, like the costs of a missing lighting or cooking type,
+hold blank rather than an empty string. The rows of a table can also be turned into columns for the columnar writer.
+
+"""
+import logging
+from operator import attrgetter
+
+logger = logging.getLogger(__name__)
+
+
+class Blank:
+    __slots__ = ()
+    instance = None
+
+    def __new__(cls):
+        if cls.instance is None:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __bool__(self):
+        return False
+
+    def __str__(self):
+        return ''
+
+    def __repr__(self):
+        return 'blank'
+
+    def __eq__(self, other):
+        return other is self or other == ''
+
+    def __hash__(self):
+        return hash('')
+
+    def __reduce__(self):
+        return Blank, ()
+
+
+blank = Blank()
+
+
+class Row:
+    __slots__ = ()
+    fields = ()
+    getter = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.getter = attrgetter(*cls.fields)
+        cls.__init__ = get_init(cls.fields)
+
+    def values(self):
+        return self.getter(self)
+
+    def __iter__(self):
+        return iter(self.getter(self))
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.getter(self)[index])
+        return getattr(self, self.fields[index])
+
+    def __setitem__(self, index, value):
+        setattr(self, self.fields[index], value)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return type(other) is type(self) and self.getter(self) == other.getter(other)
+        if isinstance(other, (list, tuple)):
+            return list(self.getter(self)) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(repr(value) for value in self.getter(self)))
+
+    def __getstate__(self):
+        return self.getter(self)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.fields, state):
+            setattr(self, field, value)
+
+
+def get_init(fields):
+    # Rows are made in the model's inner loops, so like a namedtuple each class gets an __init__ that sets its slots
+    # directly
+    source = 'def __init__(self, %s):\n    %s\n' % (', '.join(fields),
+                                                   '\n    '.join('self.%s = %s' % (field, field) for field in fields))
+    namespace = dict()
+    exec(source, namespace)
+    return namespace['__init__']
+
+
+lighting_fields = ('lighting_type', 'lighting_description', 'lighting_expenditure', 'lighting_capital', 'lighting_co2')
+cooking_fields = ('cooking_type', 'cooking_description', 'cooking_expenditure', 'cooking_capital', 'cooking_co2')
+
+
+class NonCampRow(Row):
+    fields = ('iso3', 'country', 'population', 'tier', 'grid_expenditure', 'grid_co2') + lighting_fields + \
+             ('nonsolid_expenditure', 'nonsolid_co2') + cooking_fields + ('info',)
+    __slots__ = fields
+
+
+class CampRow(Row):
+    fields = ('iso3', 'country', 'camp', 'population', 'tier') + lighting_fields + cooking_fields + ('info',)
+    __slots__ = fields
+
+
+class SmallCampRow(Row):
+    # The small camp table has no Info header but its rows have always ended with the info
+    fields = ('region', 'population', 'tier') + lighting_fields + cooking_fields + ('info',)
+    __slots__ = fields
+
+
+class CountryRow(Row):
+    fields = ('iso3', 'country', 'population')
+    __slots__ = fields
+
+
+class KeyFigureRow(Row):
+    fields = ('iso3', 'country', 'camp', 'tier', 'cooking_expenditure', 'cooking_description', 'pop_nonbiomass',
+              'pop_biomass', 'lighting_expenditure', 'lighting_description', 'pop_grid', 'pop_offgrid')
+    __slots__ = fields
+
+
+class TopLineRow(Row):
+    fields = ('code', 'title', 'value', 'latest_date', 'source', 'source_link', 'notes', 'explore', 'units')
+    __slots__ = fields
+
+
+def get_columns(rows, headers):
+    # Tables with hxl tags have them as their first row. Blank cells become None and the values that are neither
+    # numbers nor text, like provenance, become their text.
+    hxltags = [None] * len(headers)
+    if rows and not isinstance(rows[0], Row):
+        hxltags = rows[0]
+        rows = rows[1:]
+    columns = [list() for _ in headers]
+    for row in rows:
+        for values, value in zip(columns, row):
+            if value is blank:
+                value = None
+            elif value is not None and not isinstance(value, (str, int, float)):
+                value = str(value)
+            values.append(value)
+    return [{'name': header, 'hxl': hxltag, 'values': values}
+            for header, hxltag, values in zip(headers, hxltags, columns)]
@@ -0,0 +1,309 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Service
+---------------------
+
+Long running service that keeps the parsed inputs and model in memory, checks the sources on a schedule with HEAD
+requests and only reruns and publishes when something has changed. A small local HTTP endpoint allows
+other jobs to trigger a run, read the latest results or ask what if questions of the loaded model.
+
+"""
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from tempfile import gettempdir
+from urllib.parse import urlsplit, parse_qs
+
+from hdx.data.dataset import Dataset
+from hdx.utilities.downloader import Download
+
+from chathamhouse.chathamhousediagnostics import Diagnostics
+from chathamhouse.chathamhousedata import get_latest_unhcr_dataset
+from chathamhouse.chathamhousestages import Pipeline, get_stages, input_stage_names, open_download_loop
+from chathamhouse.chathamhousewhatif import WhatIfModel
+
+logger = logging.getLogger(__name__)
+
+source_stages = {'constants_url': 'constants', 'camp_overrides_url': 'constants', 'slum_ratio_url': 'slumratios',
+                 'iea_data_url': 'noncamptables', 'elec_grid_tiers_url': 'noncamptables',
+                 'elec_grid_direct_energy_url': 'noncamptables', 'elec_grid_co2_url': 'noncamptables',
+                 'noncamp_types_url': 'noncamptables', 'costs_url': 'noncamptables',
+                 'noncamp_cooking_nonsolid_url': 'noncamptables', 'type_descriptions_url': 'descriptions',
+                 'camp_types_url': 'camptables', 'camp_types_fallbacks_url': 'camptables',
+                 'small_camptypes_url': 'smallcamptables', 'small_camps_data_url': 'smallcamptables'}
+
+
+class SourceMonitor:
+    def __init__(self, configuration, timeout=60):
+        self.configuration = configuration
+        self.timeout = timeout
+        self.validators = dict()
+
+    def get_urls(self):
+        urls = dict()
+        for key in sorted(source_stages):
+            urls[self.configuration[key]] = source_stages[key]
+        world_bank_url = self.configuration['world_bank_url']
+        for key in ('urban_ratio_wb', 'urban_elec_wb', 'rural_elec_wb'):
+            urls[world_bank_url % self.configuration[key]] = 'worldbank'
+        datasets = Dataset.search_in_hdx('displacement', fq='organization:unhcr')
+        urls[get_latest_unhcr_dataset(datasets).get_resources()[0]['url']] = 'populations'
+        return urls
+
+    def has_changed(self, session, url):
+        # A HEAD request is enough when the source gives an ETag, Last-Modified or Content-Length. Only when it gives
+        # none of them is the content downloaded and hashed.
+        validators = self.validators.get(url, dict())
+        response = session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.close()
+        if response.ok:
+            headers = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                       'length': response.headers.get('Content-Length')}
+            if any(headers.values()):
+                self.validators[url] = headers
+                return validators != headers
+        response = session.get(url, stream=True, timeout=self.timeout)
+        try:
+            response.raise_for_status()
+            md5hash = hashlib.md5()
+            for chunk in response.iter_content(chunk_size=10240):
+                md5hash.update(chunk)
+        finally:
+            response.close()
+        md5 = md5hash.hexdigest()
+        self.validators[url] = {'md5': md5}
+        return validators.get('md5') != md5
+
+    def check(self):
+        changed = set()
+        with Download() as downloader:
+            for url, stage_name in self.get_urls().items():
+                try:
+                    if self.has_changed(downloader.session, url):
+                        logger.info('Source %s has changed' % url)
+                        changed.add(stage_name)
+                except Exception:
+                    logger.exception('Could not check source %s!' % url)
+        return changed
+
+
+class SnapshotPipeline(Pipeline):
+    def __init__(self, stages, snapshots, snapshot_stages, **kwargs):
+        super(SnapshotPipeline, self).__init__(stages, **kwargs)
+        self.snapshots = snapshots
+        self.snapshot_stages = snapshot_stages
+
+    def run_stage(self, stage, context):
+        outputs = super(SnapshotPipeline, self).run_stage(stage, context)
+        # Later stages modify some of these outputs in place so keep an untouched copy for the next run
+        if stage.name in self.snapshot_stages:
+            self.snapshots[stage.name] = pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL)
+        return outputs
+
+
+class ChathamHouseService:
+    def __init__(self, configuration, stages=None, monitor=None, refresh_seconds=3600, folder=None,
+                 snapshot_stages=input_stage_names, max_workers=1):
+        self.configuration = configuration
+        if stages is None:
+            stages = get_stages()
+        self.stages = stages
+        if monitor is None:
+            monitor = SourceMonitor(configuration)
+        self.monitor = monitor
+        self.refresh_seconds = refresh_seconds
+        if folder is None:
+            folder = gettempdir()
+        self.folder = folder
+        self.snapshot_stages = snapshot_stages
+        self.max_workers = max_workers
+        self.snapshots = dict()
+        self.context = None
+        self.whatif = None
+        self.last_check = None
+        self.last_run = None
+        self.last_error = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.trigger = threading.Event()
+        self.force = False
+        self.stopping = False
+
+    def get_completed(self, changed):
+        dependencies = Pipeline(self.stages).get_dependencies()
+        completed = list()
+        rerun = set()
+        for stage in self.stages:
+            if stage.name in changed or stage.name not in self.snapshots or dependencies[stage.name] & rerun:
+                rerun.add(stage.name)
+            else:
+                completed.append(stage.name)
+        return completed
+
+    def refresh(self, force=False):
+        changed = self.monitor.check()
+        self.last_check = datetime.utcnow()
+        if not changed and not force and self.context is not None:
+            logger.info('No source has changed')
+            return False
+        completed = self.get_completed(changed)
+        context = {'configuration': self.configuration, 'today': datetime.utcnow(), 'folder': self.folder}
+        for name in completed:
+            context.update(pickle.loads(self.snapshots[name]))
+        self.running = True
+        try:
+            pipeline = SnapshotPipeline(self.stages, self.snapshots, self.snapshot_stages,
+                                        max_workers=self.max_workers)
+            with Diagnostics() as diagnostics, open_download_loop(self.configuration):
+                pipeline.run(context, completed=list(completed))
+            diagnostics.log_summary()
+        finally:
+            self.running = False
+        whatif = None
+        if 'constants' in context:
+            whatif = WhatIfModel(context)
+        with self.lock:
+            self.context = context
+            self.whatif = whatif
+            self.last_run = context['today']
+        return True
+
+    def get_status(self):
+        return {'last_check': self.last_check, 'last_run': self.last_run, 'running': self.running,
+                'last_error': self.last_error}
+
+    def get_table(self, name=None):
+        with self.lock:
+            if self.context is None:
+                return None
+            headers = self.context['headers']
+            results = self.context['results']
+            if name is None:
+                index = len(results) - 1
+            else:
+                names = [resource['name'] for resource in self.context['resources']]
+                if name not in names:
+                    return None
+                index = names.index(name)
+            rows = [list(row) for row in results[index]]
+            return {'last_run': self.last_run, 'headers': headers[index], 'rows': rows}
+
+    def get_whatif(self, query_type, body):
+        with self.lock:
+            whatif = self.whatif
+        if whatif is None:
+            return None
+        if query_type == 'batch':
+            return {'results': whatif.batch(body['queries'])}
+        body['type'] = query_type
+        return {'rows': whatif.query(body)}
+
+    def request_run(self, force=False):
+        self.force = self.force or force
+        self.trigger.set()
+
+    def run_forever(self):
+        self.request_run(force=True)
+        while not self.stopping:
+            self.trigger.wait(self.refresh_seconds)
+            if self.stopping:
+                break
+            force = self.force
+            self.force = False
+            self.trigger.clear()
+            try:
+                self.refresh(force=force)
+                self.last_error = None
+            except Exception as e:
+                logger.exception('Refresh failed!')
+                self.last_error = str(e)
+
+    def stop(self):
+        self.stopping = True
+        self.trigger.set()
+
+    def create_server(self, host, port):
+        return ServiceHTTPServer((host, port), ServiceRequestHandler, self)
+
+    def serve(self, host, port):
+        server = self.create_server(host, port)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logger.info('Serving on http://%s:%d' % server.server_address)
+        try:
+            self.run_forever()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class ServiceHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, service):
+        HTTPServer.__init__(self, server_address, handler_class)
+        self.service = service
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        body = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlsplit(self.path).path.rstrip('/')
+        if path == '/status':
+            self.send_json(200, service.get_status())
+        elif path == '/results':
+            table = service.get_table()
+            if table is None:
+                self.send_json(404, {'error': 'No results yet'})
+            else:
+                self.send_json(200, table)
+        elif path.startswith('/results/'):
+            table = service.get_table(path[len('/results/'):])
+            if table is None:
+                self.send_json(404, {'error': 'No such results'})
+            else:
+                self.send_json(200, table)
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % path})
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        if path == '/run':
+            force = parse_qs(url.query).get('force', ['false'])[0].lower() in ('1', 'true', 'yes')
+            service.request_run(force=force)
+            self.send_json(202, {'requested': True, 'force': force})
+        elif path in ('/whatif/camp', '/whatif/country', '/whatif/batch'):
+            try:
+                result = service.get_whatif(path[len('/whatif/'):], self.read_json())
+            except (KeyError, TypeError, ValueError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            if result is None:
+                self.send_json(404, {'error': 'No model loaded yet'})
+            else:
+                self.send_json(200, result)
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % url.path})
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s' % (self.address_string(), format % args))
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Sources
+---------------------
+
+Guards the input loaders against slow or failing sources. Each source has a deadline and a circuit breaker. When a
+source misses its deadline, fails or has tripped its breaker, the last good copy of its parsed outputs is used
+instead, the rows depending on it are flagged in the Info column and the source is refreshed in the background so
+that the copy is up to date for next time.
+
+"""
+import json
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime
+from os import makedirs, replace
+from os.path import exists, join
+from tempfile import gettempdir
+
+from chathamhouse.chathamhouseprovenance import get_record
+
+logger = logging.getLogger(__name__)
+
+# Sources that only feed some of the tables. The others (constants, cost and type tables) feed all of them.
+source_pop_types = {'worldbank': ('Urban', 'Slum', 'Rural'), 'slumratios': ('Urban', 'Slum', 'Rural'),
+                    'camptables': ('Camp',), 'smallcamptables': ('Small Camp',)}
+
+
+class SourceGuard:
+    def __init__(self, folder, deadlines=None, failure_threshold=3, reset_seconds=86400):
+        self.folder = folder
+        if deadlines is None:
+            deadlines = dict()
+        self.deadlines = deadlines
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.lock = threading.Lock()
+        self.refreshes = dict()
+        makedirs(folder, exist_ok=True)
+
+    def get_deadline(self, name):
+        return self.deadlines.get(name, self.deadlines.get('default'))
+
+    def get_path(self, name):
+        return join(self.folder, '%s.pkl' % name)
+
+    def load_last_good(self, name):
+        path = self.get_path(name)
+        if not exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save_last_good(self, name, outputs):
+        path = self.get_path(name)
+        tmppath = '%s.%s.tmp' % (path, threading.get_ident())
+        with open(tmppath, 'wb') as f:
+            pickle.dump({'saved': datetime.utcnow(), 'outputs': outputs}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmppath, path)
+
+    def get_breakers_path(self):
+        return join(self.folder, 'breakers.json')
+
+    def load_breakers(self):
+        path = self.get_breakers_path()
+        if not exists(path):
+            return dict()
+        with open(path) as f:
+            return json.load(f)
+
+    def save_breakers(self, breakers):
+        path = self.get_breakers_path()
+        tmppath = '%s.tmp' % path
+        with open(tmppath, 'w') as f:
+            json.dump(breakers, f, indent=2, sort_keys=True)
+        replace(tmppath, path)
+
+    def is_open(self, name):
+        with self.lock:
+            breaker = self.load_breakers().get(name)
+        if breaker is None or breaker['failures'] < self.failure_threshold:
+            return False
+        # Once reset_seconds have passed the source is tried again and the breaker closes if it succeeds
+        return time.time() - breaker['last_failure'] < self.reset_seconds
+
+    def record_failure(self, name):
+        with self.lock:
+            breakers = self.load_breakers()
+            breaker = breakers.setdefault(name, {'failures': 0})
+            breaker['failures'] += 1
+            breaker['last_failure'] = time.time()
+            self.save_breakers(breakers)
+        if breaker['failures'] == self.failure_threshold:
+            logger.warning('Circuit breaker for source %s is open after %d failures' % (name, breaker['failures']))
+
+    def record_success(self, name):
+        with self.lock:
+            breakers = self.load_breakers()
+            if breakers.pop(name, None) is None:
+                return
+            self.save_breakers(breakers)
+
+    def start(self, name, loader, configuration):
+        # A source still being fetched from an earlier call is not fetched again
+        with self.lock:
+            future = self.refreshes.get(name)
+            if future is not None and not future.done():
+                return future
+            future = Future()
+            self.refreshes[name] = future
+
+        def target():
+            start = time.time()
+            try:
+                outputs = loader(configuration)
+            except Exception as e:
+                self.record_failure(name)
+                future.set_exception(e)
+                return
+            self.save_last_good(name, outputs)
+            # A source that only finishes after its deadline is still too slow, so its breaker stays as it is
+            deadline = self.get_deadline(name)
+            if deadline is None or time.time() - start <= deadline:
+                self.record_success(name)
+            future.set_result(outputs)
+
+        threading.Thread(target=target, name='source-%s' % name, daemon=True).start()
+        return future
+
+    @staticmethod
+    def get_status(last_good, reason):
+        return {'stale': True, 'reason': reason, 'saved': last_good['saved'].isoformat()}
+
+    def load(self, name, loader, configuration):
+        last_good = self.load_last_good(name)
+        if last_good is None:
+            # Without a copy to fall back on there is nothing to do but wait for the source
+            future = self.start(name, loader, configuration)
+            return future.result(), {'stale': False}
+        if self.is_open(name):
+            logger.warning('Circuit breaker for source %s is open, using copy saved %s' % (name, last_good['saved']))
+            self.start(name, loader, configuration)
+            return last_good['outputs'], self.get_status(last_good, 'circuit open')
+        future = self.start(name, loader, configuration)
+        deadline = self.get_deadline(name)
+        try:
+            return future.result(timeout=deadline), {'stale': False}
+        except TimeoutError:
+            self.record_failure(name)
+            logger.warning('Source %s missed its deadline of %ss, using copy saved %s and refreshing in the background'
+                           % (name, deadline, last_good['saved']))
+            return last_good['outputs'], self.get_status(last_good, 'deadline')
+        except Exception:
+            logger.exception('Source %s failed, using copy saved %s' % (name, last_good['saved']))
+            self.start(name, loader, configuration)
+            return last_good['outputs'], self.get_status(last_good, 'error')
+
+    def wait(self, timeout=None):
+        with self.lock:
+            futures = [future for future in self.refreshes.values() if not future.done()]
+        if not futures:
+            return
+        logger.info('Waiting for %d sources to finish refreshing' % len(futures))
+        end = None if timeout is None else time.time() + timeout
+        for future in futures:
+            remaining = None if end is None else max(end - time.time(), 0)
+            try:
+                future.result(timeout=remaining)
+            except TimeoutError:
+                logger.warning('Stopped waiting for sources to refresh after %ss' % timeout)
+                return
+            except Exception:
+                pass
+
+
+source_guards = dict()
+source_guards_lock = threading.Lock()
+
+
+def get_source_guard(configuration):
+    # Guards are kept per folder so that background refreshes carry over between runs of a long running process
+    deadlines = configuration.get('source_deadlines')
+    if not deadlines:
+        return None
+    folder = configuration.get('source_cache_folder') or join(gettempdir(), 'chathamhouse_sources')
+    with source_guards_lock:
+        guard = source_guards.get(folder)
+        if guard is None:
+            guard = SourceGuard(folder, deadlines, configuration.get('source_failure_threshold', 3),
+                                configuration.get('source_reset_seconds', 86400))
+            source_guards[folder] = guard
+    return guard
+
+
+def guard_loader(name, loader):
+    def load(configuration):
+        guard = get_source_guard(configuration)
+        if guard is None:
+            outputs, status = loader(configuration), {'stale': False}
+        else:
+            outputs, status = guard.load(name, loader, configuration)
+        outputs = dict(outputs)
+        outputs['source_%s' % name] = status
+        return outputs
+    return load
+
+
+def flag_stale_sources(pop_types, results, **sources):
+    source_status = dict()
+    for key in sorted(sources):
+        status = sources[key]
+        if not status['stale']:
+            continue
+        name = key[len('source_'):]
+        source_status[name] = status
+        flag = get_record('Stale', name, status['saved'][:10])
+        logger.warning('Source %s is stale (%s), using copy saved %s' % (name, status['reason'], status['saved']))
+        for pop_type in source_pop_types.get(name, pop_types):
+            if pop_type not in pop_types:
+                continue
+            for row in results[pop_types.index(pop_type)][1:]:
+                row[-1] = row[-1].add(flag)
+    return {'results': results, 'source_status': source_status}
@@ -0,0 +1,859 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House Stages
+--------------------
+
+Splits a Chatham House run into named stages with explicit inputs and outputs. The outputs of each stage can be
+cached on disk keyed by its inputs so that later stages can be rerun without downloading and parsing everything again.
+Checkpoints saved after the input and model stages allow a failed run to be resumed. Stages can also be run
+concurrently, each starting as soon as the stages producing its inputs have finished.
+
+"""
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import partial
+from os import listdir, makedirs, remove, replace
+from os.path import abspath, dirname, exists, join
+from tempfile import gettempdir
+
+from hdx.utilities.dictandlist import avg_dicts, float_value_convert, key_value_convert, integer_value_convert
+from hdx.location.country import Country
+
+from chathamhouse.chathamhousedata import get_latest_unhcr_dataset, get_unhcr_populations, get_worldbank_indicators, \
+    get_slumratios_and_years, get_camptypes, generate_dataset_resources_and_showcase, check_name_dispersed, append_value, \
+    get_camptypes_fallbacks, get_iso3
+from chathamhouse.chathamhousediagnostics import record
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhouseoutput import write_columnar_resources, write_resource, write_resource_files
+from chathamhouse.chathamhouseprovenance import clear_interned, get_provenance, get_record
+from chathamhouse.chathamhouserows import CampRow, CountryRow, NonCampRow, SmallCampRow, TopLineRow, blank
+from chathamhouse.chathamhousesources import flag_stale_sources, guard_loader
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    def __init__(self, name, function, inputs, outputs, cache=True, checkpoint=False):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cache = cache
+        self.checkpoint = checkpoint
+
+
+class Pipeline:
+    def __init__(self, stages, cache_folder=None, rerun=None, checkpoint_folder=None, resume=False, max_workers=1,
+                 instrumentation=None, profiler=None):
+        self.stages = stages
+        self.cache_folder = cache_folder
+        self.checkpoint_folder = checkpoint_folder
+        self.resume = resume
+        if rerun is None:
+            rerun = list()
+        for name in rerun:
+            if name not in self.get_stage_names():
+                raise ValueError('Unknown stage %s!' % name)
+        self.rerun = rerun
+        self.code_key = None
+        self.keys = dict()
+        self.dirty = set()
+        self.max_workers = max_workers
+        self.start_time = None
+        self.timeline = list()
+        self.instrumentation = instrumentation
+        self.profiler = profiler
+
+    def get_stage_names(self):
+        return [stage.name for stage in self.stages]
+
+    @staticmethod
+    def get_code_key():
+        hasher = hashlib.sha256()
+        folder = dirname(abspath(__file__))
+        for filename in sorted(listdir(folder)):
+            if filename.endswith('.py'):
+                with open(join(folder, filename), 'rb') as f:
+                    hasher.update(f.read())
+        return hasher.hexdigest()
+
+    def set_initial_keys(self, context):
+        for name in context:
+            if name in self.keys:
+                continue
+            hasher = hashlib.sha256(self.code_key.encode('utf-8'))
+            hasher.update(pickle.dumps(context[name], protocol=pickle.HIGHEST_PROTOCOL))
+            self.keys[name] = hasher.hexdigest()
+
+    def get_key(self, stage):
+        # A stage is keyed by the keys of its inputs which are either hashes of the initial values or the keys of the
+        # stages that produced them, so no large intermediate structures need to be hashed
+        hasher = hashlib.sha256(stage.name.encode('utf-8'))
+        for name in stage.inputs:
+            hasher.update(name.encode('utf-8'))
+            hasher.update(self.keys[name].encode('utf-8'))
+        return hasher.hexdigest()
+
+    def is_forced(self, stage):
+        if stage.name in self.rerun:
+            return True
+        for name in stage.inputs:
+            if name in self.dirty:
+                return True
+        return False
+
+    def call_stage(self, stage, context):
+        kwargs = dict()
+        for name in stage.inputs:
+            kwargs[name] = context[name]
+        outputs = stage.function(**kwargs)
+        if outputs is None:
+            outputs = dict()
+        if sorted(outputs) != sorted(stage.outputs):
+            raise ValueError('Stage %s returned %s instead of %s!' % (stage.name, ', '.join(sorted(outputs)),
+                                                                     ', '.join(sorted(stage.outputs))))
+        return outputs
+
+    def run_stage(self, stage, context):
+        key = self.get_key(stage)
+        path = None
+        if self.cache_folder and stage.cache:
+            path = join(self.cache_folder, '%s-%s.pkl' % (stage.name, key))
+        forced = self.is_forced(stage)
+        if forced:
+            self.dirty.update(stage.outputs)
+        for name in stage.outputs:
+            self.keys[name] = key
+        if path and not forced and exists(path):
+            logger.info('Using cached outputs of stage %s' % stage.name)
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        logger.info('Running stage %s' % stage.name)
+        outputs = self.call_stage(stage, context)
+        if path:
+            makedirs(self.cache_folder, exist_ok=True)
+            tmppath = '%s.tmp' % path
+            with open(tmppath, 'wb') as f:
+                pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            replace(tmppath, path)
+        return outputs
+
+    def get_checkpoint_path(self):
+        return join(self.checkpoint_folder, 'checkpoint.pkl')
+
+    def save_checkpoint(self, completed, context):
+        makedirs(self.checkpoint_folder, exist_ok=True)
+        path = self.get_checkpoint_path()
+        tmppath = '%s.tmp' % path
+        checkpoint = {'code_key': self.code_key, 'completed': completed, 'context': context, 'keys': self.keys,
+                      'dirty': self.dirty}
+        with open(tmppath, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmppath, path)
+        logger.info('Saved checkpoint after stage %s' % completed[-1])
+
+    def load_checkpoint(self):
+        path = self.get_checkpoint_path()
+        if not exists(path):
+            logger.info('No checkpoint to resume from in %s' % self.checkpoint_folder)
+            return None
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint['code_key'] != self.code_key:
+            logger.warning('Ignoring checkpoint in %s as the code has changed since it was saved!' %
+                           self.checkpoint_folder)
+            return None
+        logger.info('Resuming after stage %s' % checkpoint['completed'][-1])
+        return checkpoint
+
+    def remove_checkpoint(self):
+        path = self.get_checkpoint_path()
+        if exists(path):
+            remove(path)
+
+    def get_dependencies(self):
+        # A stage waits for every earlier stage producing one of its inputs and, as some stages update their inputs
+        # in place, for every earlier stage reading or producing one of its outputs
+        dependencies = dict()
+        for i, stage in enumerate(self.stages):
+            depends = set()
+            for earlier in self.stages[:i]:
+                if set(stage.inputs) & set(earlier.outputs) or \
+                        set(stage.outputs) & (set(earlier.inputs) | set(earlier.outputs)):
+                    depends.add(earlier.name)
+            dependencies[stage.name] = depends
+        return dependencies
+
+    @staticmethod
+    def is_updating(stage):
+        return bool(set(stage.inputs) & set(stage.outputs))
+
+    def time_stage(self, stage, context):
+        start = time.perf_counter() - self.start_time
+        function = self.run_stage
+        for recorder in (self.profiler, self.instrumentation):
+            if recorder is not None:
+                function = partial(recorder.run_stage, stage.name, function)
+        outputs = function(stage, context)
+        self.timeline.append({'stage': stage.name, 'start': start, 'end': time.perf_counter() - self.start_time,
+                              'thread': threading.current_thread().name})
+        return outputs
+
+    def log_timeline(self, width=40):
+        if not self.timeline:
+            return
+        total = max(entry['end'] for entry in self.timeline) or 1.0
+        logger.info('Stage timeline (%.2fs):' % total)
+        for entry in sorted(self.timeline, key=lambda x: x['start']):
+            offset = int(entry['start'] / total * width)
+            length = max(int(entry['end'] / total * width) - offset, 1)
+            logger.info('%-16s %8.2fs %8.2fs |%s%s%s| %s' % (entry['stage'], entry['start'], entry['end'],
+                                                             ' ' * offset, '#' * length,
+                                                             ' ' * (width - offset - length), entry['thread']))
+
+    def run_serially(self, context, completed):
+        for stage in self.stages:
+            if stage.name in completed:
+                continue
+            context.update(self.time_stage(stage, context))
+            completed.append(stage.name)
+            if self.checkpoint_folder and stage.checkpoint:
+                self.save_checkpoint(completed, context)
+
+    def run_concurrently(self, context, completed):
+        dependencies = self.get_dependencies()
+        pending = [stage for stage in self.stages if stage.name not in completed]
+        running = dict()
+        checkpoint_due = False
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as executor:
+            while pending or running:
+                # A checkpoint is only consistent when no stage that updates its inputs in place is running
+                if checkpoint_due and not any(self.is_updating(stage) for stage in running.values()):
+                    self.save_checkpoint(completed, context)
+                    checkpoint_due = False
+                for stage in list(pending):
+                    if len(running) == self.max_workers:
+                        break
+                    if not dependencies[stage.name].issubset(completed):
+                        continue
+                    if checkpoint_due and self.is_updating(stage):
+                        continue
+                    inputs = {name: context[name] for name in stage.inputs}
+                    running[executor.submit(self.time_stage, stage, inputs)] = stage
+                    pending.remove(stage)
+                if not running:
+                    raise ValueError('Stages %s cannot be run!' % ', '.join(stage.name for stage in pending))
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    context.update(future.result())
+                    completed.append(stage.name)
+                    if self.checkpoint_folder and stage.checkpoint:
+                        checkpoint_due = True
+        if checkpoint_due:
+            self.save_checkpoint(completed, context)
+
+    def run(self, context, completed=None):
+        self.code_key = self.get_code_key()
+        if completed is None:
+            completed = list()
+        if self.checkpoint_folder and self.resume:
+            checkpoint = self.load_checkpoint()
+            if checkpoint:
+                completed = checkpoint['completed']
+                context.update(checkpoint['context'])
+                self.keys = checkpoint['keys']
+                self.dirty = checkpoint['dirty']
+        self.set_initial_keys(context)
+        self.start_time = time.perf_counter()
+        self.timeline = list()
+        try:
+            if self.max_workers > 1:
+                self.run_concurrently(context, completed)
+            else:
+                self.run_serially(context, completed)
+        finally:
+            clear_interned()
+        if self.checkpoint_folder:
+            self.remove_checkpoint()
+        self.log_timeline()
+        return context
+
+
+def open_downloader(configuration, urls):
+    # The download modules are only imported when inputs are downloaded, not when running from saved inputs
+    from chathamhouse.chathamhouseasyncdownload import open_downloader
+    return open_downloader(configuration, urls)
+
+
+def open_download_loop(configuration):
+    # With async_downloads set, the loaders of a run share one event loop and session
+    from chathamhouse.chathamhouseasyncdownload import get_download_loop
+    return get_download_loop(configuration) or nullcontext()
+
+
+def get_urls(configuration, *keys):
+    return [configuration[key] for key in keys]
+
+
+def load_constants(configuration):
+    urls = get_urls(configuration, 'constants_url', 'camp_overrides_url')
+    with open_downloader(configuration, urls) as downloader:
+        constants = float_value_convert(downloader.download_tabular_key_value(configuration['constants_url']))
+        constants['Lighting Grid Tier'] = int(constants['Lighting Grid Tier'])
+
+        camp_overrides = downloader.download_tabular_cols_as_dicts(configuration['camp_overrides_url'])
+        camp_overrides['Population'] = integer_value_convert(camp_overrides['Population'], dropfailedvalues=True)
+        camp_overrides['Country'] = key_value_convert(camp_overrides['Country'], valuefn=get_iso3)
+    return {'constants': constants, 'camp_overrides': camp_overrides}
+
+
+def load_worldbank(configuration):
+    world_bank_url = configuration['world_bank_url']
+    urls = [world_bank_url % configuration[key] for key in ('urban_ratio_wb', 'urban_elec_wb', 'rural_elec_wb')]
+    cache_folder = configuration.get('world_bank_cache_folder') or join(gettempdir(), 'chathamhouse_worldbank')
+    series = get_worldbank_indicators(urls, partial(open_downloader, configuration), cache_folder,
+                                      configuration.get('world_bank_cache_seconds'))
+    urbanratios = series[urls[0]]
+
+    noncamp_elec_access = dict()
+    noncamp_elec_access['Urban'] = series[urls[1]]
+    noncamp_elec_access['Rural'] = series[urls[2]]
+    noncamp_elec_access['Slum'] = avg_dicts(noncamp_elec_access['Rural'], noncamp_elec_access['Urban'])
+    return {'urbanratios': urbanratios, 'noncamp_elec_access': noncamp_elec_access}
+
+
+def load_slumratios(configuration):
+    urls = get_urls(configuration, 'slum_ratio_url')
+    with open_downloader(configuration, urls) as downloader:
+        slumratios, slumratio_years = get_slumratios_and_years(configuration['slum_ratio_url'], downloader)
+    for year in sorted(set(slumratio_years.values()), reverse=True):
+        countries = sorted(iso3 for iso3 in slumratio_years if slumratio_years[iso3] == year)
+        logger.info('Slum ratios from %d for %d countries: %s' % (year, len(countries), ', '.join(countries)))
+    return {'slumratios': slumratios, 'slumratio_years': slumratio_years}
+
+
+def load_noncamp_tables(configuration):
+    urls = get_urls(configuration, 'iea_data_url', 'elec_grid_tiers_url', 'elec_grid_direct_energy_url',
+                    'elec_grid_co2_url', 'noncamp_types_url', 'costs_url', 'noncamp_cooking_nonsolid_url')
+    with open_downloader(configuration, urls) as downloader:
+        ieadata = downloader.download_tabular_cols_as_dicts(configuration['iea_data_url'])
+        elecappliances = key_value_convert(ieadata['Electrical Appliances'], keyfn=get_iso3, valuefn=float,
+                                           dropfailedkeys=True)
+        cookinglpg = key_value_convert(ieadata['Cooking LPG'], keyfn=get_iso3, valuefn=float, dropfailedkeys=True)
+        elecgridtiers = key_value_convert(downloader.download_tabular_key_value(configuration['elec_grid_tiers_url']), keyfn=int, valuefn=float)
+        elecgriddirectenergy = float_value_convert(downloader.download_tabular_key_value(configuration['elec_grid_direct_energy_url']))
+        elecgridco2 = key_value_convert(downloader.download_tabular_key_value(configuration['elec_grid_co2_url']),
+                                        keyfn=get_iso3, valuefn=float, dropfailedkeys=True)
+
+        noncamptypes = downloader.download_tabular_cols_as_dicts(configuration['noncamp_types_url'])
+        noncamplightingoffgridtypes = integer_value_convert(noncamptypes['Lighting OffGrid'])
+        noncampcookingsolidtypes = integer_value_convert(noncamptypes['Cooking Solid'])
+
+        costs = downloader.download_tabular_cols_as_dicts(configuration['costs_url'])
+        lightingoffgridcost = float_value_convert(costs['Lighting OffGrid'])
+        cookingsolidcost = float_value_convert(costs['Cooking Solid'])
+
+        noncamp_nonsolid_access = downloader.download_tabular_cols_as_dicts(configuration['noncamp_cooking_nonsolid_url'])
+        noncamp_nonsolid_access['Urban'] = key_value_convert(noncamp_nonsolid_access['Urban'],
+                                                     keyfn=get_iso3, valuefn=float, dropfailedkeys=True)
+        noncamp_nonsolid_access['Rural'] = key_value_convert(noncamp_nonsolid_access['Rural'],
+                                                     keyfn=get_iso3, valuefn=float, dropfailedkeys=True)
+        noncamp_nonsolid_access['Slum'] = noncamp_nonsolid_access['Urban']
+    return {'elecappliances': elecappliances, 'cookinglpg': cookinglpg, 'elecgridtiers': elecgridtiers,
+            'elecgriddirectenergy': elecgriddirectenergy, 'elecgridco2': elecgridco2,
+            'noncamplightingoffgridtypes': noncamplightingoffgridtypes,
+            'noncampcookingsolidtypes': noncampcookingsolidtypes, 'lightingoffgridcost': lightingoffgridcost,
+            'cookingsolidcost': cookingsolidcost, 'noncamp_nonsolid_access': noncamp_nonsolid_access}
+
+
+def load_descriptions(configuration):
+    urls = get_urls(configuration, 'type_descriptions_url')
+    with open_downloader(configuration, urls) as downloader:
+        type_descriptions = downloader.download_tabular_cols_as_dicts(configuration['type_descriptions_url'])
+        lighting_type_descriptions = type_descriptions['Lighting Descriptions']
+        cooking_type_descriptions = type_descriptions['Cooking Descriptions']
+    return {'lighting_type_descriptions': lighting_type_descriptions,
+            'cooking_type_descriptions': cooking_type_descriptions}
+
+
+def load_camp_tables(configuration):
+    urls = get_urls(configuration, 'camp_types_url', 'camp_types_fallbacks_url')
+    with open_downloader(configuration, urls) as downloader:
+        camptypes = get_camptypes(configuration['camp_types_url'], downloader)
+        camptypes_fallbacks_offgrid, camptypes_fallbacks_solid = \
+            get_camptypes_fallbacks(configuration['camp_types_fallbacks_url'], downloader, keyfn=get_iso3)
+    return {'camptypes': camptypes, 'camptypes_fallbacks_offgrid': camptypes_fallbacks_offgrid,
+            'camptypes_fallbacks_solid': camptypes_fallbacks_solid}
+
+
+def load_small_camp_tables(configuration):
+    urls = get_urls(configuration, 'small_camptypes_url', 'small_camps_data_url')
+    with open_downloader(configuration, urls) as downloader:
+        small_camptypes = get_camptypes(configuration['small_camptypes_url'], downloader)
+        small_camp_data = downloader.download_tabular_cols_as_dicts(configuration['small_camps_data_url'])
+        smallcamps = float_value_convert(small_camp_data['Population'])
+        small_camps_elecgridco2 = float_value_convert(small_camp_data['Electricity Grid CO2'])
+    return {'small_camptypes': small_camptypes, 'smallcamps': smallcamps,
+            'small_camps_elecgridco2': small_camps_elecgridco2}
+
+
+input_loaders = (load_constants, load_worldbank, load_slumratios, load_noncamp_tables, load_descriptions,
+                 load_camp_tables, load_small_camp_tables)
+
+
+def download_inputs(configuration):
+    inputs = dict()
+    for loader in input_loaders:
+        inputs.update(loader(configuration))
+    return inputs
+
+
+def parse_populations(constants, camp_overrides):
+    from hdx.data.dataset import Dataset
+
+    datasets = Dataset.search_in_hdx('displacement', fq='organization:unhcr')
+    url = get_latest_unhcr_dataset(datasets).get_resources()[0]['url']
+    return parse_unhcr_populations(constants, camp_overrides, url)
+
+
+def parse_unhcr_populations(constants, camp_overrides, url):
+    from chathamhouse.chathamhouseasyncdownload import MeteredDownload
+
+    with MeteredDownload() as downloader:
+        unhcr_populations, unhcr_camp = get_unhcr_populations(constants['Non Camp Types'], constants['Camp Types'],
+                                                              camp_overrides, url, downloader)
+    return {'unhcr_populations': unhcr_populations, 'unhcr_camp': unhcr_camp,
+            'country_totals': unhcr_populations.get_totals()}
+
+
+def create_tables(constants):
+    model = ChathamHouseModel(constants)
+    pop_types = ['Urban', 'Slum', 'Rural', 'Camp', 'Small Camp']
+    headers = list()
+    results = list()
+
+    for i, pop_type in enumerate(pop_types):
+        results.append(list())
+        if pop_type == 'Camp':
+            headers.append(['ISO3 Country Code', 'Country Name', 'Camp Name'])
+            hxlheaders = ['#country+code', '#country+name', '#loc+name']
+        elif pop_type == 'Small Camp':
+            headers.append(['Region'])
+            hxlheaders = ['#region+name']
+        else:
+            headers.append(['ISO3 Country Code', 'Country Name'])
+            hxlheaders = ['#country+code', '#country+name']
+        headers[-1].extend(['Population', 'Tier'])
+        hxlheaders.extend(['#population+num', '#indicator+tier'])
+        if pop_type not in ['Camp', 'Small Camp']:
+            headers[-1].extend(['Grid Expenditure ($m/yr)', 'Grid CO2 Emissions (t/yr)'])
+            hxlheaders.extend(['#indicator+value+grid+expenditure', '#indicator+value+grid+co2_emissions'])
+        headers[-1].extend(['Offgrid Type', 'Lighting Type Description', 'Offgrid Expenditure ($m/yr)',
+                            'Offgrid Capital Costs ($m)', 'Offgrid CO2 Emissions (t/yr)'])
+        hxlheaders.extend(['#indicator+type+offgrid', '#indicator+text+lighting', '#indicator+value+offgrid+expenditure',
+                           '#indicator+value+offgrid+capital_costs', '#indicator+value+offgrid+co2_emissions'])
+        if pop_type not in ['Camp', 'Small Camp']:
+            headers[-1].extend(['Nonsolid Expenditure ($m/yr)', 'Nonsolid CO2 Emissions (t/yr)'])
+            hxlheaders.extend(['#indicator+value+nonsolid+expenditure', '#indicator+value+nonsolid+co2_emissions'])
+        headers[-1].extend(['Solid Type', 'Cooking Type Description', 'Solid Expenditure ($m/yr)',
+                            'Solid Capital Costs ($m)', 'Solid CO2_Emissions (t/yr)'])
+        hxlheaders.extend(['#indicator+type+solid', '#indicator+text+cooking', '#indicator+value+solid+expenditure',
+                           '#indicator+value+solid+capital_costs', '#indicator+value+solid+co2_emissions'])
+        if pop_type != 'Small Camp':
+            headers[-1].append('Info')
+            hxlheaders.append('#meta+info')
+
+        results[i].append(hxlheaders)
+
+    results.append(list())
+    headers.append(['ISO3 Country Code', 'Country Name', 'Population'])
+    hxlheaders = ['#country+code', '#country+name', '#population+num']
+    results[len(results)-1].append(hxlheaders)
+
+    results.append(list())
+    headers.append(['ISO3 Country Code', 'Country Name', 'Camp', 'Tier', 'Cooking Spending', 'Cooking Description', 'Population not using Biomass', 'Population using Biomass', 'Lighting Spending', 'Lighting Description', 'Population on Grid', 'Population off Grid'])
+
+    results.append(list())
+    headers.append(['code', 'title', 'value', 'latest_date', 'source', 'source_link', 'notes', 'explore', 'units'])
+    return {'model': model, 'pop_types': pop_types, 'headers': headers, 'results': results}
+
+
+def get_elecgridco2(model, elecgridco2, iso3, info):
+    elgridco2 = elecgridco2.get(iso3)
+    if elgridco2 is None:
+        elgridco2, reg = model.calculate_regional_average('Grid CO2', elecgridco2, iso3)
+        info.append(get_record('elco2', reg, elgridco2))
+    return elgridco2
+
+
+def run_noncamp_model(model, pop_types, results, unhcr_populations, urbanratios, slumratios,
+                      elecappliances, elecgridco2, cookinglpg, noncamp_elec_access, noncamp_nonsolid_access,
+                      elecgridtiers, noncamplightingoffgridtypes, noncampcookingsolidtypes,
+                      lighting_type_descriptions, lightingoffgridcost, elecgriddirectenergy, cooking_type_descriptions,
+                      cookingsolidcost):
+    unhcr_non_camp = unhcr_populations.get_totals('noncamp', consume=True)
+    for iso3 in sorted(unhcr_non_camp):
+        info = list()
+        population = unhcr_non_camp[iso3]
+        number_hh_by_pop_type = model.calculate_population(iso3, population, urbanratios, slumratios, info)
+        country_elecappliances = elecappliances.get(iso3)
+        if country_elecappliances is None:
+            country_elecappliances, region = \
+                model.calculate_regional_average('Electrical Appliances', elecappliances, iso3)
+            info.append(get_record('elap', region, country_elecappliances))
+        country_elecgridco2 = get_elecgridco2(model, elecgridco2, iso3, info)
+        country_cookinglpg = cookinglpg.get(iso3)
+        if country_cookinglpg is None:
+            country_cookinglpg, region = model.calculate_regional_average('LPG', cookinglpg, iso3)
+            info.append(get_record('lpg', region, country_cookinglpg))
+
+        info = get_provenance(info)
+
+        cn = Country.get_country_name_from_iso3(iso3)
+        for pop_type in number_hh_by_pop_type:
+            model.reset_pop_counters()
+            info2 = info
+            number_hh = number_hh_by_pop_type[pop_type]
+
+            country_elec_access = noncamp_elec_access[pop_type].get(iso3)
+            if country_elec_access is None:
+                country_elec_access, region = \
+                    model.calculate_regional_average('Grid access', noncamp_elec_access[pop_type], iso3)
+                info2 = info2.add(get_record('elac', region, country_elec_access))
+            hh_grid_access, hh_offgrid = model.calculate_hh_access(number_hh, country_elec_access)
+            pop_grid_access = model.calculate_population_from_hh(hh_grid_access)
+            pop_offgrid_access = model.calculate_population_from_hh(hh_offgrid)
+            model.pop_grid += pop_grid_access
+
+            country_noncamp_nonsolid_access = noncamp_nonsolid_access[pop_type].get(iso3)
+            if country_noncamp_nonsolid_access is None:
+                country_noncamp_nonsolid_access, region = \
+                    model.calculate_regional_average('Nonsolid access', noncamp_nonsolid_access[pop_type], iso3)
+                info2 = info2.add(get_record('nsac', region, country_noncamp_nonsolid_access))
+            hh_nonsolid_access, hh_no_nonsolid_access = \
+                model.calculate_hh_access(number_hh, country_noncamp_nonsolid_access)
+            pop_biomass_access = model.calculate_population_from_hh(hh_no_nonsolid_access)
+            pop_nonbiomass_access = model.calculate_population_from_hh(hh_nonsolid_access)
+            model.pop_nonbiomass += pop_nonbiomass_access
+
+            ge, gc = model.calculate_ongrid_lighting(hh_grid_access, elecgridtiers, country_elecappliances,
+                                                     country_elecgridco2)
+            ne, nc = model.calculate_non_solid_cooking(hh_nonsolid_access, country_cookinglpg)
+
+            for tier in model.tiers:
+                noncamplightingoffgridtype = model.get_noncamp_type(noncamplightingoffgridtypes, pop_type, tier)
+                noncampcookingsolidtype = model.get_noncamp_type(noncampcookingsolidtypes, pop_type, tier)
+
+                res = model.calculate_offgrid_solid(tier, hh_offgrid, lighting_type_descriptions,
+                                                    noncamplightingoffgridtype, lightingoffgridcost,
+                                                    elecgriddirectenergy, country_elecgridco2,
+                                                    hh_no_nonsolid_access, cooking_type_descriptions,
+                                                    noncampcookingsolidtype, cookingsolidcost)
+                noncamplightingtypedesc, oe, oc, oco2, noncampcookingtypedesc, se, sc, sco2 = res
+                model.add_keyfigures(iso3, cn, pop_type, tier, se, oe, noncampcookingtypedesc, pop_biomass_access,
+                                     noncamplightingtypedesc, pop_offgrid_access, results, ne=ne, ge=ge)
+                population = model.calculate_population_from_hh(number_hh)
+                row = NonCampRow(iso3, cn, population, tier, ge, gc, noncamplightingoffgridtype,
+                                 noncamplightingtypedesc, oe, oc, oco2, ne, nc, noncampcookingsolidtype,
+                                 noncampcookingtypedesc, se, sc, sco2, info2)
+                results[pop_types.index(pop_type.capitalize())].append(row)
+    return {'model': model, 'results': results, 'unhcr_populations': unhcr_populations}
+
+
+def run_camp_model(model, pop_types, results, camptypes, unhcr_camp, unhcr_populations, elecgridco2,
+                   lighting_type_descriptions, lightingoffgridcost, elecgriddirectenergy, cooking_type_descriptions,
+                   cookingsolidcost):
+    camp_offgridtypes_in_countries = dict()
+    camp_solidtypes_in_countries = dict()
+    missing_from_unhcr = list()
+    for name in sorted(camptypes):
+        model.reset_pop_counters()
+        info = list()
+        unhcrcampname = name
+        result = unhcr_camp.get(unhcrcampname)
+        if result is None:
+            firstpart = name.split(':')[0].strip()
+            for unhcrcampname in sorted(unhcr_camp):
+                if firstpart in unhcrcampname:
+                    result = unhcr_camp[unhcrcampname]
+                    record('partial_name_match', name, name, unhcrcampname)
+                    info.append(get_record('Matched', value=firstpart))
+                    break
+        if result is None:
+            camptype = unhcr_populations.get_type(name, 'excluded')
+            if camptype is None:
+                if check_name_dispersed(name):
+                    record('dispersed_camp', name, name)
+                else:
+                    missing_from_unhcr.append(name)
+            else:
+                record('excluded_camp', camptype, name, camptype)
+            continue
+        population, iso3, accommodation_type = result
+        unhcr_populations.consume(iso3, accommodation_type, unhcrcampname)
+
+        camp_camptypes = camptypes[name]
+
+        number_hh = model.calculate_number_hh(population)
+        country_elecgridco2 = get_elecgridco2(model, elecgridco2, iso3, info)
+        info = get_provenance(info)
+        cn = Country.get_country_name_from_iso3(iso3)
+
+        for tier in model.tiers:
+            camplightingoffgridtype = camp_camptypes.get('Lighting OffGrid %s' % tier)
+            if camplightingoffgridtype is None:
+                record('missing_lighting_tier', tier, tier, name, cn)
+            campcookingsolidtype = camp_camptypes.get('Cooking Solid %s' % tier)
+            if campcookingsolidtype is None:
+                record('missing_cooking_tier', tier, tier, name, cn)
+
+            res = model.calculate_offgrid_solid(tier, number_hh, lighting_type_descriptions,
+                                                camplightingoffgridtype, lightingoffgridcost,
+                                                elecgriddirectenergy, country_elecgridco2,
+                                                number_hh, cooking_type_descriptions, campcookingsolidtype,
+                                                cookingsolidcost)
+            camplightingtypedesc, oe, oc, oco2, campcookingtypedesc, se, sc, sco2 = res
+            model.add_keyfigures(iso3, cn, name, tier, se, oe, campcookingtypedesc, population,
+                                 camplightingtypedesc, population, results)
+            row = CampRow(iso3, cn, name, population, tier, camplightingoffgridtype, camplightingtypedesc, oe, oc,
+                          oco2, campcookingsolidtype, campcookingtypedesc, se, sc, sco2, info)
+            results[pop_types.index('Camp')].append(row)
+            if camplightingoffgridtype:
+                append_value(camp_offgridtypes_in_countries, iso3, tier, name, camplightingoffgridtype)
+            if campcookingsolidtype:
+                append_value(camp_solidtypes_in_countries, iso3, tier, name, campcookingsolidtype)
+
+    logger.info('The following camps are in the spreadsheet but not in the UNHCR data : %s' %
+                ', '.join(missing_from_unhcr))
+    return {'model': model, 'results': results, 'unhcr_populations': unhcr_populations,
+            'camp_offgridtypes_in_countries': camp_offgridtypes_in_countries,
+            'camp_solidtypes_in_countries': camp_solidtypes_in_countries}
+
+
+def resolve_extra_camp_types(camp_offgridtypes_in_countries, camp_solidtypes_in_countries,
+                             camptypes_fallbacks_offgrid, camptypes_fallbacks_solid):
+    # The lighting and cooking types of each tier for camps only in the UNHCR data: the most frequent types of the
+    # country's named camps or, if it has none, its fallback types
+    extra_camptypes = dict()
+    for iso3, offgrid_tiers in camp_offgridtypes_in_countries.items():
+        solid_tiers = camp_solidtypes_in_countries.get(iso3, dict())
+        extra_camptypes[iso3] = {tier: (ChathamHouseModel.calculate_mostfrequent(offgrid_tiers[tier]),
+                                        ChathamHouseModel.calculate_mostfrequent(solid_tiers.get(tier, dict())),
+                                        False) for tier in offgrid_tiers}
+    for iso3, offgrid_tiers in camptypes_fallbacks_offgrid.items():
+        if iso3 in extra_camptypes or not offgrid_tiers:
+            continue
+        solid_tiers = camptypes_fallbacks_solid.get(iso3, dict())
+        extra_camptypes[iso3] = {tier: (offgrid_tiers[tier], solid_tiers.get(tier), True) for tier in offgrid_tiers}
+    return {'extra_camptypes': extra_camptypes}
+
+
+def get_extra_camp_type_rows(extra_camptypes):
+    rows = list()
+    for iso3 in sorted(extra_camptypes):
+        for tier, (lighting_type, cooking_type, fallback) in extra_camptypes[iso3].items():
+            rows.append([iso3, tier, lighting_type, cooking_type, 'Fallback' if fallback else 'Country types'])
+    return rows
+
+
+def run_extra_camp_model(model, pop_types, results, country_totals, unhcr_populations, elecgridco2, extra_camptypes,
+                         lighting_type_descriptions, lightingoffgridcost, elecgriddirectenergy,
+                         cooking_type_descriptions, cookingsolidcost):
+    extra_camps = unhcr_populations.get_remaining()
+    for iso3 in sorted(country_totals):
+        info = list()
+        population = country_totals[iso3]
+        cn = Country.get_country_name_from_iso3(iso3)
+        row = CountryRow(iso3, cn, population)
+        results[len(results)-3].append(row)
+
+        country_elecgridco2 = get_elecgridco2(model, elecgridco2, iso3, info)
+        info = get_provenance(info)
+
+        for accommodation_type, name, population in extra_camps[iso3]:
+            model.reset_pop_counters()
+            if population < 20000:
+                record('small_extra_camp', iso3, name, population, accommodation_type, cn)
+                continue
+            number_hh = model.calculate_number_hh(population)
+            camptypes_in_country = extra_camptypes.get(iso3)
+            if camptypes_in_country is None:
+                record('missing_fallback', iso3, cn, name, population, accommodation_type)
+                continue
+            info2 = info.add(get_record('UNHCR only'))
+            for tier, (camplightingoffgridtype, campcookingsolidtype, fallback) in camptypes_in_country.items():
+                info3 = info2
+                if fallback:
+                    info3 = info2.add(get_record('Fallback'))
+
+                res = model.calculate_offgrid_solid(tier, number_hh, lighting_type_descriptions,
+                                                    camplightingoffgridtype, lightingoffgridcost,
+                                                    elecgriddirectenergy, country_elecgridco2,
+                                                    number_hh, cooking_type_descriptions, campcookingsolidtype,
+                                                    cookingsolidcost)
+                camplightingtypedesc, oe, oc, oco2, campcookingtypedesc, se, sc, sco2 = res
+                model.add_keyfigures(iso3, cn, name, tier, se, oe, campcookingtypedesc, population,
+                                     camplightingtypedesc, population, results)
+                row = CampRow(iso3, cn, name, population, tier, camplightingoffgridtype, camplightingtypedesc, oe,
+                              oc, oco2, campcookingsolidtype, campcookingtypedesc, se, sc, sco2, info3)
+                results[pop_types.index('Camp')].append(row)
+    return {'model': model, 'results': results}
+
+
+def run_small_camp_model(model, pop_types, results, smallcamps, small_camptypes, small_camps_elecgridco2,
+                         lighting_type_descriptions, lightingoffgridcost, elecgriddirectenergy,
+                         cooking_type_descriptions, cookingsolidcost):
+    for region in sorted(smallcamps):
+        model.reset_pop_counters()
+        info = list()
+        population = smallcamps[region]
+        if not population or population == '-':
+            continue
+        number_hh = model.calculate_number_hh(population)
+        region_camptypes = small_camptypes.get(region)
+        if region_camptypes is None:
+            record('missing_small_camp_group', region, region)
+            continue
+
+        elecco2 = small_camps_elecgridco2[region]
+        if not elecco2 or elecco2 == '-':
+            info.append(get_record('Blank elco2'))
+            elecco2 = 0
+        info = get_provenance(info)
+
+        for tier in model.tiers:
+            camplightingoffgridtype = region_camptypes['Lighting OffGrid %s' % tier]
+            campcookingsolidtype = region_camptypes['Cooking Solid %s' % tier]
+
+            res = model.calculate_offgrid_solid(tier, number_hh, lighting_type_descriptions,
+                                                camplightingoffgridtype, lightingoffgridcost,
+                                                elecgriddirectenergy, elecco2,
+                                                number_hh, cooking_type_descriptions, campcookingsolidtype,
+                                                cookingsolidcost)
+            camplightingtypedesc, oe, oc, oco2, campcookingtypedesc, se, sc, sco2 = res
+            model.add_keyfigures(blank, region, 'small camp', tier, se, oe, campcookingtypedesc, population,
+                                 camplightingtypedesc, population, results)
+            row = SmallCampRow(region, model.round(population), tier, camplightingoffgridtype, camplightingtypedesc, oe,
+                               oc, oco2, campcookingsolidtype, campcookingtypedesc, se, sc, sco2, info)
+            results[pop_types.index('Small Camp')].append(row)
+    return {'model': model, 'results': results}
+
+
+def create_keyfigures(model, results, country_totals, today):
+    date = today.date().isoformat()
+    source = 'Estimate from the Moving Energy Initiative'
+    data_url = 'https://data.humdata.org/dataset/energy-consumption-of-refugees-and-displaced-people'
+    rows = [TopLineRow('MEI01', '% of Refugees and Displaced People Cooking with Biomass in Camps',
+                       model.get_camp_percentage_biomass(), date, source, data_url, blank, blank, 'ratio'),
+            TopLineRow('MEI02', '% of Refugees and Displaced People Off-Grid in Camps',
+                       model.get_camp_percentage_offgrid(), date, source, data_url, blank, blank, 'ratio'),
+            TopLineRow('MEI03', 'Total Annual Energy Spending by Refugees and Displaced People',
+                       model.get_total_spending(), date, source, data_url, blank, blank, 'dollars_million'),
+            TopLineRow('MEI04', 'No. of Countries Hosting Refugees and Displaced People', len(country_totals), date,
+                       source, data_url, blank, blank, 'count')]
+    results[len(results)-1].extend(rows)
+    return {'results': results}
+
+
+def write_resources(configuration, pop_types, headers, results, extra_camptypes, today, folder):
+    dataset, resources, showcase = generate_dataset_resources_and_showcase(pop_types, today)
+    files_to_upload, compressed_resources, sizes = \
+        write_resource_files(results, headers, resources, folder, max_writers=configuration['max_resource_writers'],
+                             compression=configuration.get('resource_compression'),
+                             compression_levels=configuration.get('resource_compression_levels'))
+    compression_sizes = {name: size for name, size in sizes.items() if size}
+    if configuration.get('columnar_resources'):
+        write_columnar_resources(results, headers, resources, folder)
+    if configuration.get('extra_camp_types'):
+        path = write_resource(get_extra_camp_type_rows(extra_camptypes), join(folder, 'extra_camp_types.csv'),
+                              ['ISO3 Country Code', 'Tier', 'Offgrid Type', 'Solid Type', 'Source'])
+        logger.info('Written %s' % path)
+    # The resources line up with the results, so the compressed ones are kept apart until they are published
+    return {'dataset': dataset, 'resources': resources, 'compressed_resources': compressed_resources,
+            'showcase': showcase, 'files_to_upload': files_to_upload, 'compression_sizes': compression_sizes}
+
+
+def publish_dataset(dataset, resources, compressed_resources, showcase, files_to_upload):
+    file_to_upload = files_to_upload[-1]
+    # The csv resources keep the plain files, which the key figures datastore is updated from
+    dataset.add_update_resources(resources + compressed_resources)
+    dataset.update_from_yaml()
+#    dataset.create_in_hdx()
+    for resource in dataset.get_resources():
+        name = resource['name'].lower()
+        if resource['format'] == 'csv' and 'figures' in name and 'disagg' not in name:
+            logger.info('Updating key figures datastore for %s' % name)
+#            resource.update_datastore_for_topline(path=file_to_upload)
+#    showcase.create_in_hdx()
+#    showcase.add_dataset(dataset)
+
+
+loader_names = ('constants', 'worldbank', 'slumratios', 'noncamptables', 'descriptions', 'camptables',
+                'smallcamptables')
+input_stage_names = loader_names + ('populations',)
+
+
+def loader_stage(name, loader, outputs):
+    return Stage(name, guard_loader(name, loader), ['configuration'], outputs + ['source_%s' % name], checkpoint=True)
+
+
+def get_stages():
+    return [
+        loader_stage('constants', load_constants, ['constants', 'camp_overrides']),
+        loader_stage('worldbank', load_worldbank, ['urbanratios', 'noncamp_elec_access']),
+        loader_stage('slumratios', load_slumratios, ['slumratios', 'slumratio_years']),
+        loader_stage('noncamptables', load_noncamp_tables,
+                     ['elecappliances', 'cookinglpg', 'elecgridtiers', 'elecgriddirectenergy', 'elecgridco2',
+                      'noncamplightingoffgridtypes', 'noncampcookingsolidtypes', 'lightingoffgridcost',
+                      'cookingsolidcost', 'noncamp_nonsolid_access']),
+        loader_stage('descriptions', load_descriptions, ['lighting_type_descriptions', 'cooking_type_descriptions']),
+        loader_stage('camptables', load_camp_tables,
+                     ['camptypes', 'camptypes_fallbacks_offgrid', 'camptypes_fallbacks_solid']),
+        loader_stage('smallcamptables', load_small_camp_tables,
+                     ['small_camptypes', 'smallcamps', 'small_camps_elecgridco2']),
+        Stage('populations', parse_populations, ['constants', 'camp_overrides'],
+              ['unhcr_populations', 'unhcr_camp', 'country_totals'],
+              checkpoint=True),
+        Stage('tables', create_tables, ['constants'], ['model', 'pop_types', 'headers', 'results']),
+        Stage('noncamp', run_noncamp_model,
+              ['model', 'pop_types', 'results', 'unhcr_populations', 'urbanratios', 'slumratios', 'elecappliances',
+               'elecgridco2', 'cookinglpg', 'noncamp_elec_access',
+               'noncamp_nonsolid_access', 'elecgridtiers', 'noncamplightingoffgridtypes', 'noncampcookingsolidtypes',
+               'lighting_type_descriptions', 'lightingoffgridcost', 'elecgriddirectenergy',
+               'cooking_type_descriptions', 'cookingsolidcost'],
+              ['model', 'results', 'unhcr_populations'], checkpoint=True),
+        Stage('camps', run_camp_model,
+              ['model', 'pop_types', 'results', 'camptypes', 'unhcr_camp', 'unhcr_populations', 'elecgridco2',
+               'lighting_type_descriptions', 'lightingoffgridcost', 'elecgriddirectenergy', 'cooking_type_descriptions', 'cookingsolidcost'],
+              ['model', 'results', 'unhcr_populations', 'camp_offgridtypes_in_countries',
+               'camp_solidtypes_in_countries'], checkpoint=True),
+        Stage('extracamptypes', resolve_extra_camp_types,
+              ['camp_offgridtypes_in_countries', 'camp_solidtypes_in_countries', 'camptypes_fallbacks_offgrid',
+               'camptypes_fallbacks_solid'], ['extra_camptypes']),
+        Stage('extracamps', run_extra_camp_model,
+              ['model', 'pop_types', 'results', 'country_totals', 'unhcr_populations', 'elecgridco2',
+               'extra_camptypes', 'lighting_type_descriptions', 'lightingoffgridcost', 'elecgriddirectenergy',
+               'cooking_type_descriptions', 'cookingsolidcost'],
+              ['model', 'results'], checkpoint=True),
+        Stage('smallcamps', run_small_camp_model,
+              ['model', 'pop_types', 'results', 'smallcamps', 'small_camptypes', 'small_camps_elecgridco2',
+               'lighting_type_descriptions', 'lightingoffgridcost', 'elecgriddirectenergy',
+               'cooking_type_descriptions', 'cookingsolidcost'],
+              ['model', 'results'], checkpoint=True),
+        Stage('sources', flag_stale_sources, ['pop_types', 'results'] + ['source_%s' % name for name in loader_names],
+              ['results', 'source_status']),
+        Stage('keyfigures', create_keyfigures, ['model', 'results', 'country_totals', 'today'], ['results']),
+        Stage('write', write_resources,
+              ['configuration', 'pop_types', 'headers', 'results', 'extra_camptypes', 'today', 'folder'],
+              ['dataset', 'resources', 'compressed_resources', 'showcase', 'files_to_upload', 'compression_sizes'],
+              cache=False),
+        Stage('publish', publish_dataset,
+              ['dataset', 'resources', 'compressed_resources', 'showcase', 'files_to_upload'], list(), cache=False)
+    ]
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Chatham House What If
+---------------------
+
+Answers hypothetical camp and country queries from the loaded inputs using the same model calculations as a full
+run. Values that need a regional average are resolved once per country and kept.
+
+"""
+import logging
+
+from hdx.location.country import Country
+
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhouseprovenance import get_provenance, get_record
+
+logger = logging.getLogger(__name__)
+
+
+class WhatIfModel:
+    def __init__(self, context):
+        self.model = ChathamHouseModel(context['constants'])
+        self.context = context
+        self.iso3s = dict()
+        self.country_values = dict()
+
+    def get_iso3(self, country):
+        if not country:
+            raise ValueError('A country is required!')
+        iso3 = self.iso3s.get(country)
+        if iso3 is None:
+            if Country.get_country_name_from_iso3(country.upper()):
+                iso3 = country.upper()
+            else:
+                iso3, _ = Country.get_iso3_country_code_fuzzy(country)
+                if iso3 is None:
+                    raise ValueError('Unknown country %s!' % country)
+            self.iso3s[country] = iso3
+        return iso3
+
+    def get_value(self, val_type, datadict, iso3, info, abbreviation):
+        value = datadict.get(iso3)
+        if value is None:
+            value, region = self.model.calculate_regional_average(val_type, datadict, iso3)
+            info.append(get_record(abbreviation, region, value))
+        return value
+
+    def get_country_values(self, iso3):
+        values = self.country_values.get(iso3)
+        if values is not None:
+            return values
+        context = self.context
+        info = list()
+        values = {'country': Country.get_country_name_from_iso3(iso3)}
+        values['urbanratio'] = self.get_value('Urban ratio', context['urbanratios'], iso3, info, 'ur')
+        values['slumratio'] = self.get_value('Slum ratio', context['slumratios'], iso3, info, 'sr')
+        values['elecappliances'] = self.get_value('Electrical Appliances', context['elecappliances'], iso3, info,
+                                                  'elap')
+        values['elecgridco2'] = self.get_value('Grid CO2', context['elecgridco2'], iso3, info, 'elco2')
+        values['cookinglpg'] = self.get_value('LPG', context['cookinglpg'], iso3, info, 'lpg')
+        for pop_type in ('Urban', 'Slum', 'Rural'):
+            values['elec_access %s' % pop_type] = \
+                self.get_value('Grid access', context['noncamp_elec_access'][pop_type], iso3, info, 'elac')
+            values['nonsolid_access %s' % pop_type] = \
+                self.get_value('Nonsolid access', context['noncamp_nonsolid_access'][pop_type], iso3, info, 'nsac')
+        values['info'] = get_provenance(info)
+        self.country_values[iso3] = values
+        return values
+
+    def get_tiers(self, tier):
+        if tier is None:
+            return self.model.tiers
+        if tier not in self.model.tiers:
+            raise ValueError('Unknown tier %s!' % tier)
+        return [tier]
+
+    @staticmethod
+    def get_population(query):
+        try:
+            population = int(query['population'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('A population is required!')
+        if population < 0:
+            raise ValueError('Population cannot be negative!')
+        return population
+
+    def get_camp_types(self, iso3, tier, lighting_type, cooking_type, info):
+        if lighting_type is not None and cooking_type is not None:
+            return int(lighting_type), int(cooking_type)
+        context = self.context
+        camptypes = context.get('extra_camptypes', dict()).get(iso3, dict()).get(tier)
+        if camptypes is not None and not camptypes[2]:
+            default_lighting, default_cooking, _ = camptypes
+            info.append(get_record('Country types'))
+        else:
+            fallbacks = context['camptypes_fallbacks_offgrid'].get(iso3)
+            if not fallbacks:
+                raise ValueError('Lighting and cooking types are required for %s!' % iso3)
+            default_lighting = fallbacks[tier]
+            default_cooking = context['camptypes_fallbacks_solid'][iso3][tier]
+            info.append(get_record('Fallback'))
+        if lighting_type is None:
+            lighting_type = default_lighting
+        if cooking_type is None:
+            cooking_type = default_cooking
+        return int(lighting_type), int(cooking_type)
+
+    def calculate_offgrid_solid(self, tier, hh_offgrid, lightingoffgridtype, country_elecgridco2,
+                                hh_no_nonsolid_access, cookingsolidtype):
+        context = self.context
+        baseline_target = self.model.get_baseline_target(tier)
+        if lightingoffgridtype and 'Fuel %s Type %s' % (baseline_target, lightingoffgridtype) not in \
+                context['lightingoffgridcost']:
+            raise ValueError('Unknown lighting type %s!' % lightingoffgridtype)
+        if cookingsolidtype and 'Fuel %s Type %s' % (baseline_target, cookingsolidtype) not in \
+                context['cookingsolidcost']:
+            raise ValueError('Unknown cooking type %s!' % cookingsolidtype)
+        return self.model.calculate_offgrid_solid(tier, hh_offgrid, context['lighting_type_descriptions'],
+                                                  lightingoffgridtype, context['lightingoffgridcost'],
+                                                  context['elecgriddirectenergy'], country_elecgridco2,
+                                                  hh_no_nonsolid_access, context['cooking_type_descriptions'],
+                                                  cookingsolidtype, context['cookingsolidcost'])
+
+    def camp(self, query):
+        iso3 = self.get_iso3(query.get('country'))
+        population = self.get_population(query)
+        values = self.get_country_values(iso3)
+        number_hh = self.model.calculate_number_hh(population)
+        rows = list()
+        for tier in self.get_tiers(query.get('tier')):
+            info = [x for x in values['info'] if x.kind == 'elco2']
+            lightingtype, cookingtype = self.get_camp_types(iso3, tier, query.get('lighting_type'),
+                                                            query.get('cooking_type'), info)
+            res = self.calculate_offgrid_solid(tier, number_hh, lightingtype, values['elecgridco2'], number_hh,
+                                               cookingtype)
+            lightingtypedesc, oe, oc, oco2, cookingtypedesc, se, sc, sco2 = res
+            rows.append({'iso3': iso3, 'country': values['country'], 'population': population, 'tier': tier,
+                         'lighting_type': lightingtype, 'lighting_description': lightingtypedesc,
+                         'lighting_expenditure': oe, 'lighting_capital': oc, 'lighting_co2': oco2,
+                         'cooking_type': cookingtype, 'cooking_description': cookingtypedesc,
+                         'cooking_expenditure': se, 'cooking_capital': sc, 'cooking_co2': sco2,
+                         'info': str(get_provenance(info))})
+        return rows
+
+    def country(self, query):
+        context = self.context
+        model = self.model
+        iso3 = self.get_iso3(query.get('country'))
+        population = self.get_population(query)
+        values = self.get_country_values(iso3)
+        number_hh_by_pop_type = model.calculate_population(iso3, population, {iso3: values['urbanratio']},
+                                                           {iso3: values['slumratio']}, list())
+        rows = list()
+        tiers = self.get_tiers(query.get('tier'))
+        for pop_type in number_hh_by_pop_type:
+            number_hh = number_hh_by_pop_type[pop_type]
+            hh_grid_access, hh_offgrid = model.calculate_hh_access(number_hh, values['elec_access %s' % pop_type])
+            hh_nonsolid_access, hh_no_nonsolid_access = \
+                model.calculate_hh_access(number_hh, values['nonsolid_access %s' % pop_type])
+            ge, gc = model.calculate_ongrid_lighting(hh_grid_access, context['elecgridtiers'],
+                                                     values['elecappliances'], values['elecgridco2'])
+            ne, nc = model.calculate_non_solid_cooking(hh_nonsolid_access, values['cookinglpg'])
+            for tier in tiers:
+                lightingtype = model.get_noncamp_type(context['noncamplightingoffgridtypes'], pop_type, tier)
+                cookingtype = model.get_noncamp_type(context['noncampcookingsolidtypes'], pop_type, tier)
+                res = self.calculate_offgrid_solid(tier, hh_offgrid, lightingtype, values['elecgridco2'],
+                                                   hh_no_nonsolid_access, cookingtype)
+                lightingtypedesc, oe, oc, oco2, cookingtypedesc, se, sc, sco2 = res
+                rows.append({'iso3': iso3, 'country': values['country'], 'pop_type': pop_type,
+                             'population': model.calculate_population_from_hh(number_hh), 'tier': tier,
+                             'grid_expenditure': ge, 'grid_co2': gc, 'lighting_type': lightingtype,
+                             'lighting_description': lightingtypedesc, 'lighting_expenditure': oe,
+                             'lighting_capital': oc, 'lighting_co2': oco2, 'nonsolid_expenditure': ne,
+                             'nonsolid_co2': nc, 'cooking_type': cookingtype,
+                             'cooking_description': cookingtypedesc, 'cooking_expenditure': se,
+                             'cooking_capital': sc, 'cooking_co2': sco2, 'info': str(values['info'])})
+        return rows
+
+    def query(self, query):
+        query_type = query.get('type', 'camp')
+        if query_type == 'camp':
+            return self.camp(query)
+        if query_type == 'country':
+            return self.country(query)
+        raise ValueError('Unknown query type %s!' % query_type)
+
+    def batch(self, queries):
+        results = list()
+        for query in queries:
+            try:
+                results.append({'rows': self.query(query)})
+            except (KeyError, ValueError) as e:
+                results.append({'error': str(e)})
+        return results
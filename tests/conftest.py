@@ -7,17 +7,22 @@ from hdx.data.dataset import Dataset
 from hdx.data.vocabulary import Vocabulary
 from hdx.hdx_configuration import Configuration
 from hdx.hdx_locations import Locations
-from hdx.location.country import Country
 from hdx.utilities.downloader import Download
 
+from chathamhouse.chathamhousecountries import load_countriesdata
 from chathamhouse.chathamhousedata import get_slumratios
 
 
 @pytest.fixture(scope='session')
-def configuration():
+def countries_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('countries') / 'countries.pkl')
+
+
+@pytest.fixture(scope='session')
+def configuration(countries_path):
     Configuration._create(hdx_read_only=True, user_agent='test')
     Locations.set_validlocations([{'name': 'world', 'title': 'World'}])
-    Country.countriesdata(use_live=False)
+    load_countriesdata(countries_path)
     Vocabulary._tags_dict = True
     Vocabulary._approved_vocabulary = {'tags': [{'name': 'hxl'}, {'name': 'energy'}, {'name': 'refugees'}, {'name': 'internally displaced persons - idp'}],
                                        'id': '4e61d464-4943-4e97-973a-84673c1aaa87', 'name': 'approved'}
@@ -31,8 +36,8 @@ def downloader():
 
 
 @pytest.fixture(scope='session', autouse=True)
-def country():
-    Country.countriesdata(use_live=False)
+def country(countries_path):
+    load_countriesdata(countries_path)
 
 
 @pytest.fixture(scope='session')
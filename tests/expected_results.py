@@ -1832,101 +1832,101 @@ unhcr_camp_expected = {
 
 slum_ratios_expected = {
  'AFG': 0.627,
- 'AGO': 0.865,
- 'ARG': 0.305,
+ 'AGO': 0.555,
+ 'ARG': 0.16699999999999998,
  'ARM': 0.14400000000000002,
- 'BDI': 0.643,
- 'BEN': 0.7929999999999999,
- 'BFA': 0.7879999999999999,
- 'BGD': 0.873,
- 'BLZ': 0.187,
- 'BOL': 0.622,
- 'BRA': 0.36700000000000005,
- 'CAF': 0.875,
+ 'BDI': 0.579,
+ 'BEN': 0.615,
+ 'BFA': 0.6579999999999999,
+ 'BGD': 0.551,
+ 'BLZ': 0.10800000000000001,
+ 'BOL': 0.435,
+ 'BRA': 0.223,
+ 'CAF': 0.9329999999999999,
  'CHL': 0.09,
- 'CHN': 0.436,
- 'CIV': 0.534,
- 'CMR': 0.508,
- 'COD': 0.764,
- 'COG': 0.534,
- 'COL': 0.312,
- 'COM': 0.654,
- 'CRI': 0.109,
+ 'CHN': 0.252,
+ 'CIV': 0.56,
+ 'CMR': 0.37799999999999995,
+ 'COD': 0.748,
+ 'COG': 0.469,
+ 'COL': 0.131,
+ 'COM': 0.696,
+ 'CRI': 0.055,
  'DJI': 0.6559999999999999,
- 'DOM': 0.27899999999999997,
- 'ECU': 0.215,
- 'EGY': 0.502,
- 'ETH': 0.955,
- 'GAB': 0.387,
- 'GHA': 0.655,
- 'GIN': 0.804,
+ 'DOM': 0.121,
+ 'ECU': 0.36,
+ 'EGY': 0.106,
+ 'ETH': 0.7390000000000001,
+ 'GAB': 0.37,
+ 'GHA': 0.379,
+ 'GIN': 0.433,
  'GLP': 0.054000000000000006,
- 'GMB': 0.45399999999999996,
- 'GNB': 0.831,
- 'GNQ': 0.6629999999999999,
+ 'GMB': 0.348,
+ 'GNB': 0.823,
+ 'GNQ': 0.662,
  'GRD': 0.06,
- 'GTM': 0.586,
+ 'GTM': 0.345,
  'GUF': 0.105,
- 'GUY': 0.337,
- 'HND': 0.349,
- 'HTI': 0.934,
- 'IDN': 0.508,
- 'IND': 0.5489999999999999,
- 'IRQ': 0.16899999999999998,
+ 'GUY': 0.331,
+ 'HND': 0.275,
+ 'HTI': 0.7440000000000001,
+ 'IDN': 0.218,
+ 'IND': 0.24,
+ 'IRQ': 0.47200000000000003,
  'JAM': 0.605,
- 'JOR': 0.158,
- 'KEN': 0.5489999999999999,
- 'KHM': 0.789,
- 'LAO': 0.7929999999999999,
+ 'JOR': 0.129,
+ 'KEN': 0.56,
+ 'KHM': 0.551,
+ 'LAO': 0.314,
  'LBN': 0.531,
- 'LBR': 0.6829999999999999,
+ 'LBR': 0.657,
  'LCA': 0.11900000000000001,
- 'LSO': 0.35100000000000003,
- 'MAR': 0.374,
- 'MDG': 0.93,
- 'MEX': 0.231,
- 'MLI': 0.9420000000000001,
- 'MMR': 0.456,
- 'MNG': 0.685,
- 'MOZ': 0.7559999999999999,
+ 'LSO': 0.508,
+ 'MAR': 0.131,
+ 'MDG': 0.772,
+ 'MEX': 0.111,
+ 'MLI': 0.563,
+ 'MMR': 0.41,
+ 'MNG': 0.42700000000000005,
+ 'MOZ': 0.8029999999999999,
  'MRT': 0.799,
- 'MWI': 0.664,
- 'NAM': 0.344,
- 'NER': 0.836,
- 'NGA': 0.773,
- 'NIC': 0.8909999999999999,
- 'NPL': 0.706,
- 'PAK': 0.51,
- 'PAN': 0.23,
- 'PER': 0.664,
- 'PHL': 0.5429999999999999,
+ 'MWI': 0.667,
+ 'NAM': 0.332,
+ 'NER': 0.701,
+ 'NGA': 0.502,
+ 'NIC': 0.455,
+ 'NPL': 0.5429999999999999,
+ 'PAK': 0.455,
+ 'PAN': 0.258,
+ 'PER': 0.342,
+ 'PHL': 0.38299999999999995,
  'PRY': 0.17600000000000002,
- 'RWA': 0.96,
+ 'RWA': 0.532,
  'SAU': 0.18,
  'SDN': 0.9159999999999999,
- 'SEN': 0.706,
- 'SLE': 0.97,
+ 'SEN': 0.39399999999999996,
+ 'SLE': 0.7559999999999999,
  'SLV': 0.289,
- 'SOM': 0.735,
+ 'SOM': 0.736,
  'SSD': 0.956,
  'STP': 0.866,
- 'SUR': 0.039,
+ 'SUR': 0.073,
  'SWZ': 0.327,
- 'SYR': 0.105,
- 'TCD': 0.9890000000000001,
- 'TGO': 0.621,
- 'THA': 0.26,
+ 'SYR': 0.193,
+ 'TCD': 0.882,
+ 'TGO': 0.512,
+ 'THA': 0.25,
  'TTO': 0.247,
  'TUN': 0.08,
- 'TUR': 0.23399999999999999,
- 'TZA': 0.774,
- 'UGA': 0.75,
+ 'TUR': 0.11900000000000001,
+ 'TZA': 0.507,
+ 'UGA': 0.536,
  'VEN': 0.32,
- 'VNM': 0.605,
- 'YEM': 0.672,
- 'ZAF': 0.462,
- 'ZMB': 0.57,
- 'ZWE': 0.04
+ 'VNM': 0.272,
+ 'YEM': 0.608,
+ 'ZAF': 0.23,
+ 'ZMB': 0.54,
+ 'ZWE': 0.251
 }
 
 camptypes_expected = {
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House async download.
+
+'''
+import asyncio
+import json
+import threading
+from os.path import join
+
+import pytest
+from hdx.utilities.downloader import DownloadError
+
+from chathamhouse.chathamhouseasyncdownload import AsyncDownload, DownloadLoop, FetchedDownload, open_downloader
+from chathamhouse.chathamhousedata import get_camptypes, get_camptypes_fallbacks, get_iso3, get_slumratios, \
+    get_worldbank_series
+from tests.expected_results import camptypes_expected, camptypes_fallbacks_expected, slum_ratios_expected
+
+
+class TestChathamHouseAsyncDownload:
+    camptypes_path = join('tests', 'fixtures', 'Chatham House Constants and Lookups - CampTypes.csv')
+    fallbacks_path = join('tests', 'fixtures', 'Chatham House Constants and Lookups - CampTypeFallbacks.csv')
+    slums_path = join('tests', 'fixtures', 'MDG_Export_20170913_174700805.zip')
+
+    def test_async_download(self, downloader):
+        async def load():
+            async with AsyncDownload() as asyncdownloader:
+                rows = await asyncdownloader.download_tabular_rows_as_dicts(self.camptypes_path)
+                cols = await asyncdownloader.download_tabular_cols_as_dicts(self.camptypes_path)
+                keyvalue = await asyncdownloader.download_tabular_key_value(self.camptypes_path)
+                await asyncdownloader.fetch_all([self.slums_path, self.fallbacks_path])
+                return rows, cols, keyvalue, asyncdownloader.get_downloader()
+
+        rows, cols, keyvalue, fetcheddownloader = asyncio.run(load())
+        assert rows == downloader.download_tabular_rows_as_dicts(self.camptypes_path)
+        assert cols == downloader.download_tabular_cols_as_dicts(self.camptypes_path)
+        assert keyvalue == downloader.download_tabular_key_value(self.camptypes_path)
+        assert get_camptypes(self.camptypes_path, fetcheddownloader) == camptypes_expected
+        assert get_camptypes_fallbacks(self.fallbacks_path, fetcheddownloader, keyfn=get_iso3) == \
+            camptypes_fallbacks_expected
+        assert get_slumratios(self.slums_path, fetcheddownloader) == slum_ratios_expected
+
+    def test_fetched_download(self):
+        url = 'http://lala/indicators/SP.URB.TOTL.IN.ZS'
+        content = [None, [{'value': '66.032', 'country': {'value': 'Austria', 'id': 'AT'}},
+                          {'value': '32.277', 'country': {'value': 'Zimbabwe', 'id': 'ZW'}}]]
+        fetcheddownloader = FetchedDownload({url: json.dumps(content).encode('utf-8')})
+        assert get_worldbank_series(url, fetcheddownloader) == {'AUT': 0.66032, 'ZWE': 0.32277}
+        with pytest.raises(DownloadError):
+            fetcheddownloader.download('http://lala/missing')
+
+    def test_open_downloader(self):
+        with open_downloader({'async_downloads': True}, [self.camptypes_path]) as fetcheddownloader:
+            assert isinstance(fetcheddownloader, FetchedDownload)
+            assert get_camptypes(self.camptypes_path, fetcheddownloader) == camptypes_expected
+
+    def test_download_loop(self):
+        configuration = {'async_downloads': True}
+        with DownloadLoop() as download_loop:
+            loaded = dict()
+
+            def load(path):
+                with open_downloader(configuration, [path]) as fetcheddownloader:
+                    loaded[path] = fetcheddownloader.get_content(path)
+
+            threads = [threading.Thread(target=load, args=(path,)) for path in (self.camptypes_path, self.slums_path)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(download_loop.downloader.contents) == sorted(loaded)
+            with open_downloader(configuration, [self.camptypes_path, self.fallbacks_path]) as fetcheddownloader:
+                assert get_camptypes_fallbacks(self.fallbacks_path, fetcheddownloader, keyfn=get_iso3) == \
+                    camptypes_fallbacks_expected
+            loop = download_loop.loop
+        assert loop.is_closed()
+        assert download_loop.fetch([self.camptypes_path]) is None
+        with open(self.slums_path, 'rb') as f:
+            assert loaded[self.slums_path] == f.read()
@@ -0,0 +1,20 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House backfill.
+
+'''
+from hdx.data.dataset import Dataset
+
+from chathamhouse.chathamhousebackfill import get_datasets_by_year
+
+
+class TestChathamHouseBackfill:
+    def test_get_datasets_by_year(self, datasets):
+        extra = Dataset({'title': 'UNHCR Global Trends: Forced Displacement in 2014 Data', 'dataset_date': '01/05/2015'})
+        datasets_by_year = get_datasets_by_year(datasets + [extra])
+        assert sorted(datasets_by_year) == [2015, 2017]
+        assert datasets_by_year[2015]['dataset_date'] == '06/19/2015'
+        assert datasets_by_year[2017]['dataset_date'] == '06/20/2017'
+        assert sorted(get_datasets_by_year(datasets, years=[2017, 2018])) == [2017]
+        assert get_datasets_by_year(datasets, years=[2016]) == dict()
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House compute.
+
+'''
+import os
+import subprocess
+import sys
+from datetime import datetime
+from os.path import join
+
+from chathamhouse.chathamhousecompute import get_model_stages, load_inputs, save_inputs
+from chathamhouse.chathamhousestages import loader_names
+
+
+class TestChathamHouseCompute:
+    publishing_modules = ('hdx.data.dataset', 'hdx.data.resource', 'hdx.data.showcase', 'hdx.hdx_configuration',
+                          'hdx.facades', 'slugify', 'hdx.utilities.downloader', 'chathamhouse.chathamhouseservice',
+                          'chathamhouse.chathamhousebackfill')
+
+    @staticmethod
+    def get_import_times(module):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(['src', env.get('PYTHONPATH', '')])
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module], env=env,
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        times = dict()
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = int(cumulative)
+        return times
+
+    def test_import_is_mostly_country_data(self):
+        times = self.get_import_times('chathamhouse.chathamhousecompute')
+        for module in self.publishing_modules:
+            assert module not in times
+        # The modules compute imports itself should take less than half the time of the country data module
+        assert times['chathamhouse.chathamhousecompute'] < times['hdx.location.country'] * 1.5
+
+    def test_save_inputs(self, tmpdir):
+        path = join(str(tmpdir), 'inputs.pkl')
+        today = datetime(2017, 9, 13)
+        context = {'configuration': {'a': 1}, 'today': today, 'constants': {'Household Size': 5},
+                   'camp_overrides': dict(), 'model': 'lala'}
+        save_inputs(context, path)
+        inputs = load_inputs(path)
+        assert inputs == {'today': today, 'constants': {'Household Size': 5}, 'camp_overrides': dict()}
+        assert [stage.name for stage in get_model_stages(inputs)] == \
+            ['tables', 'noncamp', 'camps', 'extracamptypes', 'extracamps', 'smallcamps', 'keyfigures']
+        for name in loader_names:
+            inputs['source_%s' % name] = {'stale': False}
+        assert [stage.name for stage in get_model_stages(inputs)] == \
+            ['tables', 'noncamp', 'camps', 'extracamptypes', 'extracamps', 'smallcamps', 'sources', 'keyfigures']
@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House countries.
+
+'''
+from hdx.location.country import Country
+
+from chathamhouse.chathamhousecountries import build_countries_snapshot, load_countries_snapshot, \
+    load_countriesdata, snapshot_columns
+
+
+class TestChathamHouseCountries:
+    def test_snapshot(self, tmp_path):
+        path = str(tmp_path / 'countries.pkl')
+        assert load_countries_snapshot(path) is False
+        build_countries_snapshot(path)
+        parsed = Country.countriesdata()
+        assert load_countries_snapshot(path) is True
+        assert load_countries_snapshot(path, use_live=True) is False
+        snapshot = Country.countriesdata()
+        assert snapshot is not parsed
+        for key in parsed:
+            if key == 'countries':
+                for iso3 in parsed[key]:
+                    assert snapshot[key][iso3] == {tag: parsed[key][iso3].get(tag, '') for tag in snapshot_columns}
+                assert sorted(snapshot[key]) == sorted(parsed[key])
+            elif key == 'aliases':
+                assert {iso3: parsed[key][iso3].pattern for iso3 in parsed[key]} == \
+                       {iso3: snapshot[key][iso3].pattern for iso3 in snapshot[key]}
+            else:
+                assert snapshot[key] == parsed[key]
+        assert Country.get_iso3_country_code_fuzzy('Angola') == ('AGO', True)
+        assert Country.get_countries_in_region(17)[:2] == ['AGO', 'CAF']
+        load_countriesdata(path)
+        assert Country.get_country_name_from_iso3('KEN') == 'Kenya'
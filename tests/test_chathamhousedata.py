@@ -4,15 +4,19 @@
 Unit tests for Chatham House data.
 
 '''
+import json
+from io import BytesIO
+
 import pytest
 from datetime import datetime
 
 from os.path import join
 
-from chathamhouse.chathamhousedata import get_camp_non_camp_populations, \
-    get_worldbank_series, generate_dataset_resources_and_showcase, check_name_dispersed, get_camptypes, \
+from chathamhouse.chathamhouseasyncdownload import FetchedDownload
+from chathamhouse.chathamhousedata import get_camp_non_camp_populations, get_unhcr_datasets, \
+    get_latest_unhcr_dataset, get_resource_names, \
+    get_worldbank_series, get_worldbank_indicators, get_slumratios_and_years, generate_dataset_resources_and_showcase, check_name_dispersed, get_camptypes, \
     get_camptypes_fallbacks, get_iso3
-from chathamhouse.chathamhousemodel import ChathamHouseModel
 from tests.expected_results import unhcr_non_camp_expected, unhcr_camp_expected, slum_ratios_expected, \
     country_totals_expected, all_camps_per_country_expected, camptypes_expected, smallcamptypes_expected, \
     camptypes_fallbacks_expected
@@ -38,6 +42,13 @@ class TestChathamHouseData:
             def json():
                 pass
 
+            @property
+            def raw(self):
+                return BytesIO(json.dumps(self.json()).encode('utf-8'))
+
+            def close(self):
+                pass
+
         class Download:
             @staticmethod
             def download(url):
@@ -74,22 +85,21 @@ class TestChathamHouseData:
                                   'latitude': '-8.81155'}]]
                     response.json = fn
                 return response
+
+            setup = download
         return Download()
 
     def test_get_camp_non_camp_populations(self, datasets, downloader):
-        all_camps_per_country, unhcr_non_camp, unhcr_camp, unhcr_camp_excluded = \
+        unhcr_populations, unhcr_camp = \
             get_camp_non_camp_populations('individual,undefined', 'self-settled,planned,collective,reception',
                                           {'Accommodation Type': {'Corum': 'Planned/managed camp',
                                            'MyCamp': 'Planned/managed camp'},
                                            'Country': {'MyCamp': 'ISL'},
                                            'Population': {'MyCamp': 1000}},
                                           datasets, downloader)
-        country_totals = dict()
-        for iso3 in all_camps_per_country:
-            country_totals[iso3] = ChathamHouseModel.sum_population(all_camps_per_country, iso3)
-        assert country_totals == country_totals_expected
-        assert all_camps_per_country == all_camps_per_country_expected
-        assert unhcr_non_camp == unhcr_non_camp_expected
+        assert unhcr_populations.get_totals() == country_totals_expected
+        assert unhcr_populations.get_nested() == all_camps_per_country_expected
+        assert unhcr_populations.get_nested('noncamp') == unhcr_non_camp_expected
         assert unhcr_camp == unhcr_camp_expected
 
     def test_get_worldbank_series(self, wbdownloader):
@@ -97,8 +107,34 @@ class TestChathamHouseData:
                                       wbdownloader)
         assert result == {'AUT': 0.66032, 'ZWE': 0.32277}
 
-    def test_get_slumratios(self, slumratios):
+    def test_get_worldbank_indicators(self, tmpdir):
+        contents = {'http://lala/urban': [None, [{'value': '66.032', 'country': {'value': 'Austria', 'id': 'AT'}}]],
+                    'http://lala/elec': [None, [{'value': 32.277, 'country': {'value': 'Zimbabwe', 'id': 'ZW'}},
+                                                {'value': None, 'country': {'value': 'Angola', 'id': 'AO'}}]]}
+        contents = {url: json.dumps(contents[url]).encode('utf-8') for url in contents}
+        fetched = list()
+
+        def open_downloader(urls):
+            fetched.extend(urls)
+            return FetchedDownload(contents)
+
+        urls = ['http://lala/urban', 'http://lala/elec']
+        expected = {'http://lala/urban': {'AUT': 0.66032}, 'http://lala/elec': {'ZWE': 0.32277}}
+        assert get_worldbank_indicators(urls, open_downloader, str(tmpdir), 3600) == expected
+        assert sorted(fetched) == sorted(urls)
+        assert get_worldbank_indicators(urls, open_downloader, str(tmpdir), 3600) == expected
+        assert len(fetched) == 2
+        assert get_worldbank_indicators(urls, open_downloader) == expected
+        assert len(fetched) == 4
+
+    def test_get_slumratios(self, slumratios, downloader):
         assert slumratios == slum_ratios_expected
+        _, slumratio_years = get_slumratios_and_years(join('tests', 'fixtures', 'MDG_Export_20170913_174700805.zip'),
+                                                      downloader)
+        assert sorted(slumratio_years) == sorted(slum_ratios_expected)
+        assert slumratio_years['AFG'] == 2014
+        assert slumratio_years['AGO'] == 2014
+        assert slum_ratios_expected['AGO'] == 0.555
 
     def test_get_camptypes(self, camptypes, smallcamptypes):
         assert camptypes == camptypes_expected
@@ -107,6 +143,12 @@ class TestChathamHouseData:
     def test_get_camptypes_fallbacks(self, camptypes_fallbacks):
         assert camptypes_fallbacks == camptypes_fallbacks_expected
 
+    def test_get_unhcr_datasets(self, datasets):
+        assert [dataset['dataset_date'] for dataset in get_unhcr_datasets(datasets)] == ['06/19/2015', '06/20/2017']
+        assert get_latest_unhcr_dataset(datasets)['dataset_date'] == '06/20/2017'
+        with pytest.raises(ValueError):
+            get_latest_unhcr_dataset(datasets[:1])
+
     def test_check_name_dispersed(self):
         assert check_name_dispersed('Burundi : Dispersed in the country / territory') is True
         assert check_name_dispersed('Afghanistan') is False
@@ -133,6 +175,8 @@ class TestChathamHouseData:
                              {'name': 'keyfigures.csv', 'format': 'csv',
                               'description': 'MEI Key Figures'}]
 
+        assert get_resource_names(['Urban', 'Small camps']) == [resource['name'] for resource in resources]
+
         assert showcase == {'title': 'Energy services for refugees and displaced people',
                             'notes': 'Click the image on the right to go to the energy services model',
                             'image_url': 'https://ars.els-cdn.com/content/image/X2211467X.jpg',
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House diagnostics.
+
+'''
+import logging
+from os.path import join
+
+from chathamhouse.chathamhousediagnostics import Diagnostics, record
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+
+
+class TestChathamHouseDiagnostics:
+    def test_diagnostics(self, configuration, tmpdir, caplog):
+        datadict = {'AFG': 0.5, 'PAK': 0.7, 'IRN': 0.3}
+        caplog.set_level(logging.INFO)
+        with Diagnostics(keep_events=True) as diagnostics:
+            ChathamHouseModel.calculate_regional_average('Slum ratio', datadict, 'TJK')
+            ChathamHouseModel.calculate_regional_average('Slum ratio', datadict, 'UZB')
+            ChathamHouseModel.calculate_regional_average('Grid CO2', datadict, 'TJK')
+            for i in range(5):
+                record('small_extra_camp', 'AFG', 'Camp %d' % i, 100 * i, 'planned', 'Afghanistan')
+        assert caplog.records == list()
+        assert diagnostics.get_counts() == {'regional_average': {'Slum ratio': 2, 'Grid CO2': 1},
+                                            'small_extra_camp': {'AFG': 5}}
+        summary = diagnostics.get_summary()
+        assert [(entry['event'], entry['level'], entry['count'], entry['keys']) for entry in summary] == \
+            [('small_extra_camp', 'INFO', 5, 1), ('regional_average', 'WARNING', 3, 2)]
+        assert summary[0]['examples'] == [
+            'Ignoring extra camp Camp %d from UNHCR data with population %d (<20000) and accommodation type planned in '
+            'country Afghanistan.' % (i, 100 * i) for i in range(3)]
+        assert summary[1]['examples'][0] == 'TJK: Slum ratio - Using Asia (main) average'
+        diagnostics.log_summary()
+        assert len(caplog.records) == 3
+        assert caplog.records[2].levelno == logging.WARNING
+        path = join(str(tmpdir), 'diagnostics.tsv')
+        diagnostics.write_events(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 8
+        assert lines[2] == 'WARNING\tregional_average\tGrid CO2\tTJK: Grid CO2 - Using Asia (main) average'
+        caplog.clear()
+        record('unmatched_country', 'Atlantis', 'Atlantis')
+        assert [x.getMessage() for x in caplog.records] == ['Country Atlantis could not be matched to ISO3 code!']
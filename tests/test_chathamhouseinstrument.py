@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House instrumentation.
+
+'''
+import io
+import json
+import threading
+from os.path import join
+
+from chathamhouse.chathamhouseasyncdownload import MeteredDownload
+from chathamhouse.chathamhousedata import check_name_dispersed
+from chathamhouse.chathamhouseinstrument import Instrumentation, get_row_counts, record_download
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhousestages import Pipeline, Stage
+
+
+class TestChathamHouseInstrument:
+    def test_get_row_counts(self):
+        outputs = {'results': [[['#hxl'], ['AFG'], ['AGO']], [['#hxl']]], 'slumratios': {'AFG': 0.5}, 'total': 3}
+        assert get_row_counts(outputs) == {'results': [2, 0], 'slumratios': 1}
+
+    def test_instrumentation(self, tmpdir):
+        def load(configuration):
+            record_download('http://example.com/numbers.csv', 100)
+            record_download('http://example.com/numbers.csv', 20)
+            return {'numbers': [check_name_dispersed('Camp %d' % x) for x in range(configuration['size'])]}
+
+        def total(numbers):
+            return {'total': sum(numbers)}
+
+        stages = [Stage('load', load, ['configuration'], ['numbers']), Stage('total', total, ['numbers'], ['total'])]
+        with Instrumentation(trace_memory=True) as instrumentation:
+            Pipeline(stages, instrumentation=instrumentation).run({'configuration': {'size': 1000}})
+        record_download('http://example.com/after.csv', 100)
+        check_name_dispersed('Dispersed in the country')
+        path = join(str(tmpdir), 'report.json')
+        instrumentation.write_report(path, {'slumratio_years': {'AFG': 2014}, 'results': list()})
+        with open(path) as f:
+            report = json.load(f)
+        assert [stage['stage'] for stage in report['stages']] == ['load', 'total']
+        load_stage = report['stages'][0]
+        assert load_stage['rows'] == {'numbers': 1000}
+        assert load_stage['peak_memory'] > 0
+        assert load_stage['wall'] >= 0 and load_stage['cpu'] >= 0
+        assert report['functions']['check_name_dispersed'] == {'calls': 1000}
+        assert report['downloads'] == {'http://example.com/numbers.csv': 120}
+        assert report['bytes_downloaded'] == 120
+        assert report['slumratio_years'] == {'AFG': 2014}
+        assert 'results' not in report
+
+    def test_metered_download(self, configuration):
+        path = join('tests', 'fixtures', 'Chatham House Constants and Lookups - CampTypes.csv')
+        with Instrumentation(trace_memory=False) as instrumentation:
+            with MeteredDownload(user_agent='test') as downloader:
+                session = downloader.session
+                downloader.session = None  # Hack for Tabulator local file issue
+                downloader.download_tabular_rows_as_dicts(path)
+                downloader.session = session
+        assert instrumentation.downloads[path] > 0
+
+    def test_metered_download_unknown_size(self, configuration):
+        class ClosedResponse:
+            raw = io.BytesIO(b'abc')
+
+        ClosedResponse.raw.close()
+        with Instrumentation(trace_memory=False) as instrumentation:
+            with MeteredDownload(user_agent='test') as downloader:
+                downloader.metered.append(('http://example.com/closed.csv', object()))
+                downloader.metered.append(('http://example.com/closed.csv', ClosedResponse()))
+        assert instrumentation.downloads == dict()
+
+    def test_thread_calls(self):
+        def calculate(model):
+            for i in range(100):
+                model.calculate_number_hh(i)
+                check_name_dispersed('Camp %d' % i)
+            model.calculate_offgrid_solid('Baseline', 10, dict(), None, dict(), dict(), 0.5, 10, dict(), None, dict())
+
+        model = ChathamHouseModel({'Household Size': 5})
+        with Instrumentation() as instrumentation:
+            threads = [threading.Thread(target=calculate, args=(model,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        functions = instrumentation.get_report()['functions']
+        assert 'ChathamHouseModel.calculate_number_hh' not in functions
+        assert functions['check_name_dispersed'] == {'calls': 400}
+        assert functions['ChathamHouseModel.calculate_offgrid_solid']['calls'] == 4
+        assert functions['ChathamHouseModel.calculate_offgrid_solid']['wall'] > 0
+        assert instrumentation.get_report()['stages'] == list()
+        assert not hasattr(ChathamHouseModel.calculate_offgrid_solid, '__wrapped__')
+        assert not hasattr(ChathamHouseModel.add_keyfigures, '__wrapped__')
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House model kernels.
+
+'''
+import sys
+
+import pytest
+
+from chathamhouse.chathamhousekernels import get_kernels, python_kernels
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+
+
+class TestChathamHouseKernels:
+    @pytest.fixture(scope='function')
+    def kernels(self):
+        yield
+        ChathamHouseModel.kernels = python_kernels
+
+    @staticmethod
+    def calculate(lightingoffgridcost, elecgriddirectenergy, cookingsolidcost):
+        model = ChathamHouseModel({'Household Size': 5, 'Electricity Cost': 25, 'Cooking LPG NonCamp Price': 1.8,
+                                   'Kerosene CO2 Emissions': 2.96, 'Lighting Offgrid Scaling Factor': 1,
+                                   'Cooking Solid Scaling Factor': 1, 'Lighting Grid Tier': 2,
+                                   'Cooking LPG Fallback': 4})
+        results = list()
+        for number_hh in (8746.8, 1367.263, 0, 25000):
+            for ratio in (0.7, 0.055, 0.3, 1):
+                hh_access, hh_noaccess = model.calculate_hh_access(number_hh, ratio)
+                results.append((hh_access, hh_noaccess))
+                results.append(model.calculate_ongrid_lighting(hh_access, {0: 3, 1: 35, 2: 194}, 92.6033836492,
+                                                               0.0375))
+                results.append(model.calculate_ongrid_lighting(hh_access, {0: 3, 1: 35, 2: 194}, 0.0, 0.2))
+                results.append(model.calculate_non_solid_cooking(hh_access, 4.096473669))
+                results.append(model.calculate_non_solid_cooking(hh_access, 0.0))
+                for baseline_target in ('Baseline', 'Target'):
+                    for comtype in (2, 3, 6):
+                        results.append(model.calculate_offgrid_lighting(baseline_target, hh_noaccess, comtype,
+                                                                        lightingoffgridcost, elecgriddirectenergy,
+                                                                        0.0375))
+                    for comtype in (1, 2, 8):
+                        results.append(model.calculate_solid_cooking(baseline_target, hh_noaccess, comtype,
+                                                                     cookingsolidcost))
+        return results
+
+    def test_python(self, kernels, monkeypatch, lightingoffgridcost, elecgriddirectenergy, cookingsolidcost):
+        monkeypatch.setitem(sys.modules, 'numba', None)
+        assert get_kernels() is python_kernels
+        ChathamHouseModel.set_kernels('auto')
+        assert ChathamHouseModel.kernels is python_kernels
+        results = self.calculate(lightingoffgridcost, elecgriddirectenergy, cookingsolidcost)
+        assert results[:3] == [(6122.759999999999, 2624.04), (0.14174707331799394, 21.262060997699088),
+                               (0.29695385999999996, 237.563088)]
+        with pytest.raises(ImportError):
+            get_kernels('numba')
+        with pytest.raises(ValueError):
+            get_kernels('lala')
+
+    def test_numba(self, kernels, lightingoffgridcost, elecgriddirectenergy, cookingsolidcost):
+        pytest.importorskip('numba')
+        expected = self.calculate(lightingoffgridcost, elecgriddirectenergy, cookingsolidcost)
+        ChathamHouseModel.set_kernels('numba')
+        assert ChathamHouseModel.kernels.backend == 'numba'
+        assert self.calculate(lightingoffgridcost, elecgriddirectenergy, cookingsolidcost) == expected
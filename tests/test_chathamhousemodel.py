@@ -88,11 +88,14 @@ class TestChathamHouseModel:
 
         displaced_population = unhcr_non_camp[iso3]
         number_hh_by_pop_type = model.calculate_population(iso3, displaced_population, urbanratios, slumratios, list())
-        assert number_hh_by_pop_type == {'Rural': 1389.3629848179437, 'Slum': 7601.16815388216,
-                                         'Urban': 3003.4688612998957}
+        assert number_hh_by_pop_type == {'Rural': 1389.3629848179437, 'Slum': 6908.3318688902655,
+                                         'Urban': 3696.305146291791}
         number_hh_by_pop_type = model.calculate_population(iso3, displaced_population, urbanratios, {iso3: 0.658}, list())
         assert number_hh_by_pop_type == {'Rural': 1389.3629848179437, 'Slum': 6977.851155989793,
                                          'Urban': 3626.785859192263}
+        info = list()
+        model.calculate_population('AGO', displaced_population, {'ZMB': 0.4}, {'ZMB': 0.3}, info)
+        assert [str(record) for record in info] == ['ur(202)=0.4', 'sr(202)=0.3']
         pop_type = 'Rural'
         number_hh = number_hh_by_pop_type[pop_type]
         country_elec_access = 0.055
@@ -315,12 +318,6 @@ class TestChathamHouseModel:
         mostfreq = ChathamHouseModel.calculate_mostfrequent({'a': 1, 'b': 5, 'c': 5, 'd': 3, 'e': 4})
         assert mostfreq == 5
 
-    def test_sum_population(self):
-        remdict = {'AFG': {'individual': {'a': 10, 'b': 20}}, 'BUR': {'self-settled': {'c': 12, 'd': 21}}}
-        pop = ChathamHouseModel.sum_population({'AFG': {'individual': {'a': 10, 'b': 20}}}, 'AFG', remdict)
-        assert pop == 30
-        assert remdict == {'AFG': {'individual': {}}, 'BUR': {'self-settled': {'c': 12, 'd': 21}}}
-
     def test_reset_pop_counters(self):
         model = ChathamHouseModel(dict())
         model.reset_pop_counters()
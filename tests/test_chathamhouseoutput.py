@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House output.
+
+'''
+import gzip
+import json
+import threading
+from os.path import exists, join
+
+import pytest
+
+from chathamhouse.chathamhouseoutput import compress_resource, get_compression_level, write_columnar_resources, \
+    write_resource, write_resource_files
+from chathamhouse.chathamhouseprovenance import get_provenance, get_record
+from chathamhouse.chathamhouserows import CountryRow, TopLineRow, blank
+
+
+class TestChathamHouseOutput:
+    def test_write_resource_files(self, tmpdir):
+        folder = str(tmpdir)
+        resources = [{'name': 'table%d.csv' % i} for i in range(6)]
+        headers = [['Name', 'Value'] for _ in resources]
+        results = [[['#name', '#value'], ['a', i], ['b', i * 2]] for i in range(6)]
+        uploaded = dict()
+
+        def upload(resource, path):
+            assert threading.current_thread() is threading.main_thread()
+            uploaded[resource['name']] = path
+
+        paths, compressed_resources, sizes = write_resource_files(results, headers, resources, folder, upload,
+                                                                  max_writers=3)
+        assert paths == [join(folder, resource['name']) for resource in resources]
+        assert uploaded == {resource['name']: path for resource, path in zip(resources, paths)}
+        assert compressed_resources == list()
+        assert sizes == {resource['name']: None for resource in resources}
+        for path in paths:
+            assert exists(path)
+        with open(paths[3]) as f:
+            assert f.read().splitlines() == ['Name,Value', '#name,#value', 'a,3', 'b,6']
+
+    def test_write_compressed_resource_files(self, tmpdir):
+        folder = str(tmpdir)
+        resources = [{'name': 'urban_consumption.csv', 'description': 'Urban consumption', 'format': 'csv'},
+                     {'name': 'keyfigures.csv', 'format': 'csv'}]
+        headers = [['Country Name', 'Info'] for _ in resources]
+        results = [[['#country+name', '#meta+info']] + [['Afghanistan', 'elco2(034)=0.42'] for _ in range(200)]
+                   for _ in resources]
+        uploaded = dict()
+
+        def upload(resource, path):
+            uploaded[resource['name']] = path
+
+        paths, compressed_resources, sizes = \
+            write_resource_files(results, headers, resources, folder, upload, compression='gzip',
+                                 compression_levels={'default': 1, 'keyfigures.csv': 9})
+        assert paths == [join(folder, 'urban_consumption.csv'), join(folder, 'keyfigures.csv')]
+        assert compressed_resources == [{'name': 'urban_consumption.csv.gz', 'format': 'gz',
+                                         'description': 'Urban consumption (gzip compressed)'},
+                                        {'name': 'keyfigures.csv.gz', 'format': 'gz'}]
+        assert uploaded == {'urban_consumption.csv': paths[0], 'keyfigures.csv': paths[1],
+                            'urban_consumption.csv.gz': '%s.gz' % paths[0], 'keyfigures.csv.gz': '%s.gz' % paths[1]}
+        for i, path in enumerate(paths):
+            size = sizes[resources[i]['name']]
+            assert size['compressed'] < size['raw']
+            assert size['seconds'] >= 0
+            with gzip.open('%s.gz' % path) as f:
+                with open(path, 'rb') as rawf:
+                    assert f.read() == rawf.read()
+
+    def test_compress_resource(self, tmpdir):
+        path = join(str(tmpdir), 'camp_consumption.csv')
+        with open(path, 'w') as f:
+            f.write('Kenya,Firewood-dependent\n' * 100)
+        with pytest.raises(ValueError):
+            compress_resource(path, 'lzma')
+        zstandard = pytest.importorskip('zstandard')
+        compressed_path, size = compress_resource(path, 'zstd', 3)
+        assert compressed_path == '%s.zst' % path
+        with open(compressed_path, 'rb') as f:
+            assert zstandard.ZstdDecompressor().stream_reader(f).read() == b'Kenya,Firewood-dependent\n' * 100
+        assert size['raw'] == 2500
+
+    def test_get_compression_level(self):
+        assert get_compression_level(None, 'keyfigures.csv') is None
+        levels = {'default': 6, 'keyfigures.csv': 9}
+        assert get_compression_level(levels, 'keyfigures.csv') == 9
+        assert get_compression_level(levels, 'camp_consumption.csv') == 6
+
+    def test_write_columnar_resources(self, tmpdir):
+        folder = str(tmpdir)
+        info = get_provenance([get_record('elco2', '034', 0.42)])
+        results = [[['#country+code', '#country+name', '#population+num'], CountryRow('AFG', 'Afghanistan', 100)],
+                   [TopLineRow('MEI04', 'Countries', 1, '2017-06-20', 'MEI', 'http://x', blank, blank, 'count')],
+                   [['#country+name', '#meta+info'], ['Afghanistan', info]]]
+        headers = [['ISO3 Country Code', 'Country Name', 'Population'], list(TopLineRow.fields),
+                   ['Country Name', 'Info']]
+        resources = [{'name': 'population.csv'}, {'name': 'keyfigures.csv'}, {'name': 'urban_consumption.csv'}]
+        paths = write_columnar_resources(results, headers, resources, folder)
+        assert paths == [join(folder, 'population.columns.json'), join(folder, 'keyfigures.columns.json'),
+                         join(folder, 'urban_consumption.columns.json')]
+        with open(paths[1]) as f:
+            columns = json.load(f)['columns']
+        assert columns[6] == {'name': 'notes', 'hxl': None, 'values': [None]}
+        with open(paths[2]) as f:
+            columns = json.load(f)['columns']
+        assert columns[1] == {'name': 'Info', 'hxl': '#meta+info', 'values': ['elco2(034)=0.42']}
+        path = write_resource(results[1], join(folder, 'keyfigures.csv'), headers[1])
+        with open(path) as f:
+            assert f.read().splitlines()[1] == 'MEI04,Countries,1,2017-06-20,MEI,http://x,,,count'
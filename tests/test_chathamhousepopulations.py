@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House populations.
+
+'''
+import pickle
+
+import pytest
+
+from chathamhouse.chathamhousepopulations import PopulationTable
+
+
+class TestChathamHousePopulations:
+    @pytest.fixture(scope='function')
+    def populations(self):
+        populations = PopulationTable()
+        populations.add('AFG', 'individual', 'Kabul', 10, 'noncamp')
+        populations.add('BDI', 'planned', 'Musasa', 12, 'camp')
+        populations.add('AFG', 'individual', 'Kabul', 20, 'noncamp')
+        populations.add('AFG', 'planned', 'Zaranj', 25000, 'camp')
+        populations.add('AFG', 'planned', 'Bagram', 30000, 'camp')
+        populations.add('BDI', 'unknown', 'Bujumbura', 21, 'excluded')
+        populations.add('RWA', 'planned', 'Bujumbura', 5, 'excluded')
+        for i in range(10):
+            populations.add('TZA', 'self-settled', 'Camp %d' % i, i, 'camp')
+        return populations
+
+    def test_totals(self, populations):
+        assert len(populations) == 16
+        assert populations.get_totals() == {'AFG': 55030, 'BDI': 33, 'RWA': 5, 'TZA': 45}
+        assert populations.get_totals('excluded') == {'BDI': 21, 'RWA': 5}
+        assert populations.get_nested('noncamp') == {'AFG': {'individual': {'Kabul': 30}}}
+        assert populations.get_nested()['BDI'] == {'planned': {'Musasa': 12}, 'unknown': {'Bujumbura': 21}}
+        assert populations.get_type('Bujumbura', 'excluded') == 'unknown'
+        assert populations.get_type('Musasa', 'excluded') is None
+        assert populations.get_type('Musasa', 'camp') == 'planned'
+        assert populations.get_type('Lala', 'camp') is None
+
+    def test_consume(self, populations):
+        assert populations.get_totals('noncamp', consume=True) == {'AFG': 30}
+        populations.consume('AFG', 'planned', 'Zaranj')
+        populations.consume('TZA', 'self-settled', 'Camp 9')
+        with pytest.raises(KeyError):
+            populations.consume('AFG', 'individual', 'Zaranj')
+        populations = pickle.loads(pickle.dumps(populations))
+        remaining = populations.get_remaining()
+        assert remaining['AFG'] == [('planned', 'Bagram', 30000)]
+        assert remaining['BDI'] == [('planned', 'Musasa', 12), ('unknown', 'Bujumbura', 21)]
+        assert [name for _, name, _ in remaining['TZA']] == ['Camp %d' % i for i in range(9)]
+        assert populations.get_totals() == {'AFG': 55030, 'BDI': 33, 'RWA': 5, 'TZA': 45}
+        assert populations.get_type('Bujumbura', 'excluded') == 'unknown'
@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House profiling.
+
+'''
+import pstats
+import time
+from os.path import join
+
+from chathamhouse.chathamhouseinstrument import Instrumentation
+from chathamhouse.chathamhousepopulations import PopulationTable
+from chathamhouse.chathamhouseprofile import Profiler
+from chathamhouse.chathamhousestages import Pipeline, Stage
+
+
+class TestChathamHouseProfile:
+    def test_profiler(self, tmpdir):
+        def load(configuration):
+            totals = PopulationTable()
+            for i in range(configuration['size']):
+                totals.add('AFG', 'planned', 'Camp %d' % i, i, 'camp')
+            return {'totals': totals}
+
+        def total(totals):
+            end = time.perf_counter() + 0.2
+            population = 0
+            while time.perf_counter() < end:
+                population = totals.get_totals()['AFG']
+            return {'population': population}
+
+        folder = str(tmpdir)
+        stages = [Stage('load', load, ['configuration'], ['totals']), Stage('total', total, ['totals'], ['population'])]
+        with Instrumentation(trace_memory=False) as instrumentation, Profiler(folder, interval=0.001) as profiler:
+            context = Pipeline(stages, instrumentation=instrumentation, profiler=profiler).run(
+                {'configuration': {'size': 100}})
+        assert context['population'] == 4950
+        stats = pstats.Stats(join(folder, 'total.pstats')).stats
+        assert any(funcname == 'get_totals' for _, _, funcname in stats)
+        stats = pstats.Stats(join(folder, 'load.pstats')).stats
+        assert not any(funcname == 'get_totals' for _, _, funcname in stats)
+        with open(join(folder, 'stacks.collapsed')) as f:
+            lines = f.read().splitlines()
+        assert profiler.samples > 0
+        total_lines = [line for line in lines if line.startswith('total;')]
+        assert any('PopulationTable.get_totals (chathamhousepopulations.py)' in line for line in total_lines)
+        assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
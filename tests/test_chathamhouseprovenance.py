@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House provenance.
+
+'''
+import pickle
+
+from chathamhouse.chathamhouseprovenance import Provenance, clear_interned, get_provenance, get_record, \
+    interned_provenances, interned_records
+
+
+class TestChathamHouseProvenance:
+    def test_provenance(self):
+        urbanratio = get_record('ur', 145, 0.57312)
+        assert get_record('ur', 145, 0.57312) is urbanratio
+        assert str(urbanratio) == 'ur(145)=0.573'
+        assert str(get_record('Matched', value='Kakuma')) == 'Matched Kakuma'
+        assert str(get_record('Stale', 'slumratios', '2017-09-13')) == 'Stale slumratios(2017-09-13)'
+        assert str(get_record('UNHCR only')) == 'UNHCR only'
+        info = get_provenance([urbanratio, get_record('elco2', '001', 0.42)])
+        assert get_provenance([urbanratio, get_record('elco2', '001', 0.42)]) is info
+        assert str(info) == 'ur(145)=0.573,elco2(001)=0.42'
+        fallback = info.add(get_record('Fallback'))
+        assert fallback is info.add(get_record('Fallback'))
+        assert str(fallback) == 'ur(145)=0.573,elco2(001)=0.42,Fallback'
+        assert len(info) == 2
+        assert info.find('elco2') == [('elco2', '001', 0.42)]
+        assert str(get_provenance()) == ''
+        assert not get_provenance()
+        unpickled = pickle.loads(pickle.dumps(fallback))
+        assert isinstance(unpickled, Provenance)
+        assert unpickled == fallback
+        assert str(unpickled) == str(fallback)
+
+    def test_clear_interned(self):
+        info = get_provenance([get_record('sr', 145, 0.25)])
+        clear_interned()
+        assert interned_records == dict()
+        assert interned_provenances == dict()
+        assert str(info) == 'sr(145)=0.25'
+        assert get_provenance([get_record('sr', 145, 0.25)]) == info
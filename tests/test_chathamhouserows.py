@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House rows.
+
+'''
+import pickle
+
+import pytest
+
+from chathamhouse.chathamhouseprovenance import get_provenance, get_record
+from chathamhouse.chathamhouserows import Blank, CampRow, CountryRow, TopLineRow, blank, get_columns
+
+
+class TestChathamHouseRows:
+    def test_blank(self):
+        assert Blank() is blank
+        assert not blank
+        assert str(blank) == ''
+        assert blank == '' and '' == blank
+        assert blank != 0
+        assert pickle.loads(pickle.dumps(blank)) is blank
+
+    def test_row(self):
+        info = get_provenance([get_record('elco2', '001', 0.42)])
+        row = CampRow('KEN', 'Kenya', 'Kakuma', 45000, 'Baseline', 4, 'Solar/diesel', 1.5, 2.5, 0.1, blank, blank,
+                      blank, blank, blank, info)
+        assert not hasattr(row, '__dict__')
+        assert len(row) == 16
+        assert row.camp == 'Kakuma'
+        assert row[3] == 45000
+        assert row[-1] is info
+        assert row[:5] == ['KEN', 'Kenya', 'Kakuma', 45000, 'Baseline']
+        assert row == ['KEN', 'Kenya', 'Kakuma', 45000, 'Baseline', 4, 'Solar/diesel', 1.5, 2.5, 0.1, '', '', '', '',
+                       '', info]
+        row[-1] = info.add(get_record('Fallback'))
+        assert str(row.info) == 'elco2(001)=0.42,Fallback'
+        unpickled = pickle.loads(pickle.dumps(row))
+        assert unpickled == row
+        assert unpickled.cooking_type is blank
+        assert [0] + list(CountryRow('KEN', 'Kenya', 45000)) == [0, 'KEN', 'Kenya', 45000]
+        with pytest.raises(TypeError):
+            CountryRow('KEN', 'Kenya')
+
+    def test_get_columns(self):
+        rows = [['#country+code', '#country+name', '#population+num'], CountryRow('AFG', 'Afghanistan', 100),
+                CountryRow('AGO', 'Angola', blank)]
+        assert get_columns(rows, ['ISO3 Country Code', 'Country Name', 'Population']) == [
+            {'name': 'ISO3 Country Code', 'hxl': '#country+code', 'values': ['AFG', 'AGO']},
+            {'name': 'Country Name', 'hxl': '#country+name', 'values': ['Afghanistan', 'Angola']},
+            {'name': 'Population', 'hxl': '#population+num', 'values': [100, None]}]
+        rows = [TopLineRow('MEI04', 'Countries', 2, '2017-06-20', 'MEI', 'http://x', blank, blank, 'count')]
+        columns = get_columns(rows, TopLineRow.fields)
+        assert columns[2] == {'name': 'value', 'hxl': None, 'values': [2]}
+        assert columns[6] == {'name': 'notes', 'hxl': None, 'values': [None]}
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House service.
+
+'''
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from chathamhouse.chathamhouseservice import ChathamHouseService, SourceMonitor
+from chathamhouse.chathamhousestages import Stage
+
+
+class TestChathamHouseService:
+    class FakeMonitor:
+        def __init__(self):
+            self.changed = list()
+
+        def check(self):
+            if self.changed:
+                return self.changed.pop(0)
+            return set()
+
+    class FakeResponse:
+        def __init__(self, headers, content=b'', status_code=200):
+            self.headers = headers
+            self.content = content
+            self.status_code = status_code
+            self.ok = status_code < 400
+
+        def raise_for_status(self):
+            if not self.ok:
+                raise ValueError(self.status_code)
+
+        def iter_content(self, chunk_size=1):
+            return [self.content]
+
+        def close(self):
+            pass
+
+    class FakeSession:
+        def __init__(self):
+            self.sources = dict()
+            self.gets = list()
+
+        def head(self, url, **kwargs):
+            headers, content = self.sources[url]
+            if headers is None:
+                return TestChathamHouseService.FakeResponse(dict(), status_code=405)
+            return TestChathamHouseService.FakeResponse(headers)
+
+        def get(self, url, **kwargs):
+            self.gets.append(url)
+            return TestChathamHouseService.FakeResponse(dict(), self.sources[url][1])
+
+    @pytest.fixture(scope='function')
+    def calls(self):
+        return list()
+
+    @pytest.fixture(scope='function')
+    def stages(self, calls):
+        def load(configuration):
+            calls.append('load')
+            return {'numbers': list(range(configuration['size']))}
+
+        def consume(numbers):
+            calls.append('consume')
+            total = 0
+            while numbers:
+                total += numbers.pop()
+            return {'total': total}
+
+        def table(total, today):
+            calls.append('table')
+            return {'headers': [['Total']], 'results': [[[total]]], 'resources': [{'name': 'total.csv'}],
+                    'compressed_resources': [{'name': 'total.csv.gz'}]}
+
+        return [Stage('load', load, ['configuration'], ['numbers']),
+                Stage('consume', consume, ['numbers'], ['total']),
+                Stage('table', table, ['total', 'today'], ['headers', 'results', 'resources', 'compressed_resources'])]
+
+    @pytest.fixture(scope='function')
+    def service(self, tmpdir, stages):
+        return ChathamHouseService({'size': 5}, stages=stages, monitor=TestChathamHouseService.FakeMonitor(),
+                                  folder=str(tmpdir), snapshot_stages=('load',))
+
+    def test_refresh(self, service, calls):
+        service.monitor.changed.append({'load'})
+        assert service.refresh() is True
+        assert calls == ['load', 'consume', 'table']
+        assert service.get_table()['rows'] == [[10]]
+        del calls[:]
+        assert service.refresh() is False
+        assert calls == list()
+        service.configuration['size'] = 6
+        service.monitor.changed.append({'consume'})
+        assert service.refresh() is True
+        assert calls == ['consume', 'table']
+        assert service.get_table('total.csv')['rows'] == [[10]]
+        del calls[:]
+        assert service.refresh(force=True) is True
+        assert calls == ['consume', 'table']
+        assert service.get_table()['rows'] == [[10]]
+        del calls[:]
+        service.monitor.changed.append({'load'})
+        assert service.refresh() is True
+        assert calls == ['load', 'consume', 'table']
+        assert service.get_table()['rows'] == [[15]]
+        assert service.get_table('lala.csv') is None
+
+    def test_server(self, service):
+        server = service.create_server('127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+        try:
+            with pytest.raises(Exception):
+                urlopen('%s/results' % url)
+            service.refresh(force=True)
+            with urlopen('%s/results/total.csv' % url) as response:
+                assert json.loads(response.read().decode('utf-8'))['rows'] == [[10]]
+            with pytest.raises(HTTPError) as excinfo:
+                urlopen('%s/results/total.csv.gz' % url)
+            assert excinfo.value.code == 404
+            with urlopen('%s/status' % url) as response:
+                assert json.loads(response.read().decode('utf-8'))['running'] is False
+            with urlopen(Request('%s/run?force=1' % url, data=b'', method='POST')) as response:
+                assert response.status == 202
+            assert service.trigger.is_set()
+            assert service.force is True
+            with pytest.raises(Exception):
+                urlopen(Request('%s/whatif/camp' % url, data=b'{"country": "KEN", "population": 10}',
+                                method='POST'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_has_changed(self):
+        monitor = SourceMonitor(dict())
+        session = TestChathamHouseService.FakeSession()
+        session.sources['http://lala/etag'] = {'ETag': '"1"'}, b'a'
+        session.sources['http://lala/length'] = {'Content-Length': '1'}, b'a'
+        session.sources['http://lala/nohead'] = None, b'a'
+        session.sources['http://lala/noheaders'] = dict(), b'a'
+        for url in session.sources:
+            assert monitor.has_changed(session, url) is True
+            assert monitor.has_changed(session, url) is False
+        assert session.gets == ['http://lala/nohead', 'http://lala/nohead', 'http://lala/noheaders',
+                                'http://lala/noheaders']
+        session.sources['http://lala/etag'] = {'ETag': '"2"'}, b'b'
+        session.sources['http://lala/length'] = {'Content-Length': '2'}, b'bb'
+        session.sources['http://lala/nohead'] = None, b'b'
+        session.sources['http://lala/noheaders'] = dict(), b'a'
+        assert [monitor.has_changed(session, url) for url in session.sources] == [True, True, True, False]
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House sources.
+
+'''
+import threading
+import time
+
+import pytest
+
+from chathamhouse.chathamhouseprovenance import get_provenance, get_record
+from chathamhouse.chathamhousesources import SourceGuard, flag_stale_sources, guard_loader
+
+
+class TestChathamHouseSources:
+    @pytest.fixture(scope='function')
+    def guard(self, tmpdir):
+        return SourceGuard(str(tmpdir), {'default': 5, 'slow': 0.05}, failure_threshold=2)
+
+    def test_load(self, guard):
+        release = threading.Event()
+
+        def load(configuration):
+            if configuration.get('fail'):
+                raise ValueError('Source failed!')
+            if configuration.get('slow'):
+                release.wait(5)
+            return {'values': configuration['values']}
+
+        with pytest.raises(ValueError):
+            guard.load('slow', load, {'fail': True})
+        outputs, status = guard.load('slow', load, {'values': [1, 2]})
+        assert outputs == {'values': [1, 2]}
+        assert status == {'stale': False}
+        outputs, status = guard.load('slow', load, {'values': [3, 4], 'slow': True})
+        assert outputs == {'values': [1, 2]}
+        assert status['stale'] is True
+        assert status['reason'] == 'deadline'
+        release.set()
+        guard.wait(5)
+        assert guard.load_last_good('slow')['outputs'] == {'values': [3, 4]}
+        assert not guard.is_open('slow')
+        outputs, status = guard.load('slow', load, {'values': [5, 6], 'fail': True})
+        assert outputs == {'values': [3, 4]}
+        assert status['reason'] == 'error'
+        guard.wait(5)
+        assert guard.is_open('slow')
+        outputs, status = guard.load('slow', load, {'values': [7, 8]})
+        assert outputs == {'values': [3, 4]}
+        assert status['reason'] == 'circuit open'
+        guard.wait(5)
+        assert not guard.is_open('slow')
+        assert guard.load('slow', load, {'values': [9]}) == ({'values': [9]}, {'stale': False})
+
+    def test_late_source(self, guard):
+        def load(configuration):
+            time.sleep(configuration['sleep'])
+            return {'values': [1]}
+
+        guard.load('slow', load, {'sleep': 0})
+        for _ in range(2):
+            outputs, status = guard.load('slow', load, {'sleep': 0.2})
+            assert status['reason'] == 'deadline'
+            guard.wait(5)
+        assert guard.is_open('slow')
+        outputs, status = guard.load('slow', load, {'sleep': 0.2})
+        assert status['reason'] == 'circuit open'
+        guard.wait(5)
+        assert guard.is_open('slow')
+
+    def test_guard_loader(self):
+        load = guard_loader('slumratios', lambda configuration: {'slumratios': {'AFG': 0.5}})
+        assert load({}) == {'slumratios': {'AFG': 0.5}, 'source_slumratios': {'stale': False}}
+
+    def test_flag_stale_sources(self):
+        pop_types = ['Urban', 'Camp']
+        results = [[['#info'], ['AFG', get_provenance()], ['AGO', get_provenance([get_record('elco2', 'SSA', 0.1)])]],
+                   [['#info'], ['AFG', 'Kabul', get_provenance()]]]
+        stale = {'stale': True, 'reason': 'deadline', 'saved': '2017-09-13T17:47:00'}
+        outputs = flag_stale_sources(pop_types, results, source_slumratios=stale,
+                                     source_camptables={'stale': False})
+        assert outputs['source_status'] == {'slumratios': stale}
+        assert [[[str(x) for x in row] for row in table] for table in results] == \
+            [[['#info'], ['AFG', 'Stale slumratios(2017-09-13)'], ['AGO', 'elco2(SSA)=0.1,Stale slumratios(2017-09-13)']],
+             [['#info'], ['AFG', 'Kabul', '']]]
+        flag_stale_sources(pop_types, results, source_constants=stale)
+        assert str(results[1][1][2]) == 'Stale constants(2017-09-13)'
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House stages.
+
+'''
+import gzip
+import threading
+from datetime import datetime
+from os.path import exists, join
+
+import pytest
+
+from chathamhouse.chathamhousedata import get_resource_names
+from chathamhouse.chathamhousediagnostics import Diagnostics
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhousepopulations import PopulationTable
+from chathamhouse.chathamhouseprovenance import get_provenance, get_record, interned_provenances
+from chathamhouse.chathamhousestages import Pipeline, Stage, get_extra_camp_type_rows, get_stages, \
+    resolve_extra_camp_types, run_camp_model, run_noncamp_model, write_resources
+
+
+class TestChathamHouseStages:
+    @pytest.fixture(scope='function')
+    def calls(self):
+        return list()
+
+    @pytest.fixture(scope='function')
+    def stages(self, calls):
+        def load(configuration):
+            calls.append('load')
+            return {'numbers': list(range(configuration['size']))}
+
+        def total(numbers):
+            calls.append('total')
+            return {'total': sum(numbers)}
+
+        def double(total):
+            calls.append('double')
+            return {'doubled': total * 2}
+
+        return [Stage('load', load, ['configuration'], ['numbers']),
+                Stage('total', total, ['numbers'], ['total']),
+                Stage('double', double, ['total'], ['doubled'], cache=False)]
+
+    def test_run(self, stages, calls):
+        context = Pipeline(stages).run({'configuration': {'size': 5}})
+        assert context['numbers'] == [0, 1, 2, 3, 4]
+        assert context['total'] == 10
+        assert context['doubled'] == 20
+        assert calls == ['load', 'total', 'double']
+
+    def test_run_forgets_interned(self, stages):
+        def info(doubled):
+            return {'info': get_provenance([get_record('sr', 145, doubled)])}
+
+        stages.append(Stage('info', info, ['doubled'], ['info']))
+        context = Pipeline(stages).run({'configuration': {'size': 5}})
+        assert str(context['info']) == 'sr(145)=20'
+        assert interned_provenances == dict()
+
+    def test_cache(self, tmpdir, stages, calls):
+        folder = str(tmpdir)
+        Pipeline(stages, cache_folder=folder).run({'configuration': {'size': 5}})
+        del calls[:]
+        context = Pipeline(stages, cache_folder=folder).run({'configuration': {'size': 5}})
+        assert context['doubled'] == 20
+        assert calls == ['double']
+        del calls[:]
+        context = Pipeline(stages, cache_folder=folder).run({'configuration': {'size': 6}})
+        assert context['doubled'] == 30
+        assert calls == ['load', 'total', 'double']
+        del calls[:]
+        Pipeline(stages, cache_folder=folder, rerun=['load']).run({'configuration': {'size': 6}})
+        assert calls == ['load', 'total', 'double']
+
+    def test_checkpoint_resume(self, tmpdir, stages, calls):
+        folder = str(tmpdir)
+        stages[0].checkpoint = True
+        stages[1].checkpoint = True
+        expected = Pipeline(stages).run({'configuration': {'size': 5}})
+        del calls[:]
+        function = stages[2].function
+
+        def fail(total):
+            raise IOError('Failed!')
+
+        stages[2].function = fail
+        with pytest.raises(IOError):
+            Pipeline(stages, checkpoint_folder=folder).run({'configuration': {'size': 5}})
+        assert calls == ['load', 'total']
+        del calls[:]
+        stages[2].function = function
+        context = Pipeline(stages, checkpoint_folder=folder, resume=True).run({'configuration': {'size': 7}})
+        assert calls == ['double']
+        assert context == expected
+        del calls[:]
+        Pipeline(stages, checkpoint_folder=folder, resume=True).run({'configuration': {'size': 5}})
+        assert calls == ['load', 'total', 'double']
+
+    def test_dependencies(self, stages):
+        stages.append(Stage('other', lambda configuration: {'other': 1}, ['configuration'], ['other']))
+        stages.append(Stage('update', lambda numbers, other: {'numbers': numbers}, ['numbers', 'other'],
+                            ['numbers']))
+        assert Pipeline(stages).get_dependencies() == {'load': set(), 'total': {'load'}, 'double': {'total'},
+                                                       'other': set(), 'update': {'load', 'total', 'other'}}
+        assert Pipeline.is_updating(stages[-1]) is True
+        assert Pipeline.is_updating(stages[0]) is False
+
+    def test_run_concurrently(self, tmpdir, stages, calls):
+        started = threading.Event()
+
+        def slow(configuration):
+            # only finishes if the load and total stages were able to run alongside it
+            assert started.wait(5)
+            calls.append('slow')
+            return {'slow': configuration['size']}
+
+        def total(numbers):
+            started.set()
+            calls.append('total')
+            return {'total': sum(numbers)}
+
+        stages.insert(0, Stage('slow', slow, ['configuration'], ['slow'], checkpoint=True))
+        stages[2].function = total
+        stages[2].checkpoint = True
+        pipeline = Pipeline(stages, max_workers=2, checkpoint_folder=str(tmpdir))
+        context = pipeline.run({'configuration': {'size': 5}})
+        assert context['doubled'] == 20
+        assert context['slow'] == 5
+        assert calls.index('total') < calls.index('slow')
+        assert sorted(entry['stage'] for entry in pipeline.timeline) == ['double', 'load', 'slow', 'total']
+        assert not exists(join(str(tmpdir), 'checkpoint.pkl'))
+
+    def test_bad_stages(self, stages):
+        with pytest.raises(ValueError):
+            Pipeline(stages, rerun=['lala'])
+        stages.append(Stage('bad', lambda doubled: {'lala': doubled}, ['doubled'], ['tripled']))
+        with pytest.raises(ValueError):
+            Pipeline(stages).run({'configuration': {'size': 2}})
+
+    def test_get_stages(self):
+        outputs = {'configuration', 'today', 'folder'}
+        for stage in get_stages():
+            for name in stage.inputs:
+                assert name in outputs
+            outputs.update(stage.outputs)
+
+    def test_resolve_extra_camp_types(self):
+        camp_offgridtypes = {'KEN': {'Baseline': {'Kakuma': 2, 'Dadaab': 3, 'Kalobeyei': 3}, 'Target 1': {'Kakuma': 4}}}
+        camp_solidtypes = {'KEN': {'Baseline': {'Kakuma': 1, 'Dadaab': 1, 'Kalobeyei': 5}}}
+        fallbacks_offgrid = {'KEN': {'Baseline': 7}, 'UGA': {'Baseline': 2, 'Target 1': 3}, 'TZA': dict()}
+        fallbacks_solid = {'KEN': {'Baseline': 7}, 'UGA': {'Baseline': 1, 'Target 1': 2}, 'TZA': dict()}
+        extra_camptypes = resolve_extra_camp_types(camp_offgridtypes, camp_solidtypes, fallbacks_offgrid,
+                                                   fallbacks_solid)['extra_camptypes']
+        assert extra_camptypes == {'KEN': {'Baseline': (3, 1, False), 'Target 1': (4, None, False)},
+                                   'UGA': {'Baseline': (2, 1, True), 'Target 1': (3, 2, True)}}
+        assert get_extra_camp_type_rows(extra_camptypes) == [['KEN', 'Baseline', 3, 1, 'Country types'],
+                                                             ['KEN', 'Target 1', 4, None, 'Country types'],
+                                                             ['UGA', 'Baseline', 2, 1, 'Fallback'],
+                                                             ['UGA', 'Target 1', 3, 2, 'Fallback']]
+
+    def test_write_compressed_resources(self, configuration, tmpdir):
+        folder = str(tmpdir)
+        pop_types = ['Urban', 'Slum', 'Rural', 'Camp', 'Small Camp']
+        names = get_resource_names(pop_types)
+        headers = [['Name', 'Value'] for _ in names]
+        results = [[['#name', '#value'], [name, i]] for i, name in enumerate(names)]
+        project_configuration = {'max_resource_writers': 2, 'resource_compression': 'gzip'}
+        outputs = write_resources(project_configuration, pop_types, headers, results, dict(), datetime(2017, 6, 20),
+                                  folder)
+        assert [resource['name'] for resource in outputs['resources']] == names
+        assert [resource['format'] for resource in outputs['resources']] == ['csv'] * len(names)
+        compressed_resources = outputs['compressed_resources']
+        assert [resource['name'] for resource in compressed_resources] == ['%s.gz' % name for name in names]
+        assert [resource['format'] for resource in compressed_resources] == ['gz'] * len(names)
+        assert outputs['files_to_upload'] == [join(folder, name) for name in names]
+        assert outputs['files_to_upload'][-1] == join(folder, 'keyfigures.csv')
+        assert sorted(outputs['compression_sizes']) == sorted(names)
+        for resource in compressed_resources:
+            assert resource.get_file_to_upload() == join(folder, resource['name'])
+            with gzip.open(resource.get_file_to_upload()) as f:
+                assert f.read().startswith(b'Name,Value')
+
+    def test_camps_not_in_unhcr(self):
+        unhcr_populations = PopulationTable()
+        unhcr_populations.add('BDI', 'unknown', 'Bujumbura', 21, 'excluded')
+        unhcr_populations.add('BDI', 'planned', 'Musasa', 12, 'camp')
+        camptypes = {'Bujumbura': dict(), 'Dispersed in the country': dict(), 'Musasa': dict()}
+        model = ChathamHouseModel({'Household Size': 5})
+        with Diagnostics(keep_events=True) as diagnostics:
+            run_camp_model(model, list(), list(), camptypes, dict(), unhcr_populations, dict(), dict(), dict(), dict(),
+                           dict(), dict())
+        assert diagnostics.events == [('excluded_camp', 'unknown', ('Bujumbura', 'unknown')),
+                                      ('dispersed_camp', 'Dispersed in the country', ('Dispersed in the country',))]
+
+    def test_noncamp_regional_averages(self):
+        unhcr_populations = PopulationTable()
+        unhcr_populations.add('AGO', 'individual', 'Angola', 10000, 'noncamp')
+        pop_types = ['Urban', 'Slum', 'Rural', 'Camp', 'Small Camp']
+        results = [list() for _ in range(len(pop_types) + 3)]
+        model = ChathamHouseModel({'Household Size': 5, 'Population Adjustment Factor': 0.3, 'Electricity Cost': 25,
+                                   'Cooking LPG NonCamp Price': 1.8, 'Kerosene CO2 Emissions': 2.96,
+                                   'Lighting Grid Tier': 1})
+        access = {pop_type: {'ZMB': 0.4} for pop_type in pop_types[:3]}
+        nonsolid_access = {pop_type: {'ZMB': 0.2} for pop_type in pop_types[:3]}
+        types = {'%s %s Type' % (pop_type, tier): None for pop_type in pop_types[:3] for tier in model.tiers}
+        run_noncamp_model(model, pop_types, results, unhcr_populations, {'AGO': 0.6}, {'AGO': 0.5}, {'ZMB': 90.0},
+                          {'AGO': 0.5}, {'ZMB': 4.5}, access, nonsolid_access, {0: 3, 1: 35}, types, types, dict(),
+                          dict(), dict(), dict(), dict())
+        assert str(results[0][0].info) == 'elap(202)=90,lpg(202)=4.5,elac(202)=0.4,nsac(202)=0.2'
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Unit tests for Chatham House what if queries.
+
+'''
+import pytest
+
+from chathamhouse.chathamhousemodel import ChathamHouseModel
+from chathamhouse.chathamhousepopulations import PopulationTable
+from chathamhouse.chathamhousestages import run_noncamp_model, run_camp_model
+from chathamhouse.chathamhousewhatif import WhatIfModel
+
+
+class TestChathamHouseWhatIf:
+    @pytest.fixture(scope='function')
+    def context(self, lightingoffgridcost, elecgriddirectenergy, cookingsolidcost, slumratios):
+        types = dict()
+        for pop_type in ('Urban', 'Rural', 'Slum'):
+            for tier, lighting_type, cooking_type in (('Baseline', 1, 1), ('Target 1', 1, 1), ('Target 2', 3, 7),
+                                                      ('Target 3', 7, 8)):
+                types.setdefault('lighting', dict())['%s %s Type' % (pop_type, tier)] = lighting_type
+                types.setdefault('cooking', dict())['%s %s Type' % (pop_type, tier)] = cooking_type
+        descriptions = dict()
+        for baseline_target in ('Baseline', 'Target'):
+            for i in range(1, 9):
+                descriptions['%s %d' % (baseline_target, i)] = 'Type %d' % i
+        return {'constants': {'Population Adjustment Factor': 0.7216833622, 'Household Size': 5,
+                              'Electricity Cost': 25, 'Cooking LPG NonCamp Price': 1.8,
+                              'Kerosene CO2 Emissions': 2.96, 'Lighting Offgrid Scaling Factor': 1,
+                              'Cooking Solid Scaling Factor': 1, 'Lighting Grid Tier': 2,
+                              'Cooking LPG Fallback': 4},
+                'urbanratios': {'AGO': 0.58379, 'KEN': 0.26},
+                'slumratios': slumratios,
+                'elecappliances': {'AGO': 92.6033836492},
+                'elecgridco2': {'AGO': 0.0375, 'KEN': 0.2},
+                'cookinglpg': {'AGO': 4.096473669, 'KEN': 2.5},
+                'noncamp_elec_access': {'Urban': {'AGO': 0.7}, 'Rural': {'AGO': 0.055}, 'Slum': {'AGO': 0.4}},
+                'noncamp_nonsolid_access': {'Urban': {'AGO': 0.5}, 'Rural': {'AGO': 0.11}, 'Slum': {'AGO': 0.3}},
+                'elecgridtiers': {0: 3, 1: 35, 2: 194, 3: 820, 4: 1720},
+                'noncamplightingoffgridtypes': types['lighting'], 'noncampcookingsolidtypes': types['cooking'],
+                'camptypes_fallbacks_offgrid': {'KEN': {'Baseline': 2, 'Target 1': 3, 'Target 2': 4, 'Target 3': 5}},
+                'camptypes_fallbacks_solid': {'KEN': {'Baseline': 1, 'Target 1': 2, 'Target 2': 3, 'Target 3': 4}},
+                'lighting_type_descriptions': descriptions, 'lightingoffgridcost': lightingoffgridcost,
+                'elecgriddirectenergy': elecgriddirectenergy, 'cooking_type_descriptions': descriptions,
+                'cookingsolidcost': cookingsolidcost}
+
+    @staticmethod
+    def get_results(context):
+        model = ChathamHouseModel(context['constants'])
+        return model, [list(), list(), list(), list(), list(), list(), list()]
+
+    def test_country(self, context):
+        model, results = self.get_results(context)
+        pop_types = ['Urban', 'Slum', 'Rural', 'Camp']
+        kwargs = {key: context[key] for key in context if key not in ('constants', 'camptypes_fallbacks_offgrid',
+                                                                       'camptypes_fallbacks_solid')}
+        unhcr_populations = PopulationTable()
+        unhcr_populations.add('AGO', 'individual', 'A', 59970, 'noncamp')
+        run_noncamp_model(model, pop_types, results, unhcr_populations, **kwargs)
+        whatif = WhatIfModel(context)
+        rows = whatif.query({'type': 'country', 'country': 'Angola', 'population': 59970})
+        assert len(rows) == 12
+        for row, expected in zip(rows, results[0] + results[1] + results[2]):
+            assert [row['iso3'], row['country'], row['population'], row['tier'], row['grid_expenditure'],
+                    row['grid_co2'], row['lighting_type'], row['lighting_description'], row['lighting_expenditure'],
+                    row['lighting_capital'], row['lighting_co2'], row['nonsolid_expenditure'], row['nonsolid_co2'],
+                    row['cooking_type'], row['cooking_description'], row['cooking_expenditure'],
+                    row['cooking_capital'], row['cooking_co2']] == expected[:-1]
+        rows = whatif.query({'type': 'country', 'country': 'AGO', 'population': 59970, 'tier': 'Target 3'})
+        assert [row['tier'] for row in rows] == ['Target 3', 'Target 3', 'Target 3']
+
+    def test_camp(self, context):
+        model, results = self.get_results(context)
+        camptypes = {'Kakuma': {'Lighting OffGrid %s' % tier: 4 for tier in model.tiers}}
+        for tier in model.tiers:
+            camptypes['Kakuma']['Cooking Solid %s' % tier] = 2
+        unhcr_populations = PopulationTable()
+        unhcr_populations.add('KEN', 'camp', 'Kakuma', 45000, 'camp')
+        run_camp_model(model, ['Camp'], results, camptypes, {'Kakuma': (45000, 'KEN', 'camp')}, unhcr_populations,
+                       context['elecgridco2'],
+                       context['lighting_type_descriptions'], context['lightingoffgridcost'],
+                       context['elecgriddirectenergy'], context['cooking_type_descriptions'],
+                       context['cookingsolidcost'])
+        whatif = WhatIfModel(context)
+        rows = whatif.query({'country': 'Kenya', 'population': 45000, 'lighting_type': 4, 'cooking_type': 2})
+        for row, expected in zip(rows, results[0]):
+            assert [row['iso3'], row['country'], 'Kakuma', row['population'], row['tier'], row['lighting_type'],
+                    row['lighting_description'], row['lighting_expenditure'], row['lighting_capital'],
+                    row['lighting_co2'], row['cooking_type'], row['cooking_description'],
+                    row['cooking_expenditure'], row['cooking_capital'], row['cooking_co2']] == expected[:-1]
+        rows = whatif.query({'country': 'KEN', 'population': 45000, 'tier': 'Target 2'})
+        assert len(rows) == 1
+        assert rows[0]['lighting_type'] == 4
+        assert rows[0]['cooking_type'] == 3
+        assert rows[0]['info'] == 'Fallback'
+
+    def test_batch(self, context):
+        whatif = WhatIfModel(context)
+        results = whatif.batch([{'country': 'KEN', 'population': 45000, 'tier': 'Target 3', 'lighting_type': 4,
+                                 'cooking_type': 2},
+                                {'country': 'KEN', 'population': 'lala'},
+                                {'country': 'Lalaland', 'population': 10},
+                                {'country': 'KEN', 'population': 10, 'tier': 'Target 9'},
+                                {'country': 'KEN', 'population': 10, 'lighting_type': 99, 'cooking_type': 2},
+                                {'type': 'region', 'country': 'KEN', 'population': 10}])
+        assert len(results[0]['rows']) == 1
+        assert [result.get('error') for result in results[1:]] == \
+               ['A population is required!', 'Unknown country Lalaland!', 'Unknown tier Target 9!',
+                'Unknown lighting type 99!', 'Unknown query type region!']